@@ -8,24 +8,224 @@ Change active mg
 
 from __future__ import print_function
 import os
+import re
 import sys
 from sardana.macroserver.macro import Macro, Type
-# import time
-from PyTango import DeviceProxy, DevFailed, Database, Except
+import time
+import threading
+from PyTango import DeviceProxy, DevFailed, Database, Except, DevState
 import json
+import hashlib
 import HasyUtils
+import taurus
 from taurus.console import Alignment
+from taurus.console.list import List
 
-__all__ = ["delete_mg", "change_mg", "check_mg"]
+__all__ = ["delete_mg", "change_mg", "check_mg", "mg_budget", "mg_warmup",
+           "mg_rate"]
 
-# from taurus.console.list import List
 Left, Right, HCenter = Alignment.Left, Alignment.Right, Alignment.HCenter
 
 
+def _runConcurrently(func, items, timeout):
+    """
+    calls func(item) for all items in parallel threads, returns
+      {item: (result, exception, elapsed)}
+    items that do not finish within timeout seconds get an exception,
+    their threads are left behind as daemons
+    """
+    results = {}
+    lock = threading.Lock()
+
+    def worker(item):
+        startTime = time.time()
+        try:
+            res = (func(item), None)
+        except Exception as e:
+            res = (None, e)
+        with lock:
+            results[item] = (res[0], res[1], time.time() - startTime)
+
+    threads = []
+    for item in items:
+        th = threading.Thread(target=worker, args=(item,))
+        th.daemon = True
+        th.start()
+        threads.append(th)
+    deadline = time.time() + timeout
+    for th in threads:
+        th.join(max(0., deadline - time.time()))
+    with lock:
+        argout = dict(results)
+    for item in items:
+        if item not in argout:
+            argout[item] = (
+                None, Exception("no reply within %g s" % timeout), timeout)
+    return argout
+
+
+def warmupMg(mgName, timeout):
+    """
+    opens the devices of the channels of mgName concurrently through
+    the taurus factory, so that they are shared with the MacroServer,
+    and reads each value attribute once, returns
+      [(name, connectTime, readTime, exception), ...]
+    in the order of the channels
+    """
+    channels = getMgChannels(mgName)
+    sources = dict((str(dct[u'name']), dct) for dct in channels)
+
+    def prime(name):
+        dct = sources[name]
+        startTime = time.time()
+        dev = taurus.Device(str(dct[u'full_name']))
+        connectTime = time.time() - startTime
+        attr = str(dct.get(u'source') or 'value').split('/')[-1]
+        #
+        # the device is shared with the MacroServer, its timeout
+        # is restored after the read
+        #
+        oldTimeout = dev.get_timeout_millis()
+        dev.set_timeout_millis(int(timeout * 1000))
+        try:
+            startTime = time.time()
+            dev.read_attribute(attr)
+            return connectTime, time.time() - startTime
+        finally:
+            dev.set_timeout_millis(oldTimeout)
+
+    names = [str(dct[u'name']) for dct in channels]
+    results = _runConcurrently(prime, names, timeout)
+    argout = []
+    for name in names:
+        res, exc, elapsed = results[name]
+        if exc is not None:
+            argout.append((name, None, None, exc))
+        else:
+            argout.append((name, res[0], res[1], None))
+    return argout
+
+
+def mgChannels(hsh):
+    """
+    returns the channels of a MG configuration (D8 or D9), ordered by
+    index, as copies of the channel dictionaries with the additional
+    key '_controller'
+      [{'name': 'exp_t01', 'full_name': ..., 'ndim': 0, ...}, ...]
+    """
+    argout = []
+    for ctrl, ctrlDct in hsh.get(u'controllers', {}).items():
+        if u'units' in ctrlDct:
+            chanDcts = [unit.get(u'channels', {})
+                        for unit in ctrlDct[u'units'].values()]
+        else:
+            chanDcts = [ctrlDct.get(u'channels', {})]
+        for chanDct in chanDcts:
+            for fullName, dct in chanDct.items():
+                dct = dict(dct)
+                dct.setdefault(u'full_name', fullName)
+                dct.setdefault(u'name', fullName)
+                dct[u'_controller'] = ctrl
+                argout.append(dct)
+    argout.sort(key=lambda dct: dct.get(u'index', 0))
+    return argout
+
+
+def getMgChannels(mgName):
+    """
+    returns the channels of a MG, see mgChannels()
+    """
+    return mgChannels(json.loads(DeviceProxy(mgName).Configuration))
+
+
+def fetchShape(fullName, kind, timeout):
+    """
+    reads the shape of a MCA ('mca') or a 2D detector ('2d') from the
+    device, timeout in seconds, returns None if a 2D detector has
+    neither Shape nor Width and Height
+    """
+    proxy = DeviceProxy(str(fullName))
+    proxy.set_timeout_millis(int(timeout * 1000))
+    if kind == 'mca':
+        return [int(proxy.DataLength)]
+    #
+    # the max_dim_x/y of the Value attribute is the declared
+    # maximum, not the frame size
+    #
+    try:
+        return [int(dim) for dim in proxy.Shape]
+    except Exception:
+        try:
+            return [int(proxy.Width), int(proxy.Height)]
+        except Exception:
+            return None
+
+
+#
+# the states check_mg reports, None: no state
+#
+BAD_STATES = [DevState.FAULT, DevState.ALARM, DevState.UNKNOWN, None]
+
+
+#
+# bytes per value of the data types of MG channels
+#
+DATA_TYPE_SIZES = {
+    'float64': 8, 'float32': 4, 'int64': 8, 'int32': 4, 'int16': 2,
+    'int8': 1, 'uint64': 8, 'uint32': 4, 'uint16': 2, 'uint8': 1,
+    'bool': 1}
+
+
+#
+# the channel model of the MG configuration:
+#   ndim, attribute for the source, label for the messages,
+#   plot_axes for D8 and D9, whether the display/output flags apply,
+#   the keys that only D8 configurations have
+#
+_D8_SCALAR = {u'data_type': u'float64', u'data_units': u'No unit',
+              u'instrument': None, u'nexus_path': u'', u'shape': []}
+CHANNEL_KINDS = {
+    'timer': {'ndim': 0, 'attr': "/value", 'label': "Timer",
+              'plot_axes_D8': [], 'plot_axes_D9': [], 'flags': False,
+              'D8': _D8_SCALAR},
+    'extra': {'ndim': 0, 'attr': "/value", 'label': "ExtraTimer",
+              'plot_axes_D8': [], 'plot_axes_D9': [], 'flags': False,
+              'D8': _D8_SCALAR},
+    'counter': {'ndim': 0, 'attr': "/value", 'label': "Counter",
+                'plot_axes_D8': [u'<mov>'], 'plot_axes_D9': [u'<mov>'],
+                'flags': True,
+                'D8': dict(_D8_SCALAR, instrument=u'')},
+    'mca': {'ndim': 1, 'attr': "/Value", 'label': "MCA",
+            'plot_axes_D8': [], 'plot_axes_D9': [u'<mov>'], 'flags': False,
+            'D8': _D8_SCALAR},
+    '2d': {'ndim': 2, 'attr': "/Value", 'label': "Pilatus",
+           'plot_axes_D8': [], 'plot_axes_D9': [u'<mov>'], 'flags': False,
+           'D8': {u'instrument': u'', u'nexus_path': u''}},
+    'sca': {'ndim': 0, 'attr': "/value", 'label': "Sca",
+            'plot_axes_D8': [u'<mov>'], 'plot_axes_D9': [u'<mov>'],
+            'flags': True,
+            'D8': {u'instrument': None}},
+}
+
+
 class MgConf:
+    #
+    # per-device timeout for the metadata prefetch, in seconds
+    #
+    prefetchTimeout = 3.
+
     def __init__(self, poolName, mntgrpName, flagClear):
         self.db = Database()
         #
+        # the schema of the configuration is decided once per session
+        #
+        self.newMg = HasyUtils.versionSardanaNewMg()
+        #
+        # kind -> channel template, controller -> (dict, channels)
+        #
+        self.templates = {}
+        self.ctrlChannels = {}
+        #
         # the pool for the Mg
         #
         try:
@@ -43,9 +243,26 @@ class MgConf:
             lst = [mntgrpName, 'exp_t01', 'exp_c01', 'exp_c02']
             self.poolMg.command_inout('CreateMeasurementGroup', lst)
             self.mg = DeviceProxy(mntgrpName)
+        #
+        # the channel and controller lists are read once per session
+        #
+        self._readPoolLists()
+        #
+        # MCA alias -> (tango device, DataLength), SCA -> controller
+        #
+        self.mcaInfo = {}
+        self.scaControllers = {}
+        #
+        # MCA and 2D detector alias -> {full_name, shape}
+        #
+        self.metadata = {}
 
+        #
+        # the configuration of the pool, used to skip no-op writes
+        #
+        self.hshCurrent = json.loads(self.mg.Configuration)
         if not flagClear:
-            self.hsh = json.loads(self.mg.Configuration)
+            self.hsh = json.loads(json.dumps(self.hshCurrent))
             self.masterTimer = self.findMasterTimer()
             self.index = len(self.mg.ElementList)
         else:
@@ -56,10 +273,10 @@ class MgConf:
             self.index = 0
 
     def findMasterTimer(self):
-        if not HasyUtils.versionSardanaNewMg():
-            self.findMasterTimerD8()
+        if not self.newMg:
+            return self.findMasterTimerD8()
         else:
-            self.findMasterTimerD9()
+            return self.findMasterTimerD9()
 
     def findMasterTimerD8(self):
         for ctrl in self.hsh[u'controllers']:
@@ -93,16 +310,38 @@ class MgConf:
             masterTimer = self.db.get_alias(str(temp))
         return masterTimer
 
-    def findDeviceController(self, device):
+    def _readPoolLists(self):
         """
-        returns the controller that belongs to a device
+        reads ExpChannelList, AcqChannelList and ControllerList
+        from the pool, called once per session and after elements
+        have been created. The name indices are built on first use,
+        a cached configuration does not need them
         """
+        self.expChannelList = self.poolMg.ExpChannelList or []
+        self.acqChannelList = self.poolMg.AcqChannelList or []
+        self.controllerList = self.poolMg.ControllerList or []
+        self.__dict__.pop('channelIndex', None)
+        self.__dict__.pop('controllerIndex', None)
 
-        lst = []
-        if self.poolMg.ExpChannelList is not None:
-            lst = self.poolMg.ExpChannelList
-        ctrl = None
-        for elm in lst:
+    def __getattr__(self, name):
+        """
+        builds channelIndex and controllerIndex on first use
+        """
+        if name not in ['channelIndex', 'controllerIndex'] or \
+                'expChannelList' not in self.__dict__:
+            raise AttributeError(name)
+        self._buildIndex()
+        return self.__dict__[name]
+
+    def _buildIndex(self):
+        """
+        builds the name indices from the pool lists
+        """
+        #
+        # name -> {controller, full_name, type, axis}
+        #
+        channelIndex = {}
+        for elm in self.expChannelList:
             chan = json.loads(elm)
             # chan:
             # {
@@ -122,9 +361,53 @@ class MgConf:
             # u'type': u'CTExpChannel',
             # u'unit': u'0',
             # }
-            if device == chan['name']:
-                ctrl = chan['controller']
-                break
+            #
+            # the first entry wins, like the former linear search
+            #
+            if chan['name'] in channelIndex:
+                continue
+            channelIndex[chan['name']] = {
+                'controller': chan.get('controller'),
+                'full_name': None,
+                'type': chan.get('type'),
+                'axis': chan.get('axis')}
+        for elm in self.acqChannelList:
+            chan = json.loads(elm)
+            #
+            # from: expchan/hasysis3820ctrl/1/value
+            # to:   expchan/hasysis3820ctrl/1
+            # the last entry wins, like the former linear search
+            #
+            arr = chan['full_name'].split("/")
+            dct = channelIndex.setdefault(
+                chan['name'],
+                {'controller': None, 'full_name': None,
+                 'type': chan.get('type'), 'axis': chan.get('axis')})
+            dct['full_name'] = "/".join(arr[0:-1])
+        #
+        # controller alias -> full_name
+        #
+        controllerIndex = {}
+        for elm in self.controllerList:
+            ctrl = json.loads(elm)
+            controllerIndex.setdefault(ctrl['name'], ctrl['full_name'])
+        self.channelIndex = channelIndex
+        self.controllerIndex = controllerIndex
+
+    def refreshPoolLists(self):
+        """
+        re-reads the pool lists, to be called after elements
+        or controllers have been created
+        """
+        self._readPoolLists()
+
+    def findDeviceController(self, device):
+        """
+        returns the controller that belongs to a device
+        """
+        ctrl = None
+        if device in self.channelIndex:
+            ctrl = self.channelIndex[device]['controller']
         if ctrl is None and device.find("adc") >= 0:
             ctrl = os.getenv("TANGO_HOST") + "/" + \
                 "controller/hasylabadcctrl/hasyadcctrl"
@@ -138,18 +421,9 @@ class MgConf:
           input: exp_c01
           returns: expchan/hasylabvirtualcounterctrl/1
         """
-
-        lst = self.poolMg.AcqChannelList
         argout = None
-        for elm in lst:
-            chan = json.loads(elm)
-            if device == chan['name']:
-                #
-                # from: expchan/hasysis3820ctrl/1/value
-                # to:   expchan/hasysis3820ctrl/1
-                #
-                arr = chan['full_name'].split("/")
-                argout = "/".join(arr[0:-1])
+        if device in self.channelIndex:
+            argout = self.channelIndex[device]['full_name']
         if argout is None:
             print("Error with device")
             print(device)
@@ -157,484 +431,305 @@ class MgConf:
                             "failed to find  %s" % device)
         return argout
 
-    def updateConfiguration(self):
+    #
+    # keys with device names or sources, compared case-insensitive
+    #
+    nameKeys = [u'full_name', u'name', u'source', u'timer', u'monitor']
+
+    def _normalize(self, value, key=None):
         """
-        json-dump the dictionary self.hsh to the Mg configuration
+        makes configuration values comparable: 'tango://' prefixes are
+        removed, None equals ''. Names (key None, the keys of
+        dictionaries and the values of nameKeys) are compared
+        case-insensitive, other strings, e.g. labels, are not
         """
-        self.mg.Configuration = json.dumps(self.hsh)
+        if value is None:
+            return u''
+        if isinstance(value, (list, tuple)):
+            return [self._normalize(v, key) for v in value]
+        if isinstance(value, dict):
+            return dict((self._normalize(k), self._normalize(v, k))
+                        for k, v in value.items())
+        if isinstance(value, (str, type(u''))):
+            if key is None or key in self.nameKeys:
+                value = value.lower()
+            if value[:len('tango://')].lower() == 'tango://':
+                value = value[len('tango://'):]
+            return value
+        return value
+
+    def _channelsOf(self, hsh):
+        """
+        returns {full_name: (controller, channel_dict)}
+        for D8 (controllers/units/0/channels) and
+        D9 (controllers/channels) configurations
+        """
+        argout = {}
+        for dct in mgChannels(hsh):
+            ctrl = dct.pop(u'_controller')
+            argout[self._normalize(dct[u'full_name'])] = (
+                self._normalize(ctrl), dct)
+        return argout
 
-    def addTimer(self, device):
-        if not HasyUtils.versionSardanaNewMg():
-            self.addTimerD8(device)
-        else:
-            self.addTimerD9(device)
+    def getChannels(self):
+        """
+        returns the channels of the current MG configuration,
+        see mgChannels()
+        """
+        return mgChannels(self.hshCurrent)
 
-    def addTimerD8(self, device):
+    def _isSubset(self, target, current):
         """
-        add a timer to the Mg
-        device: exp_t01
+        True, if every key of target has the same value in current,
+        keys which are set by the pool only are ignored
         """
-        ctrl = self.findDeviceController(device)
-        if ctrl not in self.hsh[u'controllers'].keys():
-            self.masterTimer = device
-            self.hsh[u'monitor'] = self.findFullDeviceName(device)
-            self.hsh[u'timer'] = self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl] = {}
-            self.hsh[u'controllers'][ctrl][u'units'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'channels'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'id'] = 0
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'monitor'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'timer'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'trigger_type'] = 0
-
-        ctrlChannels = self.hsh[u'controllers'][ctrl][u'units'][u'0'][
-            u'channels']
-        fullDeviceName = self.findFullDeviceName(device)
-        if fullDeviceName not in ctrlChannels.keys():
-            print("adding index", self.index, device)
-            dct = {}
-            dct[u'_controller_name'] = str(ctrl)
-            dct[u'_unit_id'] = u'0'
-            dct[u'conditioning'] = u''
-            dct[u'data_type'] = u'float64'
-            dct[u'data_units'] = u'No unit'
-            dct[u'enabled'] = True
-            dct[u'full_name'] = fullDeviceName
-            dct[u'index'] = self.index
-            self.index += 1
-            dct[u'instrument'] = None
-            dct[u'label'] = str(device)
-            dct[u'name'] = str(device)
-            dct[u'ndim'] = 0
-            dct[u'nexus_path'] = u''
-            dct[u'normalization'] = 0
-            dct[u'output'] = True
-            dct[u'plot_axes'] = []
-            dct[u'plot_type'] = 0
-            dct[u'shape'] = []
-            dct[u'source'] = dct['full_name'] + "/value"
-            ctrlChannels[fullDeviceName] = dct
+        for key, value in target.items():
+            if key in [u'controllers', u'units', u'channels']:
+                continue
+            if self._normalize(value, key) != \
+                    self._normalize(current.get(key), key):
+                return False
+        return True
 
-    def addTimerD9(self, device):
+    def diffConfiguration(self, current, target):
         """
-        add a timer to the Mg
-        device: exp_t01
+        compares two configurations, returns
+          {'added': [...], 'removed': [...], 'changed': [...],
+           'settings': [...]}
+        channels are identified by their names, 'settings' lists the
+        global and controller keys (timer, monitor, ...) that differ
+        """
+        diff = {'added': [], 'removed': [], 'changed': [], 'settings': []}
+        if not self._isSubset(dict((k, v) for k, v in target.items()
+                                   if k != u'controllers'), current):
+            diff['settings'].append('mg')
+        curCtrls = dict((self._normalize(k), v) for k, v in
+                        current.get(u'controllers', {}).items())
+        for ctrl, ctrlDct in target.get(u'controllers', {}).items():
+            curDct = curCtrls.get(self._normalize(ctrl), {})
+            if not self._isSubset(ctrlDct, curDct):
+                diff['settings'].append(str(ctrl))
+            elif u'units' in ctrlDct:
+                for unit, unitDct in ctrlDct[u'units'].items():
+                    if not self._isSubset(
+                            unitDct, curDct.get(u'units', {}).get(unit, {})):
+                        diff['settings'].append(str(ctrl))
+        curChannels = self._channelsOf(current)
+        tgtChannels = self._channelsOf(target)
+        for fullName, (ctrl, dct) in tgtChannels.items():
+            name = str(dct.get(u'name', fullName))
+            if fullName not in curChannels:
+                diff['added'].append(name)
+            elif ctrl != curChannels[fullName][0] or \
+                    not self._isSubset(dct, curChannels[fullName][1]):
+                diff['changed'].append(name)
+        for fullName, (ctrl, dct) in curChannels.items():
+            if fullName not in tgtChannels:
+                diff['removed'].append(str(dct.get(u'name', fullName)))
+        return diff
+
+    def _fetchMetadata(self, item):
         """
-        ctrl = self.findDeviceController(device)
-        if ctrl not in self.hsh[u'controllers'].keys():
-            self.masterTimer = device
-            self.hsh[u'monitor'] = self.findFullDeviceName(device)
-            self.hsh[u'timer'] = self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl] = {}
-            self.hsh[u'controllers'][ctrl][u'synchronizer'] = "software"
-            self.hsh[u'controllers'][ctrl][u'channels'] = {}
-            self.hsh[u'controllers'][ctrl][u'id'] = 0
-            self.hsh[u'controllers'][ctrl][u'monitor'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'timer'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'trigger_type'] = 0
-
-        ctrlChannels = self.hsh[u'controllers'][ctrl][u'channels']
+        item: (device, 'mca' or '2d'), returns {full_name, shape}
+        """
+        device, kind = item
         fullDeviceName = self.findFullDeviceName(device)
-        if fullDeviceName not in ctrlChannels.keys():
-            print("adding index", self.index, device)
-            dct = {}
-            dct[u'conditioning'] = u''
-            dct[u'enabled'] = True
-            dct[u'full_name'] = fullDeviceName
-            dct[u'index'] = self.index
-            self.index += 1
-            dct[u'label'] = str(device)
-            dct[u'name'] = str(device)
-            dct[u'ndim'] = 0
-            dct[u'normalization'] = 0
-            dct[u'output'] = True
-            dct[u'plot_axes'] = []
-            dct[u'plot_type'] = 0
-            dct[u'source'] = dct['full_name'] + "/value"
-            ctrlChannels[fullDeviceName] = dct
+        return {'full_name': fullDeviceName,
+                'shape': fetchShape(fullDeviceName, kind,
+                                    self.prefetchTimeout)}
 
-    def addExtraTimer(self, device):
-        if not HasyUtils.versionSardanaNewMg():
-            self.addExtraTimerD8(device)
-        else:
-            self.addExtraTimerD9(device)
+    def prefetchMetadata(self, mcas, detectors):
+        """
+        resolves MCAs and 2D detectors concurrently before the
+        configuration is built: the proxies are opened and the MCA
+        DataLength and the 2D shapes are read, each device has
+        prefetchTimeout seconds. Raises an exception listing all
+        devices that failed.
+        """
+        items = [(device, 'mca') for device in mcas
+                 if device not in self.metadata]
+        items.extend([(device, '2d') for device in detectors
+                      if device not in self.metadata])
+        if len(items) == 0:
+            return
+        results = _runConcurrently(self._fetchMetadata, items,
+                                   self.prefetchTimeout)
+        errors = []
+        for item in items:
+            dct, exc, elapsed = results[item]
+            if exc is not None:
+                errors.append("%s: %s" % (item[0], exc))
+            else:
+                self.metadata[item[0]] = dct
+        if errors:
+            raise Exception("MgUtils.prefetchMetadata", "; ".join(errors))
 
-    #
-    # add an extra timer to the measurement group
-    #
-    def addExtraTimerD8(self, device):
-        """ device: exp_t01"""
-        ctrl = self.findDeviceController(device)
-        if ctrl not in self.hsh[u'controllers'].keys():
-            self.hsh[u'controllers'][ctrl] = {}
-            self.hsh[u'controllers'][ctrl][u'units'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'channels'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'id'] = 0
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'monitor'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'timer'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'trigger_type'] = 0
-
-        ctrlChannels = self.hsh[u'controllers'][ctrl][u'units'][u'0'][
-            u'channels']
-        fullDeviceName = self.findFullDeviceName(device)
-        if fullDeviceName not in ctrlChannels.keys():
-            dct = {}
-            dct[u'_controller_name'] = str(ctrl)
-            dct[u'_unit_id'] = u'0'
-            dct[u'conditioning'] = u''
-            dct[u'data_type'] = u'float64'
-            dct[u'data_units'] = u'No unit'
-            dct[u'enabled'] = True
-            dct[u'full_name'] = fullDeviceName
-            dct[u'index'] = self.index
-            self.index += 1
-            dct[u'instrument'] = None
-            dct[u'label'] = str(device)
-            dct[u'name'] = str(device)
-            dct[u'ndim'] = 0
-            dct[u'nexus_path'] = u''
-            dct[u'normalization'] = 0
-            dct[u'output'] = True
-            dct[u'plot_axes'] = []
-            dct[u'plot_type'] = 0
-            dct[u'shape'] = []
-            dct[u'source'] = dct['full_name'] + "/value"
-            ctrlChannels[fullDeviceName] = dct
+    def getMetadata(self, device, kind):
+        """
+        returns the prefetched metadata, fetches it, if necessary
+        """
+        if device not in self.metadata:
+            if kind == 'mca':
+                self.prefetchMetadata([device], [])
+            else:
+                self.prefetchMetadata([], [device])
+        return self.metadata[device]
 
-    #
-    # add an extra timer to the measurement group
-    #
-    def addExtraTimerD9(self, device):
-        """ device: exp_t01"""
-        ctrl = self.findDeviceController(device)
-        if ctrl not in self.hsh[u'controllers'].keys():
-            self.hsh[u'controllers'][ctrl] = {}
-            self.hsh[u'controllers'][ctrl][u'synchronizer'] = "software"
-            self.hsh[u'controllers'][ctrl][u'channels'] = {}
-            self.hsh[u'controllers'][ctrl][u'id'] = 0
-            self.hsh[u'controllers'][ctrl][u'monitor'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'timer'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'trigger_type'] = 0
-
-        ctrlChannels = self.hsh[u'controllers'][ctrl][u'channels']
-        fullDeviceName = self.findFullDeviceName(device)
-        if fullDeviceName not in ctrlChannels.keys():
+    def updateConfiguration(self, force=False):
+        """
+        json-dump the dictionary self.hsh to the Mg configuration,
+        the write is skipped, if the configuration of the pool
+        is already the requested one and force is False.
+        returns the differences, see diffConfiguration()
+        """
+        diff = self.diffConfiguration(self.hshCurrent, self.hsh)
+        if not force and not [v for v in diff.values() if v]:
+            return diff
+        self.mg.Configuration = json.dumps(self.hsh)
+        self.hshCurrent = json.loads(json.dumps(self.hsh))
+        return diff
+
+    def _template(self, kind):
+        """
+        returns the keys of a channel of the given kind that do not
+        depend on the device, built once per kind and session
+        """
+        if kind not in self.templates:
+            model = CHANNEL_KINDS[kind]
             dct = {}
             dct[u'conditioning'] = u''
             dct[u'enabled'] = True
-            dct[u'full_name'] = fullDeviceName
-            dct[u'index'] = self.index
-            self.index += 1
-            dct[u'label'] = str(device)
-            dct[u'name'] = str(device)
-            dct[u'ndim'] = 0
+            dct[u'ndim'] = model['ndim']
             dct[u'normalization'] = 0
             dct[u'output'] = True
-            dct[u'plot_axes'] = []
             dct[u'plot_type'] = 0
-            dct[u'source'] = dct['full_name'] + "/value"
-            ctrlChannels[fullDeviceName] = dct
+            if self.newMg:
+                dct[u'plot_axes'] = model['plot_axes_D9']
+            else:
+                dct[u'plot_axes'] = model['plot_axes_D8']
+                dct[u'_unit_id'] = u'0'
+                dct.update(model['D8'])
+            self.templates[kind] = dct
+        return self.templates[kind]
 
-    def addCounter(self, device, flagDisplay, flagOutput):
-        if not HasyUtils.versionSardanaNewMg():
-            self.addCounterD8(device, flagDisplay, flagOutput)
-        else:
-            self.addCounterD9(device, flagDisplay, flagOutput)
+    def _getCtrlChannels(self, ctrl, device, kind):
+        """
+        returns the channels dictionary of a controller, the controller
+        is added to the configuration, if it is not there
+        """
+        controllers = self.hsh[u'controllers']
+        if ctrl in self.ctrlChannels and \
+                self.ctrlChannels[ctrl][0] is controllers.get(ctrl):
+            return self.ctrlChannels[ctrl][1]
 
-    #
-    # add a counter to the measurement group
-    #
-    def addCounterD8(self, device, flagDisplay, flagOutput):
-
-        if device.find('sca_') == 0:
-            return self.addSCA(device, flagDisplay, flagOutput)
-
-        ctrl = self.findDeviceController(device)
-        if ctrl not in self.hsh[u'controllers'].keys():
-            print("MgUtils.addCounter adding controller ", ctrl)
-            self.hsh[u'controllers'][ctrl] = {}
-            self.hsh[u'controllers'][ctrl][u'units'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'channels'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'id'] = 0
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'monitor'] = \
-                self.findFullDeviceName(self.masterTimer)
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'timer'] = \
-                self.findFullDeviceName(self.masterTimer)
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'trigger_type'] = 0
-
-        ctrlChannels = self.hsh[u'controllers'][ctrl][u'units'][u'0'][
-            u'channels']
-        fullDeviceName = self.findFullDeviceName(device)
-        if fullDeviceName not in ctrlChannels.keys():
-            print("adding index", self.index, device)
-            dct = {}
-            dct[u'_controller_name'] = str(ctrl)
-            dct[u'_unit_id'] = u'0'
-            dct[u'conditioning'] = u''
-            dct[u'data_type'] = u'float64'
-            dct[u'data_units'] = u'No unit'
-            dct[u'enabled'] = True
-            dct[u'full_name'] = fullDeviceName
-            dct[u'index'] = self.index
-            self.index += 1
-            dct[u'instrument'] = u''
-            dct[u'label'] = str(device)
-            dct[u'name'] = str(device)
-            dct[u'ndim'] = 0
-            dct[u'nexus_path'] = u''
-            dct[u'normalization'] = 0
-            if flagOutput:
-                dct[u'output'] = True
-            else:
-                dct[u'output'] = False
-            dct[u'plot_axes'] = [u'<mov>']
-            if flagDisplay:
-                dct[u'plot_type'] = 1
+        if ctrl not in controllers:
+            #
+            # timers are their own timer/monitor, in D8 the other
+            # channels refer to the master timer
+            #
+            if kind in ['timer', 'extra'] or self.newMg:
+                fullRefName = self.findFullDeviceName(device)
             else:
-                dct[u'plot_type'] = 0
-            dct[u'shape'] = []
-            dct[u'source'] = dct['full_name'] + "/value"
-            ctrlChannels[fullDeviceName] = dct
-
-    #
-    # add a counter to the measurement group
-    #
-    def addCounterD9(self, device, flagDisplay, flagOutput):
-
-        if device.find('sca_') == 0:
-            return self.addSCA(device, flagDisplay, flagOutput)
-
-        ctrl = self.findDeviceController(device)
-        if ctrl not in self.hsh[u'controllers'].keys():
-            print("MgUtils.addCounter adding controller ", ctrl)
-            self.hsh[u'controllers'][ctrl] = {}
-            self.hsh[u'controllers'][ctrl][u'synchronizer'] = "software"
-            self.hsh[u'controllers'][ctrl][u'channels'] = {}
-            self.hsh[u'controllers'][ctrl][u'id'] = 0
-            self.hsh[u'controllers'][ctrl][u'monitor'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'timer'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'trigger_type'] = 0
-
-        ctrlChannels = self.hsh[u'controllers'][ctrl][u'channels']
-        fullDeviceName = self.findFullDeviceName(device)
-        if fullDeviceName not in ctrlChannels.keys():
-            print("adding index", self.index, device)
+                fullRefName = self.findFullDeviceName(self.masterTimer)
+            if kind == 'timer':
+                self.masterTimer = device
+                self.hsh[u'monitor'] = fullRefName
+                self.hsh[u'timer'] = fullRefName
+            elif kind != 'extra':
+                print("MgUtils.add%s adding controller " %
+                      CHANNEL_KINDS[kind]['label'], ctrl)
             dct = {}
-            dct[u'conditioning'] = u''
-            dct[u'enabled'] = True
-            dct[u'full_name'] = fullDeviceName
-            dct[u'index'] = self.index
-            self.index += 1
-            dct[u'label'] = str(device)
-            dct[u'name'] = str(device)
-            dct[u'ndim'] = 0
-            dct[u'normalization'] = 0
-            if flagOutput:
-                dct[u'output'] = True
-            else:
-                dct[u'output'] = False
-            dct[u'plot_axes'] = [u'<mov>']
-            if flagDisplay:
-                dct[u'plot_type'] = 1
+            dct[u'channels'] = {}
+            dct[u'id'] = 0
+            dct[u'monitor'] = fullRefName
+            dct[u'timer'] = fullRefName
+            dct[u'trigger_type'] = 0
+            if self.newMg:
+                dct[u'synchronizer'] = "software"
+                controllers[ctrl] = dct
             else:
-                dct[u'plot_type'] = 0
-            dct[u'source'] = dct['full_name'] + "/value"
-            ctrlChannels[fullDeviceName] = dct
+                controllers[ctrl] = {u'units': {u'0': dct}}
 
-    def addMCA(self, device):
-        if not HasyUtils.versionSardanaNewMg():
-            self.addMCAD8(device)
+        if self.newMg:
+            channels = controllers[ctrl][u'channels']
         else:
-            self.addMCAD9(device)
+            channels = controllers[ctrl][u'units'][u'0'][u'channels']
+        self.ctrlChannels[ctrl] = (controllers[ctrl], channels)
+        return channels
 
-    #
-    # add a MCA to the measurement group
-    #
-    def addMCAD8(self, device):
-        ctrl = self.findDeviceController(device)
-        if ctrl not in self.hsh[u'controllers'].keys():
-            print("MgUtils.addMCA adding controller ", ctrl)
-            self.hsh[u'controllers'][ctrl] = {}
-            self.hsh[u'controllers'][ctrl][u'units'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'channels'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'id'] = 0
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'monitor'] = \
-                self.findFullDeviceName(self.masterTimer)
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'timer'] = \
-                self.findFullDeviceName(self.masterTimer)
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'trigger_type'] = 0
-
-        ctrlChannels = self.hsh[u'controllers'][ctrl][u'units'][u'0'][
-            u'channels']
-        fullDeviceName = self.findFullDeviceName(device)
-        if fullDeviceName not in ctrlChannels.keys():
-            print("adding index", self.index, device)
-            proxy = DeviceProxy(str(fullDeviceName))
-            dct = {}
-            dct[u'_controller_name'] = str(ctrl)
-            dct[u'_unit_id'] = u'0'
-            dct[u'conditioning'] = u''
-            dct[u'data_type'] = u'float64'
-            dct[u'data_units'] = u'No unit'
-            dct[u'enabled'] = True
+    def addChannels(self, specs):
+        """
+        adds channels to the Mg in a single pass
+          specs: [(device, kind, flagDisplay, flagOutput), ...]
+          kind: 'timer', 'extra', 'counter', 'mca', '2d' or 'sca',
+                counters beginning with 'sca_' are SCAs
+        The SCAs are created and, for D8, the MCA DataLength is fetched
+        for all specs first, then the channels are added in the given
+        order. D9 uses no device metadata, its MCAs and 2D detectors
+        are not contacted.
+        """
+        specs = [(device,
+                  'sca' if kind == 'counter' and device.find('sca_') == 0
+                  else kind, flagDisplay, flagOutput)
+                 for device, kind, flagDisplay, flagOutput in specs]
+        self.prepareScas([spec[0] for spec in specs if spec[1] == 'sca'])
+        if not self.newMg:
+            self.prefetchMetadata(
+                [spec[0] for spec in specs if spec[1] == 'mca'], [])
+
+        for device, kind, flagDisplay, flagOutput in specs:
+            model = CHANNEL_KINDS[kind]
+            if kind == 'sca':
+                ctrl = self.scaControllers[device]
+            else:
+                ctrl = self.findDeviceController(device)
+            ctrlChannels = self._getCtrlChannels(ctrl, device, kind)
+            fullDeviceName = self.findFullDeviceName(device)
+            if fullDeviceName in ctrlChannels:
+                continue
+            if kind != 'extra':
+                print("adding index", self.index, device)
+            dct = dict(self._template(kind))
+            dct[u'plot_axes'] = list(dct[u'plot_axes'])
+            if not self.newMg:
+                dct[u'_controller_name'] = str(ctrl)
+                if kind == 'mca':
+                    dct[u'shape'] = list(self.metadata[device]['shape'])
+                elif u'shape' in dct:
+                    dct[u'shape'] = list(dct[u'shape'])
             dct[u'full_name'] = fullDeviceName
             dct[u'index'] = self.index
             self.index += 1
-            dct[u'instrument'] = None
             dct[u'label'] = str(device)
             dct[u'name'] = str(device)
-            dct[u'ndim'] = 1
-            dct[u'nexus_path'] = u''
-            dct[u'normalization'] = 0
-            dct[u'output'] = True
-            dct[u'plot_axes'] = []
-            dct[u'plot_type'] = 0
-            dct[u'shape'] = [proxy.DataLength]
-            dct[u'source'] = fullDeviceName + "/Value"
+            if model['flags']:
+                dct[u'output'] = bool(flagOutput)
+                dct[u'plot_type'] = 1 if flagDisplay else 0
+            dct[u'source'] = fullDeviceName + model['attr']
             ctrlChannels[fullDeviceName] = dct
 
-    #
-    # add a MCA to the measurement group
-    #
-    def addMCAD9(self, device):
-        ctrl = self.findDeviceController(device)
-        if ctrl not in self.hsh[u'controllers'].keys():
-            print("MgUtils.addMCA adding controller ", ctrl)
-            self.hsh[u'controllers'][ctrl] = {}
-            self.hsh[u'controllers'][ctrl][u'synchronizer'] = "software"
-            self.hsh[u'controllers'][ctrl][u'channels'] = {}
-            self.hsh[u'controllers'][ctrl][u'id'] = 0
-            self.hsh[u'controllers'][ctrl][u'monitor'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'timer'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'trigger_type'] = 0
-
-        ctrlChannels = self.hsh[u'controllers'][ctrl][u'channels']
-        fullDeviceName = self.findFullDeviceName(device)
-        if fullDeviceName not in ctrlChannels.keys():
-            print("adding index", self.index, device)
-            # proxy =
-            DeviceProxy(str(fullDeviceName))
-            dct = {}
-            dct[u'conditioning'] = u''
-            dct[u'enabled'] = True
-            dct[u'full_name'] = fullDeviceName
-            dct[u'index'] = self.index
-            self.index += 1
-            dct[u'label'] = str(device)
-            dct[u'name'] = str(device)
-            dct[u'ndim'] = 1
-            dct[u'normalization'] = 0
-            dct[u'output'] = True
-            dct[u'plot_axes'] = [u'<mov>']
-            dct[u'plot_type'] = 0
-            dct[u'source'] = fullDeviceName + "/Value"
-            ctrlChannels[fullDeviceName] = dct
+    def addTimer(self, device):
+        """
+        add a timer to the Mg
+        device: exp_t01
+        """
+        self.addChannels([(device, 'timer', 0, 1)])
 
-    def addPilatus(self, device):
-        if not HasyUtils.versionSardanaNewMg():
-            self.addPilatusD8(device)
-        else:
-            self.addPilatusD9(device)
+    def addExtraTimer(self, device):
+        """ device: exp_t01"""
+        self.addChannels([(device, 'extra', 0, 1)])
 
-    #
-    # add a MCA to the measurement group
-    #
-    def addPilatusD8(self, device):
-        ctrl = self.findDeviceController(device)
-        if ctrl not in self.hsh[u'controllers'].keys():
-            print("MgUtils.addPilatus adding controller ", ctrl)
-            self.hsh[u'controllers'][ctrl] = {}
-            self.hsh[u'controllers'][ctrl][u'units'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'channels'] = {}
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'id'] = 0
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'monitor'] = \
-                self.findFullDeviceName(self.masterTimer)
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'timer'] = \
-                self.findFullDeviceName(self.masterTimer)
-            self.hsh[u'controllers'][ctrl][u'units'][u'0'][u'trigger_type'] = 0
-
-        ctrlChannels = self.hsh[u'controllers'][ctrl][u'units'][u'0'][
-            u'channels']
-        fullDeviceName = self.findFullDeviceName(device)
-        if fullDeviceName not in ctrlChannels.keys():
-            print("adding index", self.index, device)
-            # proxy =
-            DeviceProxy(str(fullDeviceName))
-            dct = {}
-            dct[u'_controller_name'] = str(ctrl)
-            dct[u'_unit_id'] = u'0'
-            dct[u'conditioning'] = u''
-            dct[u'enabled'] = True
-            dct[u'full_name'] = fullDeviceName
-            dct[u'index'] = self.index
-            self.index += 1
-            dct[u'instrument'] = u''
-            dct[u'label'] = str(device)
-            dct[u'name'] = str(device)
-            dct[u'ndim'] = 2
-            dct[u'nexus_path'] = u''
-            dct[u'normalization'] = 0
-            dct[u'output'] = True
-            dct[u'plot_axes'] = []
-            dct[u'plot_type'] = 0
-            dct[u'source'] = fullDeviceName + "/Value"
-            ctrlChannels[fullDeviceName] = dct
+    def addCounter(self, device, flagDisplay, flagOutput):
+        """ device: exp_c01 or sca_exp_mca01_100_200 """
+        self.addChannels([(device, 'counter', flagDisplay, flagOutput)])
 
-    #
-    # add a Pilatus to the measurement group
-    #
-    def addPilatusD9(self, device):
-        ctrl = self.findDeviceController(device)
-        if ctrl not in self.hsh[u'controllers'].keys():
-            print("MgUtils.addPilatus adding controller ", ctrl)
-            self.hsh[u'controllers'][ctrl] = {}
-            self.hsh[u'controllers'][ctrl][u'synchronizer'] = "software"
-            self.hsh[u'controllers'][ctrl][u'channels'] = {}
-            self.hsh[u'controllers'][ctrl][u'id'] = 0
-            self.hsh[u'controllers'][ctrl][u'monitor'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'timer'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'trigger_type'] = 0
-
-        ctrlChannels = self.hsh[u'controllers'][ctrl][u'channels']
-        fullDeviceName = self.findFullDeviceName(device)
-        if fullDeviceName not in ctrlChannels.keys():
-            print("adding index", self.index, device)
-            # proxy =
-            DeviceProxy(str(fullDeviceName))
-            dct = {}
-            dct[u'conditioning'] = u''
-            dct[u'enabled'] = True
-            dct[u'full_name'] = fullDeviceName
-            dct[u'index'] = self.index
-            self.index += 1
-            dct[u'label'] = str(device)
-            dct[u'name'] = str(device)
-            dct[u'ndim'] = 2
-            dct[u'normalization'] = 0
-            dct[u'output'] = True
-            dct[u'plot_axes'] = [u'<mov>']
-            dct[u'plot_type'] = 0
-            dct[u'source'] = fullDeviceName + "/Value"
-            ctrlChannels[fullDeviceName] = dct
+    def addMCA(self, device):
+        """ device: exp_mca01 """
+        self.addChannels([(device, 'mca', 0, 1)])
+
+    def addPilatus(self, device):
+        """ device: a 2D detector, e.g. pilatus """
+        self.addChannels([(device, '2d', 0, 1)])
 
     def parseSCA(self, name):
         """
@@ -654,90 +749,141 @@ class MgConf:
             Except.re_throw_exception( e, "MgUtils", "failed to create proxy to %s " % mcaSardanaDeviceAlias, "MgUtils._gHeMcaName")
         return proxy.TangoDevice
 
-    def _addSca(self, device):
+    def _getMcaInfo(self, mca):
         """
-        Input: device: sca_exp_mca01_100_200
-        Returns full controller name, e.g.:
-        haso107klx:10000/controller/hasscactrl/sca_exp_mca01_100_200
-        Creates a HasySca controller and creates a device for this controller,
-        There is only one device per controller
+        returns (tangoDevice, dataLength) of a MCA, read once per session
         """
-        mca, roiMin, roiMax = self.parseSCA(device)
-        #
-        # find the tango device name which is used my the sardana device
-        #
-        tgMca = self._getMcaName(mca)
-        #
-        # sca_exp_mca01_100_200_ctrl
-        #
-        ctrlAlias = device + "_ctrl"
-        #
-        # see whether the controller exists already
-        #
+        if mca not in self.mcaInfo:
+            tgMca = self._getMcaName(mca)
+            proxy = DeviceProxy(tgMca)
+            self.mcaInfo[mca] = (tgMca, int(proxy.DataLength))
+        return self.mcaInfo[mca]
+
+    def prepareScas(self, devices):
+        """
+        Input: devices: [sca_exp_mca01_100_200, sca_exp_mca01_200_300, ...]
+        Bulk version of _addSca: the SCA names are parsed and the ROIs
+        are validated against the DataLength of their MCA, which is read
+        once per MCA, before anything is created. Then the missing
+        HasySca controllers and elements are created and the pool
+        lists are read once.
+        Names not beginning with 'sca_' are ignored.
+        """
+        scas = self.checkScas(
+            [device for device in devices
+             if device not in self.scaControllers])
+        if len(scas) == 0:
+            return
 
-        lst = self.poolMg.ControllerList
-        ctrlFullName = None
-        for elm in lst:
-            chan = json.loads(elm)
-            if ctrlAlias == chan['name']:
-                ctrlFullName = chan['full_name']
-                break
         #
-        # if the controller does not exist, create it
+        # the controllers first, the elements refer to their aliases
         #
-        proxy = DeviceProxy(tgMca)
-        dataLength = proxy.DataLength
-        if int(roiMax) >= dataLength:
-            raise Exception(
-                "MgUtils._addSca %s " % device,
-                "roiMax %d  >= datalength %d "
-                % (int(roiMax), int(dataLength)))
-        if int(roiMin) >= dataLength:
-            raise Exception(
-                "MgUtils._addSca %s " % device,
-                "roiMin %d  >= datalength %d "
-                % (int(roiMin), dataLength))
-
-        if ctrlFullName is None:
+        flagCreated = False
+        for device, mca, roiMin, roiMax in scas:
+            ctrlAlias = device + "_ctrl"
+            if ctrlAlias in self.controllerIndex:
+                continue
+            tgMca = self.mcaInfo[mca][0]
             lst = ['CTExpChannel', 'HasyScaCtrl.py', 'HasyScaCtrl',
                    ctrlAlias, "mca", tgMca, "roi1", roiMin, "roi2", roiMax]
-            print("MgUtils._addSca", lst)
+            print("MgUtils.prepareScas", lst)
             try:
                 self.poolMg.CreateController(lst)
             except DevFailed as e:
                 Except.print_exception(e)
-                # print "failed to get proxy to ", poolName
                 sys.exit(255)
+            flagCreated = True
 
-            lst = self.poolMg.ControllerList
-            for elm in lst:
-                chan = json.loads(elm)
-                if ctrlAlias == chan['name']:
-                    ctrlFullName = chan['full_name']
-                    break
-        if ctrlFullName is None:
-            raise Exception('MgUtils._addSca',
-                            "failed to make controller for %s" % device)
-
-        #
-        # see whether the SCA device exists
-        #
-        lst = self.poolMg.ExpChannelList
-        flag = False
-        for elm in lst:
-            chan = json.loads(elm)
-            if device == chan['name']:
-                flag = True
-                break
-
-        if not flag:
+        for device, mca, roiMin, roiMax in scas:
+            if device in self.channelIndex:
+                continue
             #
             # "CTExpChannel","HasyScaCtrl","1","sca_exp_mca01_100_200"
             #
-            lst = ["CTExpChannel", ctrlAlias, "1", device]
+            lst = ["CTExpChannel", device + "_ctrl", "1", device]
             self.poolMg.CreateElement(lst)
+            flagCreated = True
+
+        if flagCreated:
+            self.refreshPoolLists()
 
-        return ctrlFullName
+        for device, mca, roiMin, roiMax in scas:
+            ctrlFullName = self.controllerIndex.get(device + "_ctrl")
+            if ctrlFullName is None:
+                raise Exception('MgUtils.prepareScas',
+                                "failed to make controller for %s" % device)
+            self.scaControllers[device] = ctrlFullName
+
+    def checkScas(self, devices):
+        """
+        Input: devices: [sca_exp_mca01_100_200, ...]
+        validates the ROIs against the DataLength of their MCA, which
+        is read once per MCA, returns [(device, mca, roiMin, roiMax)].
+        Names not beginning with 'sca_' are ignored.
+        """
+        scas = []
+        for device in devices:
+            if device.find('sca_') != 0:
+                continue
+            mca, roiMin, roiMax = self.parseSCA(device)
+            scas.append((device, mca, roiMin, roiMax))
+
+        errors = []
+        for device, mca, roiMin, roiMax in scas:
+            tgMca, dataLength = self._getMcaInfo(mca)
+            if int(roiMax) >= dataLength:
+                errors.append("%s: roiMax %d  >= datalength %d " %
+                              (device, int(roiMax), dataLength))
+            if int(roiMin) >= dataLength:
+                errors.append("%s: roiMin %d  >= datalength %d " %
+                              (device, int(roiMin), dataLength))
+        if errors:
+            raise Exception("MgUtils.prepareScas", "; ".join(errors))
+        return scas
+
+    def _addSca(self, device):
+        """
+        Input: device: sca_exp_mca01_100_200
+        Returns full controller name, e.g.:
+        haso107klx:10000/controller/hasscactrl/sca_exp_mca01_100_200
+        Creates a HasySca controller and creates a device for this controller,
+        There is only one device per controller
+        """
+        self.prepareScas([device])
+        return self.scaControllers[device]
+
+    def makeScaControllersForPseudoCounters(self, devices):
+        """
+        Input: devices: [sca_exp_mca01_100_200, ...]
+        Returns the full controller names, e.g.:
+        [haso107klx:10000/controller/mca2scactrl/sca_exp_mca01_100_200_ctrl]
+        The missing controllers are created, then the pool lists are read
+        once and the ROIs are set.
+        """
+        created = []
+        for device in devices:
+            mca, roiMin, roiMax = self.parseSCA(device)
+            ctrlAlias = device + "_ctrl"
+            if ctrlAlias in self.controllerIndex:
+                continue
+            lst = ['PseudoCounter', 'MCA2SCACtrl.py',
+                   'MCA2SCACtrl', ctrlAlias,
+                   'mca=' + self.findFullDeviceName(mca), 'sca=' + device]
+            self.poolMg.CreateController(lst)
+            created.append((device, roiMin, roiMax))
+        if created:
+            self.refreshPoolLists()
+        for device, roiMin, roiMax in created:
+            if device + "_ctrl" not in self.controllerIndex:
+                raise Exception('MgUtils.makeController',
+                                "failed to make controller for %s" % device)
+            #
+            # set the ROIs
+            #
+            proxy = DeviceProxy(device)
+            proxy.Roi1 = int(roiMin)
+            proxy.Roi2 = int(roiMax)
+        return [self.controllerIndex[device + "_ctrl"] for device in devices]
 
     def makeScaControllerForPseudoCounter(self, device):
         """
@@ -745,48 +891,9 @@ class MgConf:
         Returns full controller name, e.g.:
         haso107klx:10000/controller/mca2scactrl/sca_exp_mca01_100_200_ctrl
         """
-        mca, roiMin, roiMax = self.parseSCA(device)
-
-        ctrlAlias = device + "_ctrl"
-        #
-        # see whether the controller exists already
-        #
-        lst = self.poolMg.ControllerList
-        for elm in lst:
-            chan = json.loads(elm)
-            if ctrlAlias == chan['name']:
-                return chan['full_name']
-        lst = ['PseudoCounter', 'MCA2SCACtrl.py',
-               'MCA2SCACtrl', device + "_ctrl",
-               'mca=' + self.findFullDeviceName(mca), 'sca=' + device]
-
-        # print "MgUutils.makeSardanaController", lst
-        self.poolMg.CreateController(lst)
-        #
-        # now it has been created.
-        # go through the list again an return the full controller name
-        #
-        lst = self.poolMg.ControllerList
-        for elm in lst:
-            chan = json.loads(elm)
-            if ctrlAlias == chan['name']:
-                #
-                # set the ROIs
-                #
-                proxy = DeviceProxy(device)
-                proxy.Roi1 = int(roiMin)
-                proxy.Roi2 = int(roiMax)
-                return chan['full_name']
-        raise Exception('MgUtils.makeController',
-                        "failed to make controller for %s" % device)
+        return self.makeScaControllersForPseudoCounters([device])[0]
 
     def addSCA(self, device, flagDisplay, flagOutput):
-        if not HasyUtils.versionSardanaNewMg():
-            self.addSCAD8(device, flagDisplay, flagOutput)
-        else:
-            self.addSCAD9(device, flagDisplay, flagOutput)
-
-    def addSCAD8(self, device, flagDisplay, flagOutput):
         """
         add a SCA to the measurement group
           input: device, e.g. sca_exp_mca01_100_200
@@ -794,107 +901,145 @@ class MgConf:
         if device.find('sca_') != 0:
             print("MgUtils.addSCA: '%s' does not begin with 'sca_'," % device)
             return False
-
-        #
-        # there is one element per controller
-        #
-        fullCtrlName = self._addSca(device)
-        if fullCtrlName not in self.hsh[u'controllers'].keys():
-            print("MgUtils.addSca adding controller ", fullCtrlName)
-            self.hsh[u'controllers'][fullCtrlName] = {}
-            self.hsh[u'controllers'][fullCtrlName][u'units'] = {}
-            self.hsh[u'controllers'][fullCtrlName][u'units'][u'0'] = {}
-            self.hsh[u'controllers'][fullCtrlName][u'units'][u'0'][
-                u'channels'] = {}
-            self.hsh[u'controllers'][fullCtrlName][u'units'][u'0'][u'id'] = 0
-            self.hsh[u'controllers'][fullCtrlName][u'units'][u'0'][
-                u'monitor'] = self.findFullDeviceName(self.masterTimer)
-            self.hsh[u'controllers'][fullCtrlName][u'units'][u'0'][
-                u'timer'] = self.findFullDeviceName(self.masterTimer)
-            self.hsh[u'controllers'][fullCtrlName][u'units'][u'0'][
-                u'trigger_type'] = 0
-
-        ctrlChannels = self.hsh[u'controllers'][fullCtrlName][u'units'][
-            u'0'][u'channels']
-        if not self.findFullDeviceName(device) in ctrlChannels.keys():
-            print("adding index", self.index, device)
-            dct = {}
-            dct[u'_controller_name'] = str(fullCtrlName)
-            dct[u'_unit_id'] = u'0'
-            dct[u'conditioning'] = u''
-            dct[u'enabled'] = True
-            dct[u'full_name'] = self.findFullDeviceName(device)
-            dct[u'index'] = self.index
-            self.index += 1
-            dct[u'instrument'] = None
-            dct[u'label'] = str(device)
-            dct[u'name'] = str(device)
-            dct[u'ndim'] = 0
-            dct[u'normalization'] = 0
-            if flagOutput:
-                dct[u'output'] = True
-            else:
-                dct[u'output'] = False
-            dct[u'plot_axes'] = [u'<mov>']
-            if flagDisplay:
-                dct[u'plot_type'] = 1
-            else:
-                dct[u'plot_type'] = 0
-            dct[u'source'] = dct['full_name'] + "/value"
-            ctrlChannels[self.findFullDeviceName(device)] = dct
+        self.addChannels([(device, 'sca', flagDisplay, flagOutput)])
         return True
 
-    def addSCAD9(self, device, flagDisplay, flagOutput):
+
+class MgConfCache:
+    """
+    On-disk cache of MG configurations generated by change_mg.
+
+    The key combines a fingerprint of the pool element lists, the
+    normalized change_mg options and the D8/D9 schema. The entries of
+    a pool are removed as soon as its fingerprint changes, at most
+    maxEntries configurations are kept per fingerprint.
+    """
+    maxEntries = 32
+
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+
+    def fingerprint(self, mgConf):
         """
-        add a SCA to the measurement group
-          input: device, e.g. sca_exp_mca01_100_200
+        hash over the raw ExpChannelList, AcqChannelList and
+        ControllerList, the lists are not decoded
         """
-        if device.find('sca_') != 0:
-            print("MgUtils.addSCA: '%s' does not begin with 'sca_'," % device)
-            return False
+        hsh = hashlib.sha1()
+        for lst in [mgConf.expChannelList, mgConf.acqChannelList,
+                    mgConf.controllerList]:
+            hsh.update(u"\n".join(lst).encode('utf-8'))
+        return hsh.hexdigest()
 
-        #
-        # there is one element per controller
-        #
-        fullCtrlName = self._addSca(device)
-        if fullCtrlName not in self.hsh[u'controllers'].keys():
-            print("MgUtils.addSca adding controller ", fullCtrlName)
-            self.hsh[u'controllers'][fullCtrlName] = {}
-            ctrl = fullCtrlName
-            self.hsh[u'controllers'][ctrl][u'synchronizer'] = "software"
-            self.hsh[u'controllers'][ctrl][u'channels'] = {}
-            self.hsh[u'controllers'][ctrl][u'id'] = 0
-            self.hsh[u'controllers'][ctrl][u'monitor'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'timer'] = \
-                self.findFullDeviceName(device)
-            self.hsh[u'controllers'][ctrl][u'trigger_type'] = 0
-
-        ctrlChannels = self.hsh[u'controllers'][fullCtrlName][u'channels']
-        if not self.findFullDeviceName(device) in ctrlChannels.keys():
-            print("adding index", self.index, device)
-            dct = {}
-            dct[u'conditioning'] = u''
-            dct[u'enabled'] = True
-            dct[u'full_name'] = self.findFullDeviceName(device)
-            dct[u'index'] = self.index
-            self.index += 1
-            dct[u'label'] = str(device)
-            dct[u'name'] = str(device)
-            dct[u'ndim'] = 0
-            dct[u'normalization'] = 0
-            if flagOutput:
-                dct[u'output'] = True
-            else:
-                dct[u'output'] = False
-            dct[u'plot_axes'] = [u'<mov>']
-            if flagDisplay:
-                dct[u'plot_type'] = 1
+    def key(self, mgConf, poolName, mgName, optDict, newMg):
+        """
+        returns the cache file name
+          <pool>-<fingerprint>-<hash of options and schema>.json
+        '-a' is not part of the key, only cleared MGs are cached,
+        '-g' and '-w' do not change the configuration
+        """
+        opts = {}
+        for key, value in optDict.items():
+            if key in ['-a', '-g', '-w']:
+                continue
+            opts[key] = value.split(',')
+        hsh = hashlib.sha1(json.dumps(
+            [mgName, opts, 'D9' if newMg else 'D8'],
+            sort_keys=True).encode('utf-8'))
+        prefix = str(poolName).replace('/', '_').replace(':', '_')
+        return "%s-%s-%s.json" % (prefix, self.fingerprint(mgConf)[:16],
+                                  hsh.hexdigest()[:24])
+
+    def get(self, key):
+        """
+        returns the cached configuration (json string) or None
+        """
+        fileName = os.path.join(self.cacheDir, key)
+        if not os.path.isfile(fileName):
+            return None
+        try:
+            with open(fileName) as fd:
+                return fd.read()
+        except IOError:
+            return None
+
+    def put(self, key, hsh):
+        """
+        stores the configuration and removes the entries of the same
+        pool that belong to another fingerprint and the oldest entries
+        beyond maxEntries
+        """
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir)
+        prefix, fp, _ = key.rsplit('-', 2)
+        current = []
+        for fileName in os.listdir(self.cacheDir):
+            if not fileName.startswith(prefix + '-') or \
+                    fileName.count('-') != key.count('-') or \
+                    fileName == key:
+                continue
+            fullName = os.path.join(self.cacheDir, fileName)
+            if fileName.startswith(prefix + '-' + fp + '-'):
+                current.append((os.path.getmtime(fullName), fullName))
             else:
-                dct[u'plot_type'] = 0
-            dct[u'source'] = dct['full_name'] + "/value"
-            ctrlChannels[self.findFullDeviceName(device)] = dct
-        return True
+                os.remove(fullName)
+        current.sort()
+        nRemove = len(current) + 1 - self.maxEntries
+        for mtime, fullName in current[:max(0, nRemove)]:
+            os.remove(fullName)
+        tmpName = os.path.join(self.cacheDir, key + ".tmp")
+        with open(tmpName, "w") as fd:
+            fd.write(json.dumps(hsh))
+        os.rename(tmpName, os.path.join(self.cacheDir, key))
+
+
+class MgPoolIndex:
+    """
+    MG name -> pool, shared by the MG macros of this MacroServer.
+    The index is built from the MeasurementGroupList of the pools
+    and rebuilt, if a name is not found or after invalidate(),
+    which is called when a MG is created or deleted. A name that is
+    found is checked against the MeasurementGroupList of its pool,
+    the MG may have been deleted or moved by another client.
+    """
+    def __init__(self):
+        self.index = None
+
+    def _mgNames(self, pool):
+        return [json.loads(mg)["name"] for mg in pool.MeasurementGroupList]
+
+    def build(self, macro):
+        index = {}
+        for pool in macro.getPools():
+            for name in self._mgNames(pool):
+                index[name] = pool
+        self.index = index
+
+    def invalidate(self):
+        self.index = None
+
+    def getPool(self, macro, mgName):
+        """
+        returns the pool of a MG or None
+        """
+        if self.index is not None and mgName in self.index:
+            pool = self.index[mgName]
+            if mgName in self._mgNames(pool):
+                return pool
+        self.build(macro)
+        return self.index.get(mgName)
+
+
+mgPoolIndex = MgPoolIndex()
+
+
+def getPoolName(pool):
+    """
+    returns the name of a pool, with new sardana versions (28.5.2018)
+    name is a string, before it was a method
+    """
+    if isinstance(pool.name, str):
+        return pool.name
+    return pool.name()
 
 
 class create_delete_mgOBSOLETE(Macro):
@@ -909,14 +1054,10 @@ class create_delete_mgOBSOLETE(Macro):
 
         mg_name = self.getEnv('ActiveMntGrp')
 
-        pools = self.getPools()
-        for tmp_pool in pools:
-            for mg in tmp_pool.MeasurementGroupList:
-                hsh = json.loads(mg)
-                if mg_name == hsh["name"]:
-                    pool = tmp_pool
+        pool = mgPoolIndex.getPool(self, mg_name)
 
         pool.DeleteElement(mg_name)
+        mgPoolIndex.invalidate()
 
         args = []
         args.append(mg_name)
@@ -927,6 +1068,7 @@ class create_delete_mgOBSOLETE(Macro):
             args.append(el)
 
         pool.CreateMeasurementGroup(args)
+        mgPoolIndex.invalidate()
 
         self.output("Done")
 
@@ -941,16 +1083,11 @@ class delete_mg(Macro):
 
     def run(self, mgName):
 
-        pools = self.getPools()
-        pool = None
-        for tmp_pool in pools:
-            for mg in tmp_pool.MeasurementGroupList:
-                hsh = json.loads(mg)
-                if mgName == hsh["name"]:
-                    pool = tmp_pool
+        pool = mgPoolIndex.getPool(self, mgName)
 
         if pool:
             pool.DeleteElement(mgName)
+            mgPoolIndex.invalidate()
             self.output("delete_mg: %s deleted" % mgName)
             mg_active = self.getEnv('ActiveMntGrp')
             if mg_active == mgName:
@@ -971,7 +1108,7 @@ class change_mg(Macro):
               -c <counter> -m <mca> -nd <not displayed counters>
               -no <not spock output for counters>
               -ndo <not displayed and not spock output counters>
-              -q <pilatus>
+              -q <pilatus> -w <warmupflag>
 
     All parameters are optional. However, a timer has to be specified, if a new
     MG is created or if an existing MG is cleared and re-filled ('-a False' or
@@ -982,6 +1119,8 @@ class change_mg(Macro):
                   -c exp_ct01,exp_ct02  (no blank space)
 
     The ActiveMntGrp is set to the created/changed MG.
+    With '-w True' the channels are connected and read once
+    afterwards, see mg_warmup.
 
     Example:
       change_mg -g mg_ivp -t exp_t01 -c exp_c01 -m d1_mca01 -q pilatus
@@ -1001,7 +1140,7 @@ class change_mg(Macro):
             -c <counter> -m <mca>  -nd <not displayed counters>\
             -no <not spock output for counters> -ndo"
                         " <not displayed and not spock output counters>\
-            -q <pilatus>\
+            -q <pilatus> -w <warmupflag>\
             \
             All parameters are options. However, a timer has to be specified, "
                         "if a new MGoptions\
@@ -1051,14 +1190,12 @@ class change_mg(Macro):
                     "specified" % mg_name)
             lst = opt_dict['-t'].split(',')
             pools[0].CreateMeasurementGroup([mg_name, lst[0]])
+            mgPoolIndex.invalidate()
 
-        pools = self.getPools()
-
-        for tmp_pool in pools:
-            for mg in tmp_pool.MeasurementGroupList:
-                hsh = json.loads(mg)
-                if mg_name == hsh["name"]:
-                    pool = tmp_pool
+        pool = mgPoolIndex.getPool(self, mg_name)
+        if pool is None:
+            raise Exception(
+                "change_mg: %s does not belong to any pool" % mg_name)
 
         flagClear = True
         key = '-a'
@@ -1071,54 +1208,100 @@ class change_mg(Macro):
             if key not in opt_dict:
                 raise Exception("change_mg: need a timer or '-a True'")
 
-        if type(pool.name) == str:   # +++ 28.5.2018: new sardana
-            mgConf = MgConf(pool.name, mg_name, flagClear)
-        else:
-            mgConf = MgConf(pool.name(), mg_name, flagClear)
-
-        if key in opt_dict:
-            for elem in opt_dict[key].split(','):
-                mgConf.addTimer(elem)
+        poolName = getPoolName(pool)
+        mgConf = MgConf(poolName, mg_name, flagClear)
 
-        key = '-e'
-        if key in opt_dict:
-            for elem in opt_dict[key].split(','):
-                mgConf.addExtraTimer(elem)
-
-        key = '-m'
-        if key in opt_dict:
-            for elem in opt_dict[key].split(','):
-                mgConf.addMCA(elem)
+        #
+        # a cleared MG is taken from the cache, if the pool
+        # elements did not change since it has been generated
+        #
+        if flagClear:
+            newMg = mgConf.newMg
+            cache = MgConfCache(self._getCacheDir())
+            cacheKey = cache.key(mgConf, poolName, mg_name, opt_dict, newMg)
+            text = cache.get(cacheKey)
+            if text is not None:
+                self.debug("change_mg: configuration from %s" % cacheKey)
+                #
+                # the MCA DataLength may have changed since
+                #
+                mgConf.checkScas(
+                    [spec[0] for spec in self._getSpecs(opt_dict)])
+                mgConf.hsh = json.loads(text)
+            else:
+                self._fillMgConf(mgConf, opt_dict)
+                #
+                # D8 MCA shapes are read from the hardware
+                #
+                if newMg or '-m' not in opt_dict:
+                    try:
+                        cache.put(cacheKey, mgConf.hsh)
+                    except (IOError, OSError) as e:
+                        self.debug("change_mg: cache not written, %s" % e)
+        else:
+            self._fillMgConf(mgConf, opt_dict)
 
-        key = '-c'
-        if key in opt_dict:
-            for elem in opt_dict[key].split(','):
-                mgConf.addCounter(elem, 1, 1)
+        diff = mgConf.updateConfiguration()
+        if not [v for v in diff.values() if v]:
+            self.output("change_mg: %s is unchanged" % mg_name)
+        else:
+            for key in ['added', 'removed', 'changed']:
+                if diff[key]:
+                    self.output("change_mg: %s %s" %
+                                (key, ", ".join(sorted(diff[key]))))
+            if diff['settings']:
+                self.output("change_mg: timer/monitor settings changed")
+        self.setEnv('ActiveMntGrp', mg_name)
+        self.output("change_mg: ActiveMntGrp = %s" % mg_name)
 
-        key = '-nd'
-        if key in opt_dict:
-            for elem in opt_dict[key].split(','):
-                mgConf.addCounter(elem, 0, 1)
+        if opt_dict.get('-w') in ["True", "true"]:
+            startTime = time.time()
+            results = warmupMg(mg_name, 3.)
+            errors = [res for res in results if res[3] is not None]
+            self.output("change_mg: warm-up of %d channels %.1f ms" %
+                        (len(results), (time.time() - startTime) * 1000.))
+            for name, connectTime, readTime, exc in errors:
+                self.output("change_mg: warm-up %s: %s" % (name, exc))
 
-        key = '-no'
-        if key in opt_dict:
-            for elem in opt_dict[key].split(','):
-                mgConf.addCounter(elem, 1, 0)
+    def _getCacheDir(self):
+        """
+        the cache directory is given by the environment variable
+        MgConfCacheDir, default: ~/.sardana/mgconf_cache
+        """
+        try:
+            return self.getEnv('MgConfCacheDir')
+        except Exception:
+            return os.path.join(os.path.expanduser("~"), ".sardana",
+                                "mgconf_cache")
 
-        key = '-ndo'
-        if key in opt_dict:
-            for elem in opt_dict[key].split(','):
-                mgConf.addCounter(elem, 0, 0)
+    def _fillMgConf(self, mgConf, opt_dict):
+        """
+        adds the elements given by the options to the MG configuration
+        """
+        #
+        # the SCAs are created and the D8 MCA DataLength is fetched
+        # for all elements before the configuration is built
+        #
+        mgConf.addChannels(self._getSpecs(opt_dict))
 
-        key = '-q'
-        if key in opt_dict:
+    def _getSpecs(self, opt_dict):
+        """
+        returns [(device, kind, flagDisplay, flagOutput), ...]
+        of the elements given by the options
+        """
+        specs = []
+        for key, kind, flagDisplay, flagOutput in [
+                ('-t', 'timer', 0, 1), ('-e', 'extra', 0, 1),
+                ('-m', 'mca', 0, 1), ('-c', 'counter', 1, 1),
+                ('-nd', 'counter', 0, 1), ('-no', 'counter', 1, 0),
+                ('-ndo', 'counter', 0, 0), ('-q', '2d', 0, 1)]:
+            if key not in opt_dict:
+                continue
             for elem in opt_dict[key].split(','):
-                mgConf.addPilatus(elem)
-                mgConf.addCounter(elem, 0, 1)
-
-        mgConf.updateConfiguration()
-        self.setEnv('ActiveMntGrp', mg_name)
-        self.output("change_mg: ActiveMntGrp = %s" % mg_name)
+                specs.append((elem, kind, flagDisplay, flagOutput))
+                if kind == '2d':
+                    specs.append((elem, 'counter', 0, 1))
+        return specs
 
 
 class setmg(Macro):
@@ -1168,50 +1351,344 @@ class setmg(Macro):
             self.output("Active measurement group: %s" % (actmg))
 
 
-# class check_mg(Macro):
-#    """
-#    check_mg - check status MG channels
-#
-#    """
-#
-#    def run(self):
-#        active_mg = self.getEnv('ActiveMntGrp')
-#        self.mntGrp = self.getObj(active_mg, type_class=Type.MeasurementGroup)
-#
-#        self.output("")
-#        self.output(
-#             "Active measurement group (" + active_mg + ") in "
-#                   + str(self.mntGrp.getState()) +
-#                    " state")
-#        self.output("")
-#        cols = "Channel", "State"
-#        width = -1,     -1
-#        align = HCenter,  Right
-#        out = List(cols, text_alignment=align,
-#                   max_col_width=width)
-#        for channel in self.mntGrp.getChannels():
-#            ch =  self.getObj(channel['name'])
-#            out.appendRow([channel['name'], ch.getState()])
-#
-#        for line in out.genOutput():
-#            self.output(line)
-#
-
 class check_mg(Macro):
     """
-    Displays '<activeMntGrp> is OK', if everything is OK,  or
-    the status strings of the ActiveMntGrp and their elements.
+    Queries the state and the status of the ActiveMntGrp and its
+    channels in parallel, each element has 'timeout' seconds.
+    Displays a table with the state and the round-trip time of each
+    channel, then '<activeMntGrp> is OK', if everything is OK, or
+    the status strings of the elements in FAULT, ALARM or UNKNOWN
+    state and of those that do not reply. The configuration of the
+    MG is read with the same timeout.
     """
-    param_def = []
+    param_def = [
+        ['timeout', Type.Float, 3., 'timeout per element [s]']]
 
-    def run(self):
-        lst = HasyUtils.getActiveMntGrpStatus()
+    def run(self, timeout):
         mg_name = self.getEnv('ActiveMntGrp')
-        if lst is None or len(lst) == 0:
+        channels, exc, elapsed = _runConcurrently(
+            getMgChannels, [mg_name], timeout)[mg_name]
+        if exc is not None:
+            self.output("check_mg: %s: %s" % (mg_name, exc))
+            return
+        names = [mg_name] + [str(dct[u'name']) for dct in channels]
+        fullNames = dict((str(dct[u'name']), str(dct[u'full_name']))
+                         for dct in channels)
+        fullNames[mg_name] = mg_name
+
+        def probe(name):
+            proxy = DeviceProxy(fullNames[name])
+            proxy.set_timeout_millis(int(timeout * 1000))
+            startTime = time.time()
+            state = proxy.state()
+            status = proxy.status()
+            return state, status, time.time() - startTime
+
+        results = _runConcurrently(probe, names, timeout)
+
+        out = List(["Element", "State", "Latency/ms"],
+                   text_alignment=(Right, Right, Right),
+                   max_col_width=(-1, -1, -1))
+        errors = []
+        for name in names:
+            res, exc, elapsed = results[name]
+            if exc is not None:
+                out.appendRow([name, "no reply", "%.1f" % (elapsed * 1000.)])
+                errors.append("%s: %s" % (name, exc))
+                continue
+            state, status, latency = res
+            out.appendRow([name, str(state), "%.1f" % (latency * 1000.)])
+            if state in BAD_STATES:
+                errors.append("%s: %s" % (name, status.strip()))
+        for line in out.genOutput():
+            self.output(line)
+
+        if len(errors) == 0:
             self.output("check_mg: %s is OK" % mg_name)
             return
 
         self.output("check_mg: %s" % mg_name)
-        for elm in lst:
+        for elm in errors:
             self.output("check_mg: %s" % elm)
         return
+
+
+class mg_budget(Macro):
+    """
+    mg_budget <scan command>
+
+    Estimates the data volume of a scan with the ActiveMntGrp:
+    the bytes per point are calculated from ndim, shape and data type
+    of the channels. MCA DataLength and 2D detector sizes are read
+    from the devices, if the configuration has no shape.
+    The total volume and the write rate that is needed to keep up
+    with the integration time are displayed. A warning is issued, if
+    the rate exceeds the bandwidth given by the environment variable
+    ScanDirBandwidth (MB/s) or if ScanDir has not enough free space.
+
+    Supported: ascan, dscan, aNscan, dNscan, mesh, dmesh, ct
+
+    Example:
+      mg_budget ascan exp_dmy01 0 1 1000 0.01
+    """
+    param_def = [
+        ['scan_command',
+         [['word', Type.String, None, 'scan macro and its parameters']],
+         None, 'scan command']]
+
+    def run(self, scan_command):
+        words = [str(word) for word in scan_command]
+        try:
+            nPoints, integTime = self._scanPoints(words)
+        except (IndexError, ValueError):
+            self.output("mg_budget: cannot find the number of points and "
+                        "the integration time in '%s'" % " ".join(words))
+            return
+        if nPoints is None:
+            self.output("mg_budget: unsupported scan '%s'" % words[0])
+            return
+
+        mg_name = self.getEnv('ActiveMntGrp')
+        channels = getMgChannels(mg_name)
+        #
+        # the shapes that are not in the configuration are read
+        # from the devices
+        #
+        kinds = {}
+        fullNames = {}
+        for dct in channels:
+            name = str(dct[u'name'])
+            fullNames[name] = str(dct[u'full_name'])
+            if dct.get(u'ndim', 0) in [1, 2] and not dct.get(u'shape'):
+                kinds[name] = 'mca' if dct[u'ndim'] == 1 else '2d'
+        results = _runConcurrently(
+            lambda name: fetchShape(fullNames[name], kinds[name],
+                                    MgConf.prefetchTimeout),
+            list(kinds), MgConf.prefetchTimeout)
+        shapes = {}
+        for name in kinds:
+            shape, exc, elapsed = results[name]
+            if exc is not None:
+                self.warning("mg_budget: %s: %s" % (name, exc))
+            elif shape is not None:
+                shapes[name] = shape
+
+        out = List(["Channel", "ndim", "shape", "bytes/point"],
+                   text_alignment=(Right, Right, Right, Right),
+                   max_col_width=(-1, -1, -1, -1))
+        bytesPerPoint = 0
+        for dct in channels:
+            name = str(dct[u'name'])
+            shape = dct.get(u'shape') or []
+            if dct.get(u'ndim', 0) > 0 and not shape:
+                if name not in shapes:
+                    self.warning("mg_budget: no shape for %s" % name)
+                    continue
+                shape = shapes[name]
+            size = DATA_TYPE_SIZES.get(str(dct.get(u'data_type')), 8)
+            for dim in shape:
+                size *= int(dim)
+            bytesPerPoint += size
+            out.appendRow([name, str(dct.get(u'ndim', 0)),
+                           "x".join([str(dim) for dim in shape]) or "-",
+                           str(size)])
+        for line in out.genOutput():
+            self.output(line)
+
+        volume = float(bytesPerPoint) * nPoints
+        rate = bytesPerPoint / integTime / 1.e6 if integTime > 0 else 0.
+        self.output("")
+        self.output("mg_budget: %s, %d points, %g s integration time" %
+                    (mg_name, nPoints, integTime))
+        self.output("mg_budget: %d bytes/point, total %.3f MB" %
+                    (bytesPerPoint, volume / 1.e6))
+        self.output("mg_budget: sustained write rate %.3f MB/s" % rate)
+
+        try:
+            bandwidth = float(self.getEnv('ScanDirBandwidth'))
+        except Exception:
+            bandwidth = None
+        if bandwidth is not None and rate > bandwidth:
+            self.warning("mg_budget: the write rate %.3f MB/s exceeds "
+                         "ScanDirBandwidth %g MB/s" % (rate, bandwidth))
+        try:
+            scanDir = self.getEnv('ScanDir')
+            st = os.statvfs(scanDir)
+            free = float(st.f_bavail) * st.f_frsize
+        except Exception:
+            free = None
+        if free is not None and volume > free:
+            self.warning("mg_budget: %.3f MB needed, %s has %.3f MB free" %
+                         (volume / 1.e6, scanDir, free / 1.e6))
+
+    def _scanPoints(self, words):
+        """
+        returns the number of points and the integration time
+          ascan exp_dmy01 0 1 10 0.1 -> 11, 0.1
+          mesh m1 0 1 10 m2 0 1 5 0.1 -> 66, 0.1
+        None, None for scans other than aNscan, dNscan, mesh, dmesh
+        and ct
+        """
+        name = words[0].lower()
+        args = words[1:]
+        if name in ['ct', 'count', 'uct']:
+            return 1, float(args[0]) if args else 1.
+        if name in ['mesh', 'dmesh']:
+            return (int(args[3]) + 1) * (int(args[7]) + 1), float(args[8])
+        match = re.match(r'^[ad](\d*)scan$', name)
+        if match is None:
+            return None, None
+        #
+        # a2scan m1 0 1 m2 0 1 10 0.1: 3 arguments per motor
+        #
+        nMotors = int(match.group(1) or 1)
+        if len(args) != 3 * nMotors + 2:
+            raise ValueError("%s needs %d arguments" %
+                             (name, 3 * nMotors + 2))
+        return int(args[-2]) + 1, float(args[-1])
+
+
+class mg_warmup(Macro):
+    """
+    Connects the channels of the ActiveMntGrp in parallel and reads
+    each value attribute once, so that the first point of the next
+    scan does not pay for the lazy connection of the proxies.
+    Displays the connect and read time of each channel.
+    """
+    param_def = [
+        ['timeout', Type.Float, 3., 'timeout per channel [s]']]
+
+    def run(self, timeout):
+        mg_name = self.getEnv('ActiveMntGrp')
+        startTime = time.time()
+        results = warmupMg(mg_name, timeout)
+        elapsed = time.time() - startTime
+
+        out = List(["Channel", "Connect/ms", "Read/ms"],
+                   text_alignment=(Right, Right, Right),
+                   max_col_width=(-1, -1, -1))
+        errors = []
+        for name, connectTime, readTime, exc in results:
+            if exc is not None:
+                out.appendRow([name, "-", "-"])
+                errors.append("%s: %s" % (name, exc))
+                continue
+            out.appendRow([name, "%.1f" % (connectTime * 1000.),
+                           "%.1f" % (readTime * 1000.)])
+        for line in out.genOutput():
+            self.output(line)
+
+        self.output("mg_warmup: %s, %d channels in %.1f ms" %
+                    (mg_name, len(results), elapsed * 1000.))
+        for elm in errors:
+            self.output("mg_warmup: %s" % elm)
+
+
+def _linearFit(xs, ys):
+    """
+    least squares fit y = a + b*x, returns (a, b)
+    """
+    n = float(len(xs))
+    xMean = sum(xs) / n
+    yMean = sum(ys) / n
+    sxx = sum([(x - xMean) ** 2 for x in xs])
+    if sxx == 0:
+        return yMean, 0.
+    b = sum([(x - xMean) * (y - yMean) for x, y in zip(xs, ys)]) / sxx
+    return yMean - b * xMean, b
+
+
+class mg_rate(Macro):
+    """
+    Measures the acquisition rate of the ActiveMntGrp without motion:
+    the MG counts nRepeat times at nSteps integration times between
+    tMin and tMax (logarithmic). The time per point is fitted by
+      time = overhead + slope*integ_time
+    and the achievable points per second are displayed. Finally the
+    value attributes of the channels are read one after the other,
+    one thread per controller, each controller has 'timeout' seconds.
+    This is the read latency, not the acquisition overhead of the
+    controller.
+
+    Example:
+      mg_rate 10 0.001 1 4
+    """
+    param_def = [
+        ['nRepeat', Type.Integer, 10, 'acquisitions per integration time'],
+        ['tMin', Type.Float, 0.001, 'shortest integration time [s]'],
+        ['tMax', Type.Float, 1., 'longest integration time [s]'],
+        ['nSteps', Type.Integer, 4, 'number of integration times'],
+        ['timeout', Type.Float, 10., 'timeout of the reads [s]']]
+
+    def run(self, nRepeat, tMin, tMax, nSteps, timeout):
+        mg_name = self.getEnv('ActiveMntGrp')
+        mg = self.getObj(mg_name, type_class=Type.MeasurementGroup)
+        if mg is None:
+            self.error("mg_rate: ActiveMntGrp is not defined or invalid")
+            return
+        if nRepeat < 1 or nSteps < 1 or tMin <= 0 or tMax < tMin:
+            self.error("mg_rate: wrong parameters")
+            return
+
+        if nSteps == 1:
+            integTimes = [tMin]
+        else:
+            integTimes = [tMin * (tMax / tMin) ** (float(i) / (nSteps - 1))
+                          for i in range(nSteps)]
+
+        out = List(["Integ/s", "Point/ms", "Overhead/ms", "Points/s"],
+                   text_alignment=(Right, Right, Right, Right),
+                   max_col_width=(-1, -1, -1, -1))
+        perPoint = []
+        for integTime in integTimes:
+            startTime = time.time()
+            for i in range(nRepeat):
+                self.checkPoint()
+                mg.count(integTime)
+            dt = (time.time() - startTime) / nRepeat
+            perPoint.append(dt)
+            out.appendRow(["%g" % integTime, "%.2f" % (dt * 1000.),
+                           "%.2f" % ((dt - integTime) * 1000.),
+                           "%.1f" % (1. / dt)])
+        for line in out.genOutput():
+            self.output(line)
+
+        overhead, slope = _linearFit(integTimes, perPoint)
+        self.output("")
+        self.output("mg_rate: %s, time/point = %.2f ms + %.3f * integ_time" %
+                    (mg_name, overhead * 1000., slope))
+        if overhead > 0:
+            self.output("mg_rate: at most %.1f points/s (integ_time -> 0)" %
+                        (1. / overhead))
+
+        self._readLatency(mg_name, timeout)
+
+    def _readLatency(self, mg_name, timeout):
+        """
+        reads the value attributes of the channels serially, one thread
+        per controller, displays the read latency per controller
+        """
+        ctrls = {}
+        for dct in getMgChannels(mg_name):
+            ctrls.setdefault(dct['_controller'], []).append(dct)
+
+        def readCtrl(ctrl):
+            for dct in ctrls[ctrl]:
+                dev = taurus.Device(str(dct[u'full_name']))
+                dev.read_attribute(
+                    str(dct.get(u'source') or 'value').split('/')[-1])
+            return len(ctrls[ctrl])
+
+        results = _runConcurrently(readCtrl, list(ctrls.keys()), timeout)
+        out = List(["Controller", "Channels", "Read latency/ms"],
+                   text_alignment=(Right, Right, Right),
+                   max_col_width=(-1, -1, -1))
+        for ctrl in sorted(ctrls):
+            res, exc, elapsed = results[ctrl]
+            if exc is not None:
+                out.appendRow([ctrl, str(len(ctrls[ctrl])), str(exc)])
+                continue
+            out.appendRow([ctrl, str(res), "%.2f" % (elapsed * 1000.)])
+        self.output("")
+        for line in out.genOutput():
+            self.output(line)
@@ -4,8 +4,16 @@
 import PyTango
 import time
 import json
-import fnmatch
+import csv
+import contextlib
+import collections
+import hashlib
+import gzip
+import shlex
+import re
 import os
+import math
+import threading
 import sys
 import subprocess
 from sardana.macroserver.macro import (
@@ -19,6 +27,41 @@ Left, Right, HCenter = Alignment.Left, Alignment.Right, Alignment.HCenter
 Nothing = '< None >'
 Splitter = ', '
 
+#: selector name -> profile fingerprint at the last MntGrp synchronization
+SyncedProfiles = {}
+#: selector name -> (proxy, version), shared by the macros of the MacroServer
+SelectorProxies = {}
+#: NXSRecSelector devices exported in the Tango database
+ExportedSelectors = []
+#: maximal time in s to wait for long selector commands
+LongCommandTimeout = 600.
+#: interval in s of the progress messages while waiting
+ProgressInterval = 10.
+#: (selector name, timeout in ms) -> proxy for the long commands,
+#: so that their timeout does not change the shared selector proxy
+LongCommandProxies = {}
+#: selector name -> (configuration server version, time, datasources,
+#: pool channels, components)
+NameIndex = {}
+#: time in s after which the cached pool channels are read again
+NameIndexTTL = 60.
+#: configuration server name -> proxy, see 'config_version'
+ConfigProxies = {}
+#: DeviceGroups JSON -> {device type: compiled regular expression}
+GroupPatterns = {}
+#: selector name -> (configuration server version, time, component rows,
+#: pool devices)
+ComponentIndex = {}
+#: keys of the profile configuration with {name: flag} selections
+SelectionKeys = ["ComponentSelection", "DataSourceSelection",
+                 "ComponentPreselection", "DataSourcePreselection"]
+#: ring buffer of (time, macro, phase, duration in s), see 'nxstiming'
+PhaseTimings = collections.deque(maxlen=5000)
+#: file name -> (modification time, user data rows)
+UserDataFiles = {}
+#: selector name -> (file name, index of the next row), see 'nxsudatafile'
+StagedUserData = {}
+
 
 if sys.version_info > (3,):
     str = str
@@ -26,8 +69,9 @@ if sys.version_info > (3,):
 
 def device_groups(self):
     """ Return device groups """
-    if hasattr(self.selector, "deviceGroups"):
-        return json.loads(self.selector.deviceGroups)
+    groups = getattr(self.selector, "deviceGroups", None)
+    if groups is not None:
+        return json.loads(groups)
     else:
         return { "counter": ["*exp_c*"],
                  "timer": ["*exp_t*"],
@@ -256,9 +300,12 @@ class nxsetprof(Macro):
         if name:
             self.selector.mntgrp = name
         fetchProfile(self)
-        self.selector.importMntGrp()
-        self.selector.storeProfile()
+        with phase(self, "importMntGrp"):
+            self.selector.importMntGrp()
+        with phase(self, "storeProfile"):
+            self.selector.storeProfile()
         update_configuration(self)
+        store_snapshot(self)
 
 
 class nxsimportmg(Macro):
@@ -273,8 +320,10 @@ class nxsimportmg(Macro):
             name = self.selector.mntgrp
         self.selector.mntgrp = name
         fetchProfile(self)
-        self.selector.importMntGrp()
-        self.selector.storeProfile()
+        with phase(self, "importMntGrp"):
+            self.selector.importMntGrp()
+        with phase(self, "storeProfile"):
+            self.selector.storeProfile()
 
 
 class nxsrmprof(Macro):
@@ -321,11 +370,9 @@ class nxsettimers(Macro):
 
     def run(self, timer_list):
         set_selector(self)
-        cnf = json.loads(self.selector.profileConfiguration)
-
-        cnf["Timer"] = str(json.dumps(timer_list))
-        self.selector.profileConfiguration = str(json.dumps(cnf))
-        update_configuration(self)
+        session = ProfileSession(self)
+        session.setTimers(timer_list)
+        session.commit()
 
 
 class nxsadd(Macro):
@@ -342,21 +389,9 @@ class nxsadd(Macro):
 
     def run(self, component_list):
         set_selector(self)
-        cnf = json.loads(self.selector.profileConfiguration)
-        cpdct = json.loads(cnf["ComponentSelection"])
-        dsdct = json.loads(cnf["DataSourceSelection"])
-        pch = self.selector.poolElementNames('ExpChannelList')
-        for name in component_list:
-            if name not in pch and name in self.selector.availableComponents():
-                cpdct[str(name)] = True
-            elif name in pch or name in self.selector.availableComponents():
-                dsdct[str(name)] = True
-            else:
-                self.warning("'%s' is not defined" % name)
-        cnf["DataSourceSelection"] = str(json.dumps(dsdct))
-        cnf["ComponentSelection"] = str(json.dumps(cpdct))
-        self.selector.profileConfiguration = str(json.dumps(cnf))
-        update_configuration(self)
+        session = ProfileSession(self)
+        session.add(component_list)
+        session.commit()
 
 
 class nxsetorder(Macro):
@@ -373,13 +408,9 @@ class nxsetorder(Macro):
 
     def run(self, datasource_list):
         set_selector(self)
-        cnf = json.loads(self.selector.profileConfiguration)
-        dslist = json.loads(cnf["OrderedChannels"])
-        cnf["OrderedChannels"] = str(json.dumps(list(datasource_list)))
-        self.output("Old channel order: %s" % dslist)
-        self.output("New channel order: %s" % datasource_list)
-        self.selector.profileConfiguration = str(json.dumps(cnf))
-        update_configuration(self)
+        session = ProfileSession(self)
+        session.setOrder(datasource_list)
+        session.commit()
 
 
 class nxset(Macro):
@@ -397,33 +428,9 @@ class nxset(Macro):
 
     def run(self, component_list):
         set_selector(self)
-        timers = self.selector.availableTimers()
-        stimers = [tm for tm in component_list if tm in timers]
-        if not stimers:
-            self.warning("Timer is missing")
-            return
-
-        cnf = json.loads(self.selector.profileConfiguration)
-        cpdct = json.loads(cnf["ComponentSelection"])
-        dsdct = json.loads(cnf["DataSourceSelection"])
-        for name in cpdct.keys():
-            cpdct[str(name)] = False
-        for name in dsdct.keys():
-            dsdct[str(name)] = False
-        pch = self.selector.poolElementNames('ExpChannelList')
-        for name in component_list:
-            if name not in pch and name in self.selector.availableComponents():
-                cpdct[str(name)] = True
-            elif name in pch or name in self.selector.availableComponents():
-                if str(name) not in stimers:
-                    dsdct[str(name)] = True
-            else:
-                self.warning("'%s' is not defined" % name)
-        cnf["Timer"] = str(json.dumps(stimers))
-        cnf["DataSourceSelection"] = str(json.dumps(dsdct))
-        cnf["ComponentSelection"] = str(json.dumps(cpdct))
-        self.selector.profileConfiguration = str(json.dumps(cnf))
-        update_configuration(self)
+        session = ProfileSession(self)
+        session.setSelection(component_list)
+        session.commit()
 
 
 class nxsdel(Macro):
@@ -441,24 +448,9 @@ class nxsdel(Macro):
 
     def run(self, component_list):
         set_selector(self)
-        cnf = json.loads(self.selector.profileConfiguration)
-        cpdct = json.loads(cnf["ComponentSelection"])
-        dsdct = json.loads(cnf["DataSourceSelection"])
-        timers = json.loads(cnf["Timer"])
-        for name in component_list:
-            if name in cpdct:
-                cpdct.pop(str(name))
-                self.output("Removing %s" % name)
-            if name in dsdct:
-                dsdct.pop(str(name))
-                self.output("Removing %s" % name)
-            if timers and name in timers and timers[0] != name:
-                timers.remove(name)
-        cnf["Timer"] = str(json.dumps(list(timers)))
-        cnf["DataSourceSelection"] = str(json.dumps(dsdct))
-        cnf["ComponentSelection"] = str(json.dumps(cpdct))
-        self.selector.profileConfiguration = str(json.dumps(cnf))
-        update_configuration(self)
+        session = ProfileSession(self)
+        session.delete(component_list)
+        session.commit()
 
 
 class nxsrm(Macro):
@@ -475,22 +467,9 @@ class nxsrm(Macro):
 
     def run(self, component_list):
         set_selector(self)
-        cnf = json.loads(self.selector.profileConfiguration)
-        cpdct = json.loads(cnf["ComponentSelection"])
-        dsdct = json.loads(cnf["DataSourceSelection"])
-        timers = json.loads(cnf["Timer"])
-        for name in component_list:
-            if name in cpdct:
-                cpdct[str(name)] = False
-            if name in dsdct:
-                dsdct[str(name)] = False
-            if timers and name in timers and timers[0] != name:
-                timers.remove(name)
-        cnf["Timer"] = str(json.dumps(list(timers)))
-        cnf["DataSourceSelection"] = str(json.dumps(dsdct))
-        cnf["ComponentSelection"] = str(json.dumps(cpdct))
-        self.selector.profileConfiguration = str(json.dumps(cnf))
-        update_configuration(self)
+        session = ProfileSession(self)
+        session.deselect(component_list)
+        session.commit()
 
 
 @macro()
@@ -499,17 +478,9 @@ def nxsclr(self):
 
     if not hasattr(self, "selector"):
         set_selector(self)
-    cnf = json.loads(self.selector.profileConfiguration)
-    cpdct = json.loads(cnf["ComponentSelection"])
-    dsdct = json.loads(cnf["DataSourceSelection"])
-    for name in cpdct.keys():
-        cpdct[str(name)] = False
-    for name in dsdct.keys():
-        dsdct[str(name)] = False
-    cnf["DataSourceSelection"] = str(json.dumps(dsdct))
-    cnf["ComponentSelection"] = str(json.dumps(cpdct))
-    self.selector.profileConfiguration = str(json.dumps(cnf))
-    update_configuration(self)
+    session = ProfileSession(self)
+    session.clear()
+    session.commit()
 
 
 class nxsadddesc(Macro):
@@ -527,35 +498,9 @@ class nxsadddesc(Macro):
 
     def run(self, component_list):
         set_selector(self)
-        cnf = json.loads(self.selector.profileConfiguration)
-        cpdct = json.loads(cnf["ComponentPreselection"])
-        if self.selector_version <= 2:
-            dsdct = set(json.loads(cnf["InitDataSources"]))
-            for name in component_list:
-                if name in self.selector.availableComponents():
-                    cpdct[str(name)] = True
-                    self.output("%s added" % name)
-                elif name in self.selector.availableDataSources():
-                    dsdct.add(str(name))
-                else:
-                    self.warning("'%s' is not defined" % name)
-            cnf["InitDataSources"] = str(json.dumps(list(dsdct)))
-        else:
-            dsdct = json.loads(cnf["DataSourcePreselection"])
-            for name in component_list:
-                if name in self.selector.availableComponents():
-                    cpdct[str(name)] = True
-                    self.output("%s added" % name)
-                elif name in self.selector.availableDataSources():
-                    dsdct[str(name)] = True
-                    self.output("%s added" % name)
-                else:
-                    self.warning("'%s' is not defined" % name)
-            cnf["DataSourcePreselection"] = str(json.dumps(dsdct))
-        cnf["ComponentPreselection"] = str(json.dumps(cpdct))
-        self.selector.profileConfiguration = str(json.dumps(cnf))
-        update_description(self)
-        update_configuration(self)
+        session = ProfileSession(self)
+        session.addDescription(component_list)
+        session.commit()
 
 
 class nxsdeldesc(Macro):
@@ -573,33 +518,9 @@ class nxsdeldesc(Macro):
 
     def run(self, component_list):
         set_selector(self)
-        cnf = json.loads(self.selector.profileConfiguration)
-        cpdct = json.loads(cnf["ComponentPreselection"])
-        if self.selector_version <= 2:
-            dsdct = set(json.loads(cnf["InitDataSources"]))
-            for name in component_list:
-                if name in cpdct:
-                    cpdct.pop(str(name))
-                    self.output("Removing %s" % name)
-                if name in dsdct:
-                    dsdct.remove(str(name))
-                    self.output("Removing %s" % name)
-            cnf["InitDataSources"] = str(json.dumps(list(dsdct)))
-        else:
-            dsdct = json.loads(cnf["DataSourcePreselection"])
-            for name in component_list:
-                if name in cpdct:
-                    cpdct.pop(str(name))
-                    self.output("Removing %s" % name)
-                if name in dsdct:
-                    dsdct.pop(str(name))
-                    self.output("Removing %s" % name)
-            cnf["DataSourcePreselection"] = str(json.dumps(dsdct))
-
-        cnf["ComponentPreselection"] = str(json.dumps(cpdct))
-        self.selector.profileConfiguration = str(json.dumps(cnf))
-        update_description(self)
-        update_configuration(self)
+        session = ProfileSession(self)
+        session.deleteDescription(component_list)
+        session.commit()
 
 
 class nxsrmdesc(Macro):
@@ -617,30 +538,9 @@ class nxsrmdesc(Macro):
 
     def run(self, component_list):
         set_selector(self)
-        cnf = json.loads(self.selector.profileConfiguration)
-        cpdct = json.loads(cnf["ComponentPreselection"])
-        if self.selector_version <= 2:
-            dsdct = set(json.loads(cnf["InitDataSources"]))
-            for name in component_list:
-                if name in cpdct:
-                    cpdct[str(name)] = False
-                if name in dsdct:
-                    dsdct.remove(str(name))
-                    self.output("Removing %s" % name)
-            cnf["InitDataSources"] = str(json.dumps(list(dsdct)))
-        else:
-            dsdct = json.loads(cnf["DataSourcePreselection"])
-            for name in component_list:
-                if name in cpdct:
-                    cpdct[str(name)] = False
-                if name in dsdct:
-                    dsdct[str(name)] = False
-            cnf["DataSourcePreselection"] = str(json.dumps(dsdct))
-
-        cnf["ComponentPreselection"] = str(json.dumps(cpdct))
-        self.selector.profileConfiguration = str(json.dumps(cnf))
-        update_description(self)
-        update_configuration(self)
+        session = ProfileSession(self)
+        session.deselectDescription(component_list)
+        session.commit()
 
 
 class nxsetappentry(Macro):
@@ -669,13 +569,9 @@ class nxsetudata(Macro):
 
     def run(self, name, value):
         set_selector(self)
-        cnf = json.loads(self.selector.profileConfiguration)
-        udata = json.loads(cnf["UserData"])
-        udata[str(name)] = value
-
-        cnf["UserData"] = str(json.dumps(udata))
-        self.selector.profileConfiguration = str(json.dumps(cnf))
-        update_configuration(self)
+        session = ProfileSession(self)
+        session.setUserData(name, value)
+        session.commit()
 
 
 class nxsusetudata(Macro):
@@ -694,19 +590,172 @@ class nxsusetudata(Macro):
 
     def run(self, name_list):
         set_selector(self)
-        cnf = json.loads(self.selector.profileConfiguration)
-        udata = json.loads(cnf["UserData"])
-        changed = False
-        for name in name_list:
-            if name in udata.keys():
-                udata.pop(str(name))
-                self.output("%s removed" % name)
-                changed = True
+        session = ProfileSession(self)
+        session.unsetUserData(name_list)
+        session.commit()
 
-        if changed:
-            cnf["UserData"] = str(json.dumps(udata))
-            self.selector.profileConfiguration = str(json.dumps(cnf))
-            update_configuration(self)
+
+class nxsetudatas(Macro):
+    """Set several user data at once.
+       The profile is written once and the MntGrp is updated once.
+       Typical user data are:
+       title, sample_name, beamtime_id, chemical_formula, ...
+
+       Example:
+         nxsetudatas title 'Sample 3' sample_name Fe2O3
+"""
+
+    param_def = [
+        ['udata_list',
+         [['name', Type.String, None, 'user data name'],
+          ['value', Type.String, None, 'user data value']],
+         None, 'List of user data names and values'],
+    ]
+
+    def run(self, udata_list):
+        set_selector(self)
+        session = ProfileSession(self)
+        for name, value in udata_list:
+            session.setUserData(name, value)
+        session.commit()
+
+
+class nxsudatafile(Macro):
+    """Set the user data of one sample from a JSON or CSV file.
+       The file contains one row per sample: a CSV header with the
+       user data names, a JSON list of objects or a JSON object
+       {sample_name: object}. Empty values unset the user data.
+       The row is given by its number (from 1) or its sample_name.
+       After each sample the next row is staged, so that
+       'nxsudatafile' without parameters switches to the next sample
+       with one profile write and one MntGrp update.
+"""
+
+    param_def = [
+        ['fname', Type.String, '', 'file name, default: the staged file'],
+        ['sample', Type.String, '', 'row number or sample_name, '
+         'default: the next row'],
+    ]
+
+    def run(self, fname, sample):
+        set_selector(self)
+        staged = StagedUserData.get(_selector_name(self.selector))
+        if not fname:
+            if staged is None:
+                self.error("nxsudatafile: no file staged")
+                return
+            fname = staged[0]
+        fname = os.path.abspath(os.path.expanduser(str(fname)))
+        try:
+            rows = read_udata_file(fname)
+        except (IOError, OSError, ValueError) as e:
+            self.error("nxsudatafile: cannot read %s: %s" % (fname, str(e)))
+            return
+        if sample:
+            index = find_udata_row(rows, sample)
+        elif staged is not None and staged[0] == fname:
+            index = staged[1]
+        else:
+            index = 0
+        if index is None or sample and index >= len(rows):
+            self.error("nxsudatafile: no sample '%s' in %s" % (sample, fname))
+            return
+        if index >= len(rows):
+            self.error("nxsudatafile: all %d samples of %s are done"
+                       % (len(rows), fname))
+            return
+
+        row = rows[index]
+        session = ProfileSession(self)
+        unset = [name for name, value in row.items()
+                 if value is None or value == ""]
+        for name, value in row.items():
+            if name not in unset:
+                session.setUserData(name, value)
+        if unset:
+            session.unsetUserData(unset)
+        session.commit()
+        StagedUserData[_selector_name(self.selector)] = (fname, index + 1)
+        self.output("Sample %d/%d: %s" % (
+            index + 1, len(rows), row.get("sample_name", "")))
+        if index + 1 < len(rows):
+            self.output("Next: %d/%d: %s" % (
+                index + 2, len(rows), rows[index + 1].get("sample_name", "")))
+
+
+def read_udata_file(fname):
+    """ Return the user data rows of a JSON or CSV file,
+        cached until the file is modified
+    """
+    mtime = os.path.getmtime(fname)
+    if fname in UserDataFiles and UserDataFiles[fname][0] == mtime:
+        return UserDataFiles[fname][1]
+    with open(fname) as fd:
+        if fname.lower().endswith(".json"):
+            data = json.load(fd)
+            if isinstance(data, dict):
+                rows = []
+                for name in sorted(data):
+                    row = dict(data[name])
+                    row.setdefault("sample_name", name)
+                    rows.append(row)
+            else:
+                rows = [dict(row) for row in data]
+        else:
+            # the missing values of short rows are None
+            rows = [dict((str(name).strip(),
+                          "" if value is None else str(value).strip())
+                         for name, value in row.items() if name)
+                    for row in csv.DictReader(fd)]
+    UserDataFiles[fname] = (mtime, rows)
+    return rows
+
+
+def find_udata_row(rows, sample):
+    """ Return the index of the row given by its number or sample_name """
+    for index, row in enumerate(rows):
+        if str(row.get("sample_name", "")) == sample:
+            return index
+    if sample.isdigit() and int(sample) >= 1:
+        return int(sample) - 1
+    return None
+
+
+class nxsbatch(Macro):
+    """ Apply several profile edits in one transaction.
+        Each edit is a quoted nxs macro call. The profile is read once,
+        the edits are applied in the given order, then the profile is
+        written once and the MntGrp is updated once.
+        Supported: nxsadd, nxsdel, nxsrm, nxset, nxsettimers,
+        nxsetorder, nxsclr, nxsadddesc, nxsdeldesc, nxsrmdesc,
+        nxsetudata, nxsusetudata
+
+        Example:
+          nxsbatch "nxsettimers exp_t01" "nxsadd exp_c01 exp_c02" \
+"nxsetudata title 'Sample 3'"
+    """
+
+    param_def = [
+        ['edit_list',
+         [['edit', Type.String, None, 'nxs macro call']],
+         None, 'List of profile edits']]
+
+    def run(self, edit_list):
+        set_selector(self)
+        edits = []
+        for edit in edit_list:
+            words = shlex.split(str(edit))
+            if not words or words[0] not in ProfileSession.edits:
+                self.error("nxsbatch: unknown edit '%s'" % edit)
+                return
+            edits.append(words)
+        session = ProfileSession(self)
+        for words in edits:
+            if not session.apply(words[0], words[1:]):
+                self.error("nxsbatch: '%s' failed, nothing committed"
+                           % " ".join(words))
+                return
+        session.commit()
 
 
 class nxsupdatedesc(Macro):
@@ -773,30 +822,158 @@ class nxsload(Macro):
             self.selector.profileFile = str(fname)
         self.selector.loadProfile()
         update_configuration(self)
+        store_snapshot(self)
         self.output("Profile was loaded from %s"
                     % self.selector.profileFile)
 
 
+class nxsfastprof(Macro):
+    """ Set the active profile from its cached snapshot.
+        Only the settings differing from the current profile are
+        written before a single MntGrp synchronization.
+        Snapshots are stored by 'nxsetprof', 'nxsload' and
+        'nxsfastprof', they are listed by 'nxslscachedprof'.
+        Without a snapshot or if the profile stored in the configuration
+        server changed since the snapshot 'nxsetprof' is used.
+    """
+
+    param_def = [
+        ['name', Type.String, None, 'profile name']]
+
+    def run(self, name):
+        set_selector(self)
+        snapshot = load_snapshot(self, name)
+        if snapshot is None:
+            self.output("No snapshot of '%s', using nxsetprof" % name)
+            self.nxsetprof(name)
+            return
+        values = read_selector(
+            self, ["MntGrp", "ProfileConfiguration", "ConfigDevice"], [])
+        stored = stored_fingerprint(self, name, values["ConfigDevice"])
+        if stored is None or snapshot.get("stored") != stored:
+            self.output("Snapshot of '%s' is outdated, using nxsetprof"
+                        % name)
+            self.nxsetprof(name)
+            return
+        if values["MntGrp"] != name:
+            # keeps the edits of the profile left
+            store_snapshot(self, values)
+        cnf = json.loads(values["ProfileConfiguration"])
+        diff = profile_diff(cnf, snapshot["cnf"])
+        try:
+            mgname = self.getEnv("ActiveMntGrp")
+        except UnknownEnv:
+            mgname = None
+        if mgname and mgname != values["MntGrp"]:
+            self.unsetEnv("ActiveMntGrp")
+        if values["MntGrp"] != name:
+            self.selector.mntgrp = name
+        if diff:
+            for key in diff:
+                if key in snapshot["cnf"]:
+                    cnf[key] = snapshot["cnf"][key]
+                else:
+                    cnf.pop(key, None)
+            with phase(self, "write"):
+                self.selector.profileConfiguration = str(json.dumps(cnf))
+        if update_configuration(self, cnf=cnf, mntgrp=name):
+            with phase(self, "storeProfile"):
+                self.selector.storeProfile()
+            store_snapshot(self)
+        self.output("Profile '%s' set, %d settings changed"
+                    % (name, len(diff)))
+
+
+class nxslscachedprof(Macro):
+    """ List the cached profile snapshots.
+        The snapshots are stored in NeXusProfileCacheDir
+        (default: ~/.sardana/nxsprofile_cache) by 'nxsetprof',
+        'nxsload' and 'nxsfastprof' and applied by 'nxsfastprof'
+    """
+
+    def run(self):
+        set_selector(self)
+        snapshots = list_snapshots(self)
+        if not snapshots:
+            self.output("No cached profiles")
+            return
+        out = List(["Profile", "Stored", "Size"],
+                   text_alignment=(Right, Right, Right),
+                   max_col_width=(-1, -1, -1))
+        for name, mtime, size in snapshots:
+            out.appendRow([
+                name, time.strftime("%Y-%m-%d %H:%M:%S",
+                                    time.localtime(mtime)),
+                "%d B" % size])
+        for line in out.genOutput():
+            self.output(line)
+
+
+class nxsdiffprof(Macro):
+    """ Show the differences between two cached profile snapshots.
+        Without the second name the snapshot is compared with
+        the current profile
+    """
+
+    param_def = [
+        ['name', Type.String, None, 'profile name'],
+        ['other', Type.String, '', 'profile name, default: current'],
+    ]
+
+    def run(self, name, other):
+        set_selector(self)
+        snapshot = load_snapshot(self, name)
+        if snapshot is None:
+            self.error("No snapshot of '%s'" % name)
+            return
+        if other:
+            otherSnapshot = load_snapshot(self, other)
+            if otherSnapshot is None:
+                self.error("No snapshot of '%s'" % other)
+                return
+            cnf = otherSnapshot["cnf"]
+        else:
+            other = "current"
+            with phase(self, "read"):
+                cnf = json.loads(self.selector.profileConfiguration)
+        diff = profile_diff(snapshot["cnf"], cnf)
+        if not diff:
+            self.output("No differences")
+            return
+        out = List(["Setting", name, other],
+                   text_alignment=(Right, Right, Right),
+                   max_col_width=(-1, 60, 60))
+        for key in sorted(diff):
+            for label, first, second in diff[key]:
+                out.appendRow(["%s %s" % (key, label) if label else key,
+                               first, second])
+        for line in out.genOutput():
+            self.output(line)
+
+
 class nxsls(Macro):
     """ Show all available components to select
         The result includes components and datasources stored
         in the configuration server as well as pool devices.
         The parameter is device type from 'nxslsdevtype' macro
-        or an arbitrary name pattern
+        or an arbitrary name pattern.
+        The name lists are cached until components or datasources
+        are stored in the configuration server, the pool devices for
+        NameIndexTTL seconds, 'nxsls <dev_type> True' reads them again
     """
 
     param_def = [
-        ['dev_type', Type.String, '', 'device type or name pattern']]
+        ['dev_type', Type.String, '', 'device type or name pattern'],
+        ['refresh', Type.Boolean, False, 'read the name lists again']]
 
-    def run(self, dev_type):
+    def run(self, dev_type, refresh):
         set_selector(self)
 
-        adss = set(self.selector.availableDataSources())
-        pchs = set(self.selector.poolElementNames('ExpChannelList'))
-        acps = set(self.selector.availableComponents())
-        fdss = self._filterSet(adss, dev_type)
-        fchs = self._filterSet(pchs, dev_type)
-        fcps = self._filterSet(acps, dev_type)
+        adss, pchs, acps = name_index(self, refresh)
+        patterns = group_patterns(self)
+        fdss = filter_names(adss, dev_type, patterns)
+        fchs = filter_names(pchs, dev_type, patterns)
+        fcps = filter_names(acps, dev_type, patterns)
 
         if fdss:
             self.output("\n    DataSources:\n")
@@ -809,82 +986,186 @@ class nxsls(Macro):
             self.output(Splitter.join(list(fcps)))
 
     def _filterSet(self, comps, dev_type):
-        available = set()
-        groups = device_groups(self)
-        if dev_type:
-            if dev_type not in groups.keys() and \
-                    dev_type[-1] == 's' and dev_type[:-1] in groups.keys():
-                dev_type = dev_type[:-1]
-            if dev_type in groups.keys():
-                for gr in groups[dev_type]:
-                    filtered = fnmatch.filter(
-                        comps, gr)
-                    available.update(filtered)
+        return filter_names(comps, dev_type, group_patterns(self))
+
+
+def name_index(mcr, refresh=False):
+    """ Return the available datasources, pool channels and components
+        as frozensets, cached per selector. They are read again when
+        the version of the configuration server changes, at the latest
+        after NameIndexTTL seconds
+    """
+    name = _selector_name(mcr.selector)
+    version = config_version(mcr)
+    entry = NameIndex.get(name)
+    if refresh or entry is None or version is None or \
+            entry[0] != version or time.time() - entry[1] > NameIndexTTL:
+        entry = (version, time.time(),
+                 frozenset(mcr.selector.availableDataSources()),
+                 frozenset(mcr.selector.poolElementNames('ExpChannelList')),
+                 frozenset(mcr.selector.availableComponents()))
+        NameIndex[name] = entry
+    return entry[2:]
+
+
+def config_version(mcr, device=None):
+    """ Return the Version of the configuration server, its revision
+        is increased whenever a component or a datasource is stored
+        or deleted. None, if it cannot be read
+    """
+    try:
+        return str(config_proxy(mcr, device).Version)
+    except Exception as e:
+        mcr.debug("Configuration server version: %s" % str(e))
+        return None
+
+
+def config_proxy(mcr, device=None):
+    """ Return the shared proxy of the configuration server of the
+        selector, device: its name, if already read
+    """
+    if device is None:
+        device = getString(mcr, "ConfigDevice")
+    device = str(device)
+    proxy = ConfigProxies.get(device)
+    if proxy is None:
+        proxy = ConfigProxies.setdefault(
+            device, PyTango.DeviceProxy(device))
+    return proxy
+
+
+def stored_fingerprint(mcr, name, device=None):
+    """ Return the fingerprint of the profile stored in the
+        configuration server under the given name. None, if it
+        is not stored or cannot be read
+    """
+    try:
+        selections = config_proxy(mcr, device).Selections([str(name)])
+        if selections and selections[0]:
+            return profile_fingerprint(name, json.loads(selections[0]))
+    except Exception as e:
+        mcr.debug("Stored profile '%s': %s" % (name, str(e)))
+    return None
+
+
+def _glob_regex(pattern):
+    """ translates an fnmatch pattern for re.search(),
+        leading and trailing '*' are left unanchored instead of '.*'
+    """
+    res = "" if pattern.startswith("*") else "^"
+    core = pattern.strip("*")
+    i, n = 0, len(core)
+    while i < n:
+        c = core[i]
+        i += 1
+        if c == '*':
+            res += '.*'
+        elif c == '?':
+            res += '.'
+        elif c == '[':
+            j = i
+            if j < n and core[j] == '!':
+                j += 1
+            if j < n and core[j] == ']':
+                j += 1
+            while j < n and core[j] != ']':
+                j += 1
+            if j >= n:
+                res += '\\['
             else:
-                filtered = fnmatch.filter(
-                    comps, "*%s*" % dev_type)
-                available.update(filtered)
+                stuff = core[i:j].replace('\\', '\\\\')
+                i = j + 1
+                if stuff[0] == '!':
+                    stuff = '^' + stuff[1:]
+                elif stuff[0] == '^':
+                    stuff = '\\' + stuff
+                res += '[%s]' % stuff
         else:
-            available.update(comps)
-        return available
+            res += re.escape(c)
+    if not pattern.endswith("*"):
+        res += "\\Z"
+    return res
+
+
+def _compile_patterns(patterns):
+    """ one regular expression matching any of the fnmatch patterns """
+    if not patterns:
+        return None
+    return re.compile("|".join(
+        ["(?:%s)" % _glob_regex(pat) for pat in patterns]), re.DOTALL)
+
+
+def group_patterns(mcr):
+    """ Return the device groups as compiled regular expressions,
+        compiled once per DeviceGroups definition
+    """
+    groups = device_groups(mcr)
+    key = json.dumps(groups, sort_keys=True)
+    if key not in GroupPatterns:
+        GroupPatterns[key] = dict(
+            (grp, _compile_patterns(pats)) for grp, pats in groups.items())
+    return GroupPatterns[key]
+
+
+def filter_names(names, dev_type, patterns):
+    """ Filter names by a device type of the device groups
+        or by an arbitrary name pattern
+    """
+    if not dev_type:
+        return set(names)
+    if dev_type not in patterns and \
+            dev_type[-1] == 's' and dev_type[:-1] in patterns:
+        dev_type = dev_type[:-1]
+    if dev_type in patterns:
+        regex = patterns[dev_type]
+        if regex is None:
+            return set()
+    else:
+        regex = _compile_patterns(["*%s*" % dev_type])
+    return set([name for name in names if regex.search(name)])
 
 
 class nxshow(Macro):
-    """ Describe the given detector component.
+    """ Describe the given detector components.
         Available components can be listed by
         'nxsls', 'nxslscp' or 'nxslsds' macros
     """
 
     param_def = [
-        ['name', Type.String, '', 'component name']]
+        ['name_list',
+         [['name', Type.String, None, 'component name']],
+         None, 'List of components to describe']]
 
-    def run(self, name):
+    def run(self, name_list):
         set_selector(self)
-        cpdesc = json.loads(getString(
-            self, "ComponentDescription", True))
-        avcp = self.selector.availableComponents()
-        avds = self.selector.availableDataSources()
-        fullpool = json.loads(getString(
-            self, "FullDeviceNames", True))
-        dslist = []
-        if name in avcp:
-            found = False
-            for grp in cpdesc:
-                for cp in grp.keys():
-                    if cp == name:
-                        dss = grp[cp]
-                        for ds in dss.keys():
-                            for vds in dss[ds]:
-                                elem = {}
-                                elem["source_name"] = ds
-                                elem["strategy"] = vds[0]
-                                elem["source_type"] = vds[1]
-                                elem["source"] = vds[2]
-                                elem["nexus_type"] = vds[3]
-                                elem["shape"] = vds[4]
-#                                elem["cpname"] = cp
-                                dslist.append(elem)
-                        found = True
-                        break
-                    if found:
-                        break
-        if dslist:
-            self.output("\n    Component: %s\n" % name)
-            printTable(self, dslist)
-
-        dslist = []
-        if name in fullpool.keys():
+        avds, pchs, avcp = name_index(self)
+        cpindex, fullpool = component_index(self)
+        dsnames = [str(name) for name in name_list if name in avds]
+        dsdesc = {}
+        if dsnames:
+            descs = self.selector.DataSourceDescription(dsnames)
+            for dsname, desc in zip(dsnames, descs or []):
+                md = json.loads(desc)
+                dsdesc[str(md.get("dsname", dsname))] = md
+
+        for name in name_list:
+            dslist = []
+            if name in avcp:
+                dslist = [dict(row) for row in cpindex.get(name, [])]
+            if dslist:
+                self.output("\n    Component: %s\n" % name)
+                printTable(self, dslist)
+
+            dslist = []
             if name in fullpool.keys():
                 dslist.append({"source": fullpool[name]})
-        if dslist:
-            self.output("\n    PoolDevice: %s\n" % name)
-            printTable(self, dslist)
-        dslist = []
-
-        if name in avds:
-            desc = self.selector.DataSourceDescription([str(name)])
-            if desc:
-                md = json.loads(desc[0])
+            if dslist:
+                self.output("\n    PoolDevice: %s\n" % name)
+                printTable(self, dslist)
+
+            dslist = []
+            if name in dsdesc:
+                md = dict(dsdesc[name])
                 if "record" in md:
                     md["source"] = md["record"]
                     md.pop("record")
@@ -892,13 +1173,572 @@ class nxshow(Macro):
                     md["source_type"] = md["dstype"]
                     md.pop("dstype")
                 dslist.append(md)
+            if dslist:
+                self.output("\n    DataSource: %s\n" % name)
+                printTable(self, dslist)
 
-        if dslist:
-            self.output("\n    DataSource: %s\n" % name)
-            printTable(self, dslist)
+
+class ProfileSession(object):
+    """ In-memory edit of the profile configuration of the selector.
+        profileConfiguration is read once, on first access, and its
+        JSON-encoded values are decoded on demand. commit() writes the profile back once
+        and synchronizes the MntGrp once.
+    """
+
+    #: macro name -> (method, argument style)
+    edits = {
+        "nxsadd": ("add", "list"),
+        "nxsdel": ("delete", "list"),
+        "nxsrm": ("deselect", "list"),
+        "nxset": ("setSelection", "list"),
+        "nxsettimers": ("setTimers", "list"),
+        "nxsetorder": ("setOrder", "list"),
+        "nxsclr": ("clear", "none"),
+        "nxsadddesc": ("addDescription", "list"),
+        "nxsdeldesc": ("deleteDescription", "list"),
+        "nxsrmdesc": ("deselectDescription", "list"),
+        "nxsetudata": ("setUserData", "pair"),
+        "nxsusetudata": ("unsetUserData", "list"),
+    }
+
+    def __init__(self, mcr):
+        self.mcr = mcr
+        self.selector = mcr.selector
+        self.cnf = None
+        self.decoded = {}
+        self.touched = set()
+        self.modified = False
+        self.description = False
+        self.cache = {}
+
+    def configuration(self):
+        """ returns the profile configuration, read on first access """
+        if self.cnf is None:
+            with phase(self.mcr, "read"):
+                self.cnf = json.loads(self.selector.profileConfiguration)
+        return self.cnf
+
+    def get(self, key):
+        """ returns the decoded value of the given configuration key """
+        if key not in self.decoded:
+            self.decoded[key] = json.loads(self.configuration()[key])
+        return self.decoded[key]
+
+    def put(self, key, value):
+        """ sets the decoded value of the given configuration key """
+        self.decoded[key] = value
+        self.touched.add(key)
+        self.modified = True
+
+    def _selectorList(self, name, *args):
+        """ selector command results, read once per session """
+        if name not in self.cache:
+            self.cache[name] = getattr(self.selector, name)(*args)
+        return self.cache[name]
+
+    def poolChannels(self):
+        return self._selectorList("poolElementNames", 'ExpChannelList')
+
+    def availableComponents(self):
+        return self._selectorList("availableComponents")
+
+    def availableDataSources(self):
+        return self._selectorList("availableDataSources")
+
+    def availableTimers(self):
+        return self._selectorList("availableTimers")
+
+    def apply(self, edit, args):
+        """ applies an edit given by the macro name and its arguments,
+            returns False if the arguments do not fit
+        """
+        method, style = self.edits[edit]
+        if style == "none":
+            return getattr(self, method)() is not False
+        if style == "pair":
+            if len(args) != 2:
+                return False
+            return getattr(self, method)(*args) is not False
+        if not args:
+            return False
+        return getattr(self, method)(args) is not False
+
+    def setTimers(self, timer_list):
+        self.put("Timer", list(timer_list))
+
+    def add(self, component_list):
+        cpdct = self.get("ComponentSelection")
+        dsdct = self.get("DataSourceSelection")
+        pch = self.poolChannels()
+        acps = self.availableComponents()
+        for name in component_list:
+            if name not in pch and name in acps:
+                cpdct[str(name)] = True
+            elif name in pch or name in acps:
+                dsdct[str(name)] = True
+            else:
+                self.mcr.warning("'%s' is not defined" % name)
+        self.put("DataSourceSelection", dsdct)
+        self.put("ComponentSelection", cpdct)
+
+    def setOrder(self, datasource_list):
+        dslist = self.get("OrderedChannels")
+        self.mcr.output("Old channel order: %s" % dslist)
+        self.mcr.output("New channel order: %s" % datasource_list)
+        self.put("OrderedChannels", list(datasource_list))
+
+    def setSelection(self, component_list):
+        timers = self.availableTimers()
+        stimers = [tm for tm in component_list if tm in timers]
+        if not stimers:
+            self.mcr.warning("Timer is missing")
+            return False
+        self.clear()
+        cpdct = self.get("ComponentSelection")
+        dsdct = self.get("DataSourceSelection")
+        pch = self.poolChannels()
+        acps = self.availableComponents()
+        for name in component_list:
+            if name not in pch and name in acps:
+                cpdct[str(name)] = True
+            elif name in pch or name in acps:
+                if str(name) not in stimers:
+                    dsdct[str(name)] = True
+            else:
+                self.mcr.warning("'%s' is not defined" % name)
+        self.put("Timer", stimers)
+
+    def delete(self, component_list):
+        cpdct = self.get("ComponentSelection")
+        dsdct = self.get("DataSourceSelection")
+        timers = self.get("Timer")
+        for name in component_list:
+            if name in cpdct:
+                cpdct.pop(str(name))
+                self.mcr.output("Removing %s" % name)
+            if name in dsdct:
+                dsdct.pop(str(name))
+                self.mcr.output("Removing %s" % name)
+            if timers and name in timers and timers[0] != name:
+                timers.remove(name)
+        self.put("Timer", list(timers))
+        self.put("DataSourceSelection", dsdct)
+        self.put("ComponentSelection", cpdct)
+
+    def deselect(self, component_list):
+        cpdct = self.get("ComponentSelection")
+        dsdct = self.get("DataSourceSelection")
+        timers = self.get("Timer")
+        for name in component_list:
+            if name in cpdct:
+                cpdct[str(name)] = False
+            if name in dsdct:
+                dsdct[str(name)] = False
+            if timers and name in timers and timers[0] != name:
+                timers.remove(name)
+        self.put("Timer", list(timers))
+        self.put("DataSourceSelection", dsdct)
+        self.put("ComponentSelection", cpdct)
+
+    def clear(self):
+        cpdct = self.get("ComponentSelection")
+        dsdct = self.get("DataSourceSelection")
+        for name in cpdct.keys():
+            cpdct[str(name)] = False
+        for name in dsdct.keys():
+            dsdct[str(name)] = False
+        self.put("DataSourceSelection", dsdct)
+        self.put("ComponentSelection", cpdct)
+
+    def addDescription(self, component_list):
+        cpdct = self.get("ComponentPreselection")
+        acps = self.availableComponents()
+        adss = self.availableDataSources()
+        if self.mcr.selector_version <= 2:
+            dsdct = set(self.get("InitDataSources"))
+            for name in component_list:
+                if name in acps:
+                    cpdct[str(name)] = True
+                    self.mcr.output("%s added" % name)
+                elif name in adss:
+                    dsdct.add(str(name))
+                else:
+                    self.mcr.warning("'%s' is not defined" % name)
+            self.put("InitDataSources", list(dsdct))
+        else:
+            dsdct = self.get("DataSourcePreselection")
+            for name in component_list:
+                if name in acps:
+                    cpdct[str(name)] = True
+                    self.mcr.output("%s added" % name)
+                elif name in adss:
+                    dsdct[str(name)] = True
+                    self.mcr.output("%s added" % name)
+                else:
+                    self.mcr.warning("'%s' is not defined" % name)
+            self.put("DataSourcePreselection", dsdct)
+        self.put("ComponentPreselection", cpdct)
+        self.description = True
+
+    def deleteDescription(self, component_list):
+        cpdct = self.get("ComponentPreselection")
+        if self.mcr.selector_version <= 2:
+            dsdct = set(self.get("InitDataSources"))
+            for name in component_list:
+                if name in cpdct:
+                    cpdct.pop(str(name))
+                    self.mcr.output("Removing %s" % name)
+                if name in dsdct:
+                    dsdct.remove(str(name))
+                    self.mcr.output("Removing %s" % name)
+            self.put("InitDataSources", list(dsdct))
+        else:
+            dsdct = self.get("DataSourcePreselection")
+            for name in component_list:
+                if name in cpdct:
+                    cpdct.pop(str(name))
+                    self.mcr.output("Removing %s" % name)
+                if name in dsdct:
+                    dsdct.pop(str(name))
+                    self.mcr.output("Removing %s" % name)
+            self.put("DataSourcePreselection", dsdct)
+        self.put("ComponentPreselection", cpdct)
+        self.description = True
+
+    def deselectDescription(self, component_list):
+        cpdct = self.get("ComponentPreselection")
+        if self.mcr.selector_version <= 2:
+            dsdct = set(self.get("InitDataSources"))
+            for name in component_list:
+                if name in cpdct:
+                    cpdct[str(name)] = False
+                if name in dsdct:
+                    dsdct.remove(str(name))
+                    self.mcr.output("Removing %s" % name)
+            self.put("InitDataSources", list(dsdct))
+        else:
+            dsdct = self.get("DataSourcePreselection")
+            for name in component_list:
+                if name in cpdct:
+                    cpdct[str(name)] = False
+                if name in dsdct:
+                    dsdct[str(name)] = False
+            self.put("DataSourcePreselection", dsdct)
+        self.put("ComponentPreselection", cpdct)
+        self.description = True
+
+    def setUserData(self, name, value):
+        udata = self.get("UserData")
+        udata[str(name)] = value
+        self.put("UserData", udata)
+
+    def unsetUserData(self, name_list):
+        udata = self.get("UserData")
+        changed = False
+        for name in name_list:
+            if name in udata.keys():
+                udata.pop(str(name))
+                self.mcr.output("%s removed" % name)
+                changed = True
+        if changed:
+            self.put("UserData", udata)
+
+    def commit(self):
+        """ writes the profile and synchronizes the MntGrp,
+            returns False if nothing has been modified
+        """
+        if not self.modified:
+            return False
+        cnf = self.configuration()
+        for key in self.touched:
+            cnf[key] = str(json.dumps(self.decoded[key]))
+        with phase(self.mcr, "write"):
+            self.selector.profileConfiguration = str(json.dumps(cnf))
+        if self.description:
+            update_description(self.mcr)
+            update_configuration(self.mcr)
+        else:
+            update_configuration(self.mcr, cnf=cnf)
+        self.touched = set()
+        self.modified = False
+        self.description = False
+        return True
+
+
+class nxsprobe(Macro):
+    """ Probe the Tango attributes of the selected datasources.
+        The datasources of the selected detector and descriptive
+        components and the selected datasources, optionally filtered
+        by a device type or a name pattern as in 'nxsls', are read
+        concurrently, each with the given timeout. The latency is the
+        time of the read, without the connection to the device.
+        A latency histogram and the datasources above the threshold
+        are displayed.
+        Datasources which are not Tango attributes are not probed.
+    """
+
+    param_def = [
+        ['dev_type', Type.String, '', 'device type or name pattern'],
+        ['threshold', Type.Float, 100., 'latency threshold [ms]'],
+        ['timeout', Type.Float, 1., 'timeout per datasource [s]']]
+
+    #: upper bin edges of the histogram in ms
+    bins = [1., 3., 10., 30., 100., 300., 1000.]
+
+    def run(self, dev_type, threshold, timeout):
+        set_selector(self)
+        sources = selected_tango_sources(self)
+        names = filter_names(sources.keys(), dev_type, group_patterns(self))
+        if not names:
+            self.output("No Tango datasources selected")
+            return
+        results = probe_sources(
+            dict((name, sources[name]) for name in names), timeout)
+
+        counts = [0] * (len(self.bins) + 2)
+        slow = []
+        for name, (latency, error) in results.items():
+            if error is not None:
+                counts[-1] += 1
+                reasons = [reason for reason in _reasons(error) if reason]
+                slow.append((float("inf"), name,
+                             ", ".join(reasons) or str(error)))
+                continue
+            ms = latency * 1000.
+            counts[len([edge for edge in self.bins if ms >= edge])] += 1
+            if ms > threshold:
+                slow.append((ms, name, "%.1f" % ms))
+
+        labels = ["< %g ms" % self.bins[0]]
+        labels.extend(["%g - %g ms" % (low, high) for low, high in
+                       zip(self.bins[:-1], self.bins[1:])])
+        labels.append(">= %g ms" % self.bins[-1])
+        labels.append("failed")
+        out = List(["Latency", "Datasources", ""],
+                   text_alignment=(Right, Right, Left),
+                   max_col_width=(-1, -1, 50))
+        scale = max(1., max(counts) / 50.)
+        for label, count in zip(labels, counts):
+            out.appendRow([label, count, "*" * int(round(count / scale))])
+        for line in out.genOutput():
+            self.output(line)
+
+        self.output("\n%d datasources probed, %d above %g ms or failed\n"
+                    % (len(results), len(slow), threshold))
+        if slow:
+            out = List(["DataSource", "Source", "Latency/ms"],
+                       text_alignment=(Right, Right, Right),
+                       max_col_width=(-1, -1, 60))
+            for ms, name, text in sorted(slow, reverse=True):
+                out.appendRow([name, sources[name], text])
+            for line in out.genOutput():
+                self.output(line)
+
+
+class nxstiming(Macro):
+    """ Show the durations of the selector operations of nxs macros.
+        Percentiles in ms per phase, and per macro and phase, of the
+        last recorded operations: set_selector, read and write of the
+        profile (selector server), fetchProfile (configuration server),
+        updateMntGrp and importMntGrp (pool), storeProfile,
+        exportEnvProfile and the description commands
+    """
+
+    param_def = [
+        ['macro_name', Type.String, '', 'macro name, default: all'],
+        ['reset', Type.Boolean, False, 'clear the recorded durations'],
+    ]
+
+    #: percentiles shown
+    percents = [50, 90, 99]
+
+    def run(self, macro_name, reset):
+        records = [rec for rec in list(PhaseTimings)
+                   if not macro_name or rec[1] == macro_name]
+        if reset:
+            PhaseTimings.clear()
+        if not records:
+            self.output("No recorded durations")
+            return
+        self.output("%d operations since %s\n" % (
+            len(records), time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(records[0][0]))))
+        self._table(["Phase"], records, lambda rec: (rec[2],))
+        self.output("")
+        self._table(["Macro", "Phase"], records,
+                    lambda rec: (rec[1], rec[2]))
+
+    def _table(self, header, records, key):
+        groups = {}
+        for rec in records:
+            groups.setdefault(key(rec), []).append(rec[3] * 1000.)
+        columns = header + ["Calls"] + \
+            ["p%d/ms" % pc for pc in self.percents] + ["Max/ms", "Total/s"]
+        out = List(columns,
+                   text_alignment=[Right] * len(columns),
+                   max_col_width=[-1] * len(columns))
+        for name in sorted(groups):
+            values = sorted(groups[name])
+            row = list(name) + [len(values)]
+            row.extend(["%.1f" % _percentile(values, pc)
+                        for pc in self.percents])
+            row.extend(["%.1f" % values[-1], "%.2f" % (sum(values) / 1000.)])
+            out.appendRow(row)
+        for line in out.genOutput():
+            self.output(line)
+
+
+def selected_tango_sources(mcr):
+    """ Return the Tango attributes of the datasources of the selected
+        components and of the selected datasources, {dsname: source}
+    """
+    values = read_selector(
+        mcr, [], ["SelectedComponents", "PreselectedComponents",
+                  "SelectedDataSources"])
+    cpindex, fullpool = component_index(mcr)
+    sources = {}
+    for cp in list(values["SelectedComponents"] or []) + \
+            list(values["PreselectedComponents"] or []):
+        for row in cpindex.get(cp, []):
+            if row["source_type"] == "TANGO":
+                sources[str(row["source_name"])] = str(row["source"])
+    adss = name_index(mcr)[0]
+    dsnames = []
+    for name in values["SelectedDataSources"] or []:
+        if name in fullpool:
+            sources[str(name)] = str(fullpool[name]) + "/Value"
+        elif name in adss and name not in sources:
+            dsnames.append(str(name))
+    if dsnames:
+        for desc in mcr.selector.DataSourceDescription(dsnames) or []:
+            md = json.loads(desc)
+            if md.get("dstype") == "TANGO" and md.get("record"):
+                sources[str(md["dsname"])] = str(md["record"])
+    return sources
+
+
+#: maximal number of threads of probe_sources
+ProbeWorkers = 32
+
+
+def probe_sources(sources, timeout):
+    """ Read the Tango attributes {name: 'device/attribute'} concurrently.
+        One proxy per device is opened first, only the reads are timed.
+        Returns {name: (latency in s, exception or None)}
+    """
+    devices = {}
+    for name, source in sources.items():
+        device, attribute = source.rsplit("/", 1)
+        devices.setdefault(device, []).append((name, attribute))
+
+    def connect(device):
+        proxy = PyTango.DeviceProxy(device)
+        proxy.set_timeout_millis(int(timeout * 1000))
+        return proxy
+
+    # a connection may take longer than the read timeout
+    proxies = _run_workers(connect, list(devices), 2 * timeout)
+    reads = [(name, device, attribute)
+             for device, attributes in devices.items()
+             if proxies[device][2] is None
+             for name, attribute in attributes]
+    results = _run_workers(
+        lambda item: proxies[item[1]][1].read_attribute(item[2]),
+        reads, timeout)
+    argout = {}
+    for device, attributes in devices.items():
+        for name, attribute in attributes:
+            if proxies[device][2] is not None:
+                argout[name] = (proxies[device][0], proxies[device][2])
+            else:
+                latency, _, error = results[(name, device, attribute)]
+                argout[name] = (latency, error)
+    return argout
+
+
+def _run_workers(func, items, timeout):
+    """ Call func(item) for the items in at most ProbeWorkers threads,
+        returns {item: (duration in s, result, exception or None)}.
+        Items without a result after the deadline get an exception
+    """
+    results = {}
+    pending = list(items)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                item = pending.pop()
+            start = time.time()
+            try:
+                result, error = func(item), None
+            except Exception as e:
+                result, error = None, e
+            with lock:
+                results[item] = (time.time() - start, result, error)
+
+    threads = [threading.Thread(target=worker)
+               for _ in range(min(ProbeWorkers, len(items)))]
+    for th in threads:
+        th.daemon = True
+        th.start()
+    deadline = time.time() + timeout * (
+        len(items) // max(1, len(threads)) + 1)
+    for th in threads:
+        th.join(max(0., deadline - time.time()))
+    with lock:
+        argout = dict(results)
+    for item in items:
+        if item not in argout:
+            argout[item] = (
+                timeout, None, Exception("no reply within %g s" % timeout))
+    return argout
+
+
+def component_index(mcr):
+    """ Return the datasource rows of the components and the full pool
+        device names. Both are cached per selector, like 'name_index',
+        and read again when the version of the configuration server
+        changes, at the latest after NameIndexTTL seconds
+    """
+    version = config_version(mcr)
+    name = _selector_name(mcr.selector)
+    entry = ComponentIndex.get(name)
+    if entry is None or version is None or entry[0] != version or \
+            time.time() - entry[1] > NameIndexTTL:
+        index = {}
+        cpdesc = json.loads(getString(mcr, "ComponentDescription", True))
+        for grp in cpdesc:
+            for cp, dss in grp.items():
+                #
+                # the first group of a component wins
+                #
+                if cp in index:
+                    continue
+                rows = index[cp] = []
+                for ds in dss.keys():
+                    for vds in dss[ds]:
+                        rows.append({
+                            "source_name": ds,
+                            "strategy": vds[0],
+                            "source_type": vds[1],
+                            "source": vds[2],
+                            "nexus_type": vds[3],
+                            "shape": vds[4]})
+        fullpool = json.loads(getString(mcr, "FullDeviceNames", True))
+        entry = (version, time.time(), index, fullpool)
+        ComponentIndex[name] = entry
+    return entry[2], entry[3]
 
 
 def fetchProfile(mcr):
+    with phase(mcr, "fetchProfile"):
+        _fetch_profile(mcr)
+
+
+def _fetch_profile(mcr):
     configold = getString(mcr, "ConfigDevice")
     doorold = getString(mcr, "Door")
     door = mcr.getDoorName()
@@ -915,48 +1755,95 @@ def fetchProfile(mcr):
                  (doornew, door))
 
 
-def wait_for_device(proxy, counter=100):
-    """ Wait for the given Tango device """
-    found = False
-    cnt = 0
-    while not found and cnt < counter:
-        if cnt > 1:
-            time.sleep(0.01)
-        try:
-            if proxy.state() != PyTango.DevState.RUNNING:
-                found = True
-        except (PyTango.DevFailed, PyTango.Except, PyTango.DevError):
-            time.sleep(0.01)
-            found = False
-            if cnt == counter - 1:
-                raise
-        cnt += 1
+def read_selector(mcr, attributes, commands):
+    """ Read the given selector attributes with one read_attributes call
+        while the given commands are executed asynchronously.
+        Returns a dictionary name -> value, raises the DevFailed
+        of the first attribute that cannot be read
+    """
+    with phase(mcr, "read"):
+        return _read_selector(mcr, attributes, commands)
+
+
+def _read_selector(mcr, attributes, commands):
+    selector = mcr.selector
+    values = {}
+    if isinstance(selector, PyTango.DeviceProxy):
+        ids = [(name, selector.command_inout_asynch(name))
+               for name in commands]
+        failed = None
+        for name, da in zip(attributes, selector.read_attributes(
+                list(attributes))):
+            if da.has_failed and failed is None:
+                failed = da
+            values[name] = None if da.has_failed else da.value
+        timeout = selector.get_timeout_millis()
+        for name, aid in ids:
+            values[name] = selector.command_inout_reply(aid, timeout)
+        #
+        # the replies are collected first, so that no asynchronous
+        # call is left behind
+        #
+        if failed is not None:
+            raise PyTango.DevFailed(*failed.get_err_stack())
+    else:
+        for name in attributes:
+            values[name] = getattr(
+                selector, str(name)[0].lower() + str(name)[1:])
+        for name in commands:
+            values[name] = getattr(
+                selector, str(name)[0].lower() + str(name)[1:])()
+    return values
+
+
+def _strList(data):
+    if data is None:
+        return []
+    return [(str(v) if isinstance(v, str) else v) for v in data]
 
 
 def printProfile(mcr, server):
-    out = List(["Profile (MntGrp): %s"
-                % str(getString(mcr, "MntGrp")), ""],
+    """ Build the profile table from one attribute read,
+        concurrent commands and one decode of the configuration
+    """
+    commands = ["SelectedComponents", "SelectedDataSources",
+                "PreselectedComponents", "MandatoryComponents"]
+    if mcr.selector_version > 2:
+        commands.append("PreselectedDataSources")
+    values = read_selector(
+        mcr, ["MntGrp", "ProfileConfiguration", "UserData", "AppendEntry",
+              "ConfigDevice", "WriterDevice"], commands)
+    conf = json.loads(values["ProfileConfiguration"])
+
+    def row(title, data):
+        out.appendRow([title, Splitter.join(data) if data else Nothing])
+
+    out = List(["Profile (MntGrp): %s" % str(values["MntGrp"]), ""],
                text_alignment=(Right, Right),
                max_col_width=(-1, 60),)
-    printConfList(mcr, "Timer", True, "Timer(s)", out=out)
-    printList(mcr, "SelectedComponents", False, "Detector Components",
-              True, out=out)
-    printList(mcr, "SelectedDataSources", False, "", True, out=out)
+    row("Timer(s)", _strList(json.loads(conf["Timer"])))
+    row("Detector Components", _strList(values["SelectedComponents"]))
+    row("", _strList(values["SelectedDataSources"]))
     mergeLastTwoRows(out)
-    printList(mcr, "PreselectedComponents", False, "Descriptive Components",
-              True, out=out)
+    row("Descriptive Components", _strList(values["PreselectedComponents"]))
     if mcr.selector_version <= 2:
-        printConfList(mcr, "InitDataSources", True, "", out=out)
+        row("", _strList(json.loads(conf["InitDataSources"])))
     else:
-        printList(mcr, "PreselectedDataSources", False, "", True, out=out)
+        row("", _strList(values["PreselectedDataSources"]))
     mergeLastTwoRows(out)
-    printList(mcr, "MandatoryComponents", False, "Mandatory Components",
-              True, out=out)
-    printDict(mcr, "UserData", True, "User Data", out=out)
-    printString(mcr, "AppendEntry", out=out)
+    row("Mandatory Components", _strList(values["MandatoryComponents"]))
+    udata = json.loads(values["UserData"])
+    if udata is None:
+        udata = {}
+    else:
+        udata = dict(
+            [str(k), (str(v) if isinstance(v, str) else v)]
+            for k, v in udata.items())
+    out.appendRow(["User Data", str(udata)])
+    out.appendRow(["AppendEntry", values["AppendEntry"]])
     out.append(["SelectorServer", str(server)])
-    printString(mcr, "ConfigDevice", "ConfigServer", out=out)
-    printString(mcr, "WriterDevice", "WriterServer", out=out)
+    out.appendRow(["ConfigServer", values["ConfigDevice"]])
+    out.appendRow(["WriterServer", values["WriterDevice"]])
     return out
 
 
@@ -1002,7 +1889,8 @@ def printConfDict(mcr, name, decode=True, label=None, out=None):
 
     if not hasattr(mcr, "selector"):
         set_selector(mcr)
-    conf = json.loads(mcr.selector.profileConfiguration)
+    with phase(mcr, "read"):
+        conf = json.loads(mcr.selector.profileConfiguration)
 
     title = "%s" % (name if label is None else label)
     try:
@@ -1028,7 +1916,8 @@ def printConfList(mcr, name, decode=True, label=None, out=None):
 
     if not hasattr(mcr, "selector"):
         set_selector(mcr)
-    conf = json.loads(mcr.selector.profileConfiguration)
+    with phase(mcr, "read"):
+        conf = json.loads(mcr.selector.profileConfiguration)
 
     title = "%s" % (name if label is None else label)
     try:
@@ -1142,22 +2031,46 @@ def printTable(mcr, lst):
 
 
 def set_selector(mcr):
-    """ Set the current selector server """
-    db = PyTango.Database()
+    """ Set the current selector server.
+        The proxy and the version are cached per server and reused
+        as long as the server answers to ping()
+    """
+    with phase(mcr, "set_selector"):
+        return _set_selector(mcr)
+
+
+def _set_selector(mcr):
     try:
         servers = [mcr.getEnv("NeXusSelectorDevice")]
     except Exception as e:
         mcr.debug(str(e))
-        servers = db.get_device_exported_for_class(
-            "NXSRecSelector").value_string
+        if not ExportedSelectors:
+            db = PyTango.Database()
+            ExportedSelectors.extend(db.get_device_exported_for_class(
+                "NXSRecSelector").value_string)
+        servers = list(ExportedSelectors)
 
     if servers and servers[0] != 'module':
-        mcr.selector = PyTango.DeviceProxy(str(servers[0]))
+        name = str(servers[0])
+        if name in SelectorProxies:
+            proxy, version = SelectorProxies[name]
+            try:
+                proxy.ping()
+            except Exception as e:
+                mcr.debug("Reconnecting to %s: %s" % (name, str(e)))
+                SelectorProxies.pop(name, None)
+                del ExportedSelectors[:]
+                return _set_selector(mcr)
+            mcr.selector = proxy
+            mcr.selector_version = version
+            return name
+        mcr.selector = PyTango.DeviceProxy(name)
         # to see other timeouts
         mcr.selector.set_timeout_millis(6000)
         mcr.selector.set_source(PyTango.DevSource.DEV)
         setversion(mcr)
-        return str(servers[0])
+        SelectorProxies[name] = (mcr.selector, mcr.selector_version)
+        return name
     else:
         from nxsrecconfig import Settings
         mcr.selector = Settings.Settings()
@@ -1171,21 +2084,85 @@ def setversion(mcr):
         mcr.selector_version = 1
 
 
-def _long_command(server, command, *var):
-    """ Excecutes a long command
+def _long_command(server, command, *var, **kwargs):
+    """ Excecutes a long command.
+        On a Tango proxy the command is executed asynchronously and
+        its reply is polled with an exponential backoff.
+
+    :param server: server instance
+    :type server: :class:`PyTango.DeviceProxy` \
+    or 'nxsrecconfig.Settings.Settings'
+    :param command: command name
+    :type command: :obj:`str`
+    :param kwargs: timeout: maximal waiting time in s,
+                   mcr: macro for progress messages
+    :returns: command result
+    :rtype: `any`
+    """
+    mcr = kwargs.get("mcr")
+    with phase(mcr, command):
+        if not hasattr(server, "command_inout_asynch"):
+            return _command(server, command, *var)
+        timeout = kwargs.get("timeout", LongCommandTimeout)
+        proxy = _long_command_proxy(server, timeout)
+        aid = proxy.command_inout_asynch(command, *var)
+        return _reply(proxy, aid, command, timeout, mcr)
+
+
+def _long_command_proxy(server, timeout):
+    """ returns a second proxy of the server whose Tango timeout
+        does not end the wait for the reply of a long command.
+        The shared proxy keeps its timeout, the doors of the
+        MacroServer may use it at the same time
+    """
+    names = [name for name, (proxy, _) in SelectorProxies.items()
+             if proxy is server]
+    key = (names[0] if names else server.name(), int(timeout * 1000))
+    proxy = LongCommandProxies.get(key)
+    if proxy is None:
+        proxy = PyTango.DeviceProxy(key[0])
+        proxy.set_timeout_millis(key[1])
+        proxy.set_source(PyTango.DevSource.DEV)
+        proxy = LongCommandProxies.setdefault(key, proxy)
+    return proxy
+
+
+def _reasons(error):
+    """ returns the reasons of a DevFailed exception """
+    return [getattr(err, "reason", "") for err in error.args]
+
+
+def _reply(proxy, aid, command, timeout, mcr=None):
+    """ polls the reply of an asynchronous command
+
+    :param proxy: server proxy
+    :type proxy: :class:`PyTango.DeviceProxy`
+    :param aid: id returned by command_inout_asynch
+    :param command: command name
+    :type command: :obj:`str`
+    :param timeout: maximal waiting time in s
+    :type timeout: :obj:`float`
+    :returns: command result
+    :rtype: `any`
     """
-    if hasattr(server, "command_inout_asynch"):
-        # aid = self.__dp.command_inout_asynch("PreselectComponents")
-        # _wait(self.__dp)
+    start = time.time()
+    report = start + ProgressInterval
+    delay = 0.01
+    while True:
         try:
-            _command(server, command, *var)
-        except PyTango.CommunicationFailed as e:
-            if e[-1].reason == "API_DeviceTimedOut":
-                _wait(server)
-            else:
+            return proxy.command_inout_reply(aid)
+        except PyTango.DevFailed as e:
+            if "API_AsynReplyNotArrived" not in _reasons(e):
                 raise
-    else:
-        _command(server, command, *var)
+        now = time.time()
+        if now - start > timeout:
+            raise Exception("%s: no reply from %s within %g s"
+                            % (command, proxy.name(), timeout))
+        if mcr is not None and now >= report:
+            mcr.output("Waiting for %s (%.0f s)" % (command, now - start))
+            report = now + ProgressInterval
+        time.sleep(delay)
+        delay = min(2 * delay, 1.)
 
 
 def _command(server, command, *var):
@@ -1208,59 +2185,207 @@ def _command(server, command, *var):
         return server.command_inout(command, *var)
 
 
-def _wait(proxy, counter=100):
-    """ waits for server until server is not in running state
+@contextlib.contextmanager
+def phase(mcr, name):
+    """ Record the duration of the enclosed selector operation
+        in PhaseTimings, under the name of the running macro
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        if mcr is not None:
+            PhaseTimings.append(
+                (start, _macro_name(mcr), name, time.time() - start))
+
+
+def _macro_name(mcr):
+    try:
+        return str(mcr.getName())
+    except Exception:
+        return type(mcr).__name__
 
-    :param proxy: server proxy
-    :type proxy: :class:`PyTango.DeviceProxy`
-    :param counter: maximum waiting timer in 0.01 sec
-                    (without command execution)
-    :type counter: :obj:`int`
+
+def _percentile(values, percent):
+    """ nearest-rank percentile of the sorted values """
+    index = int(math.ceil(percent / 100. * len(values))) - 1
+    return values[max(0, min(len(values) - 1, index))]
+
+
+def profile_fingerprint(mntgrp, cnf):
+    """ stable hash over the mntgrp name and the profile configuration,
+        the JSON-encoded values are compared decoded
     """
-    found = False
-    cnt = 0
-    while not found and cnt < counter:
-        if cnt > 1:
-            time.sleep(0.01)
+    profile = {}
+    for key, value in cnf.items():
         try:
-            if proxy.state() != PyTango.DevState.RUNNING:
-                found = True
-        except (PyTango.DevFailed, PyTango.Except, PyTango.DevError):
-            time.sleep(0.01)
-            found = False
-            if cnt == counter - 1:
-                raise
-        cnt += 1
+            profile[key] = json.loads(value)
+        except (TypeError, ValueError):
+            profile[key] = value
+    return hashlib.sha1(json.dumps(
+        [str(mntgrp), profile], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _selector_name(selector):
+    if isinstance(selector, PyTango.DeviceProxy):
+        return str(selector.name())
+    return "module"
 
 
-def update_configuration(mcr):
-    """ Synchonize profile with mntgrp """
+def _is_mntgrp_updated(selector):
+    """ True if the selector reports the MntGrp as synchronized """
+    try:
+        return bool(_command(selector, "isMntGrpUpdated"))
+    except Exception:
+        return False
+
+
+def update_configuration(mcr, force=False, cnf=None, mntgrp=None):
+    """ Synchonize profile with mntgrp.
+        The synchronization is skipped, if the profile did not change
+        since the last one and the MntGrp is still up to date.
+        cnf: the decoded profileConfiguration, if already known
+        mntgrp: the profile name, if already known
+        returns True if the MntGrp has been synchronized
+    """
+    name = _selector_name(mcr.selector)
+    if cnf is None or mntgrp is None:
+        with phase(mcr, "read"):
+            if mntgrp is None:
+                mntgrp = mcr.selector.mntgrp
+            if cnf is None:
+                cnf = json.loads(mcr.selector.profileConfiguration)
+    fingerprint = profile_fingerprint(mntgrp, cnf)
+    if not force and SyncedProfiles.get(name) == fingerprint \
+            and _is_mntgrp_updated(mcr.selector):
+        mcr.debug("Profile unchanged, MntGrp is not updated")
+        return False
+    SyncedProfiles.pop(name, None)
     # if hasattr(mcr.selector, "updateProfile"):
     #     _long_command(mcr.selector, "updateProfile")
     # else:
-    _long_command(mcr.selector, "updateMntGrp")
-    _long_command(mcr.selector, "importMntGrp")
+    _long_command(mcr.selector, "updateMntGrp", mcr=mcr)
+    _long_command(mcr.selector, "importMntGrp", mcr=mcr)
     if not isinstance(mcr.selector, PyTango.DeviceProxy):
-        mcr.selector.exportEnvProfile()
+        with phase(mcr, "exportEnvProfile"):
+            mcr.selector.exportEnvProfile()
+    with phase(mcr, "read"):
+        SyncedProfiles[name] = profile_fingerprint(
+            mcr.selector.mntgrp,
+            json.loads(mcr.selector.profileConfiguration))
+    return True
+
+
+def profile_cache_dir(mcr):
+    """ The snapshot directory is given by the environment variable
+        NeXusProfileCacheDir, default: ~/.sardana/nxsprofile_cache
+    """
+    try:
+        return mcr.getEnv("NeXusProfileCacheDir")
+    except Exception:
+        return os.path.join(os.path.expanduser("~"), ".sardana",
+                            "nxsprofile_cache")
 
 
-def update_description(mcr):
-    """ Update selection of description components """
+def _snapshot_prefix(mcr):
+    return re.sub(r"[^\w.]", "_", _selector_name(mcr.selector)) + "-"
+
+
+def _snapshot_file(mcr, name):
+    return os.path.join(
+        profile_cache_dir(mcr), "%s%s.json.gz" % (
+            _snapshot_prefix(mcr), re.sub(r"[^\w.]", "_", str(name))))
+
+
+def store_snapshot(mcr, values=None):
+    """ Store the current profile as a compressed snapshot together
+        with the fingerprint of the profile stored in the configuration
+        server, which tells 'nxsfastprof' whether it is still valid.
+        values: MntGrp, ProfileConfiguration and optionally
+        ConfigDevice, if already read
+    """
+    if values is None:
+        values = read_selector(
+            mcr, ["MntGrp", "ProfileConfiguration", "ConfigDevice"], [])
+    snapshot = {"mntgrp": str(values["MntGrp"]),
+                "cnf": json.loads(values["ProfileConfiguration"]),
+                "stored": stored_fingerprint(
+                    mcr, values["MntGrp"], values.get("ConfigDevice"))}
+    fileName = _snapshot_file(mcr, snapshot["mntgrp"])
+    try:
+        if not os.path.isdir(os.path.dirname(fileName)):
+            os.makedirs(os.path.dirname(fileName))
+        with gzip.open(fileName + ".tmp", "wb") as fd:
+            fd.write(json.dumps(snapshot).encode("utf-8"))
+        os.rename(fileName + ".tmp", fileName)
+    except (IOError, OSError) as e:
+        mcr.warning("Profile snapshot not stored: %s" % str(e))
+
+
+def load_snapshot(mcr, name):
+    """ Return the snapshot {'mntgrp': name, 'cnf': profile
+        configuration, 'stored': fingerprint} of the given profile
+        or None
+    """
     try:
-        mcr.selector.preselectComponents()
-    except PyTango.CommunicationFailed as e:
-        if e[-1].reason == "API_DeviceTimedOut":
-            wait_for_device(mcr.selector)
+        with gzip.open(_snapshot_file(mcr, name), "rb") as fd:
+            return json.loads(fd.read().decode("utf-8"))
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def list_snapshots(mcr):
+    """ Return [(profile name, time, size)] of the snapshots of
+        the current selector, without reading them
+    """
+    cacheDir = profile_cache_dir(mcr)
+    if not os.path.isdir(cacheDir):
+        return []
+    prefix = _snapshot_prefix(mcr)
+    snapshots = []
+    for fileName in sorted(os.listdir(cacheDir)):
+        if fileName.startswith(prefix) and fileName.endswith(".json.gz"):
+            stat = os.stat(os.path.join(cacheDir, fileName))
+            snapshots.append((fileName[len(prefix):-len(".json.gz")],
+                              stat.st_mtime, stat.st_size))
+    return snapshots
+
+
+def profile_diff(cnf, other):
+    """ Compare two profile configurations.
+        Returns {key: [(label, value, other value)]} of the differing
+        keys, the selections are compared name by name
+    """
+    diff = {}
+    for key in sorted(set(cnf) | set(other)):
+        if cnf.get(key) == other.get(key):
+            continue
+        try:
+            first = json.loads(cnf.get(key) or "null")
+            second = json.loads(other.get(key) or "null")
+        except (TypeError, ValueError):
+            first, second = cnf.get(key), other.get(key)
+        if first == second:
+            continue
+        if key in SelectionKeys and isinstance(first or {}, dict) \
+                and isinstance(second or {}, dict):
+            first, second = first or {}, second or {}
+            rows = [(name, first.get(name, Nothing),
+                     second.get(name, Nothing))
+                    for name in sorted(set(first) | set(second))
+                    if first.get(name) != second.get(name)]
         else:
-            raise
+            rows = [("", first, second)]
+        if rows:
+            diff[key] = rows
+    return diff
+
+
+def update_description(mcr):
+    """ Update selection of description components """
+    _long_command(mcr.selector, "preselectComponents", mcr=mcr)
 
 
 def reset_descriptive_components(mcr):
     """ Reset selection of description components """
-    try:
-        mcr.selector.resetPreselectedComponents()
-    except PyTango.CommunicationFailed as e:
-        if e[-1].reason == "API_DeviceTimedOut":
-            wait_for_device(mcr.selector)
-        else:
-            raise
+    _long_command(mcr.selector, "resetPreselectedComponents", mcr=mcr)
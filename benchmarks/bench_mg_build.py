@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark: building the configuration of a MG with
+1000 channels, for the D8 and the D9 schema
+
+  python bench_mg_build.py [nChannels] [repetitions]
+
+The time covers MgConf.addChannels() only, the pool lists
+are read before.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import simpool
+
+
+def main():
+    nChannels = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print("%-8s %10s %14s" % ("schema", "channels", "time/ms"))
+    stdout = sys.stdout
+    for schema in ["D8", "D9"]:
+        simpool.newMg[0] = (schema == "D9")
+        pool = simpool.SimPool(nChannels=nChannels)
+        mg_macros = simpool.loadMgMacros(pool)
+        specs = [("exp_t01", 'timer', 0, 1)]
+        specs.extend([("exp_c%02d" % (i + 1), 'counter', 1, 1)
+                      for i in range(nChannels - 1)])
+        elapsed = []
+        for i in range(repetitions):
+            conf = mg_macros.MgConf(pool.name, "mg_build", True)
+            sys.stdout = open("/dev/null", "w")
+            try:
+                startTime = time.time()
+                conf.addChannels(specs)
+                elapsed.append(time.time() - startTime)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+        print("%-8s %10d %14.2f" % (schema, nChannels,
+                                    min(elapsed) * 1000.))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""
+Benchmark: MgConf, change_mg and delete_mg against the simulated Pool
+at 100, 1000 and 5000 channels
+
+  python bench_mg_harness.py [-n 100,1000,5000] [-l read,command,connect]
+                             [--no-store]
+
+Every run is appended as one JSON line to results/mg_harness.jsonl,
+tagged with the release from setup.py, so that the MG switching time
+can be compared release over release:
+
+  python bench_mg_harness.py --compare
+
+Workloads, the MG contains a timer and all counters of the pool:
+  mgconf        MgConf filled with addChannels(), one Configuration write
+  change_mg     change_mg with an empty MgConf cache
+  change_mg_hit the same change_mg again, cache hit and no write
+  change_mg_miss the same change_mg with an empty cache, no write
+  change_mg_alt alternating between the full and the half setup
+  delete_mg     delete_mg of the MG
+  change_mg_sca a MG with 2 counters and 32 SCAs of 4 MCAs, the SCAs
+                exist, empty cache: the MCAs are connected to check
+                the ROIs against their DataLength
+  change_mg_sca_hit the same change_mg again, cache hit
+
+The cache pays off where building the MG needs device I/O, compare
+change_mg_sca and change_mg_sca_hit with connect/read latency, e.g.
+  python bench_mg_harness.py -l 0.001,0.001,0.005
+"""
+
+from __future__ import print_function
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import simpool
+
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       "results", "mg_harness.jsonl")
+
+
+def getRelease():
+    with open(os.path.join(TOP, "setup.py")) as f:
+        match = re.search(r'release\s*=\s*"([^"]+)"', f.read())
+    return match.group(1) if match else "unknown"
+
+
+def measure(pool, mg, func):
+    """
+    returns {time, reads, commands, writes} of func(),
+    the output of the macros is discarded
+    """
+    reads, commands = pool.reads, pool.commands
+    writes = mg.writes if mg is not None else 0
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    startTime = time.time()
+    try:
+        func()
+    finally:
+        elapsed = time.time() - startTime
+        sys.stdout.close()
+        sys.stdout = stdout
+    return {"time": round(elapsed, 6),
+            "reads": pool.reads - reads,
+            "commands": pool.commands - commands,
+            "writes": (mg.writes - writes) if mg is not None else 0}
+
+
+def runSize(nChannels):
+    pool = simpool.SimPool(nChannels=nChannels,
+                           name="pool/harness/%d" % nChannels)
+    mg_macros = simpool.loadMgMacros(pool)
+    mg_macros.mgPoolIndex.invalidate()
+    counters = ["exp_c%02d" % (i + 1) for i in range(nChannels)]
+    cacheDir = tempfile.mkdtemp(prefix="mgconf_cache_")
+    env = {"MgConfCacheDir": cacheDir}
+    results = {}
+    try:
+        pool.CreateMeasurementGroup(["mg_conf", "exp_t01"])
+
+        def mgconf():
+            conf = mg_macros.MgConf(pool.name, "mg_conf", True)
+            specs = [("exp_t01", 'timer', 0, 1)]
+            specs.extend([(c, 'counter', 1, 1) for c in counters])
+            conf.addChannels(specs)
+            conf.updateConfiguration()
+        results["mgconf"] = measure(
+            pool, simpool.DeviceProxy("mg_conf"), mgconf)
+
+        def changeMg(elements):
+            return lambda: simpool.runMacro(
+                mg_macros.change_mg, [pool], env,
+                [["-g", "mg_harness"], ["-t", "exp_t01"],
+                 ["-c", ",".join(elements)]])
+        pool.CreateMeasurementGroup(["mg_harness", "exp_t01"])
+        mg_macros.mgPoolIndex.invalidate()
+        mg = simpool.DeviceProxy("mg_harness")
+        results["change_mg"] = measure(pool, mg, changeMg(counters))
+        results["change_mg_hit"] = measure(pool, mg, changeMg(counters))
+
+        def emptyCache(elements):
+            def func():
+                shutil.rmtree(cacheDir, ignore_errors=True)
+                changeMg(elements)()
+            return func
+        results["change_mg_miss"] = measure(pool, mg, emptyCache(counters))
+        half = counters[:max(1, nChannels // 2)]
+
+        def alternate():
+            for elements in [half, counters] * 5:
+                changeMg(elements)()
+        results["change_mg_alt"] = measure(pool, mg, alternate)
+        results["delete_mg"] = measure(
+            pool, None, lambda: simpool.runMacro(
+                mg_macros.delete_mg, [pool], env, "mg_harness"))
+
+        scas = counters[:2] + ["sca_exp_mca%02d_%d_%d" % (
+            1 + i % 4, 10 * i, 10 * i + 5) for i in range(32)]
+        pool.CreateMeasurementGroup(["mg_harness", "exp_t01"])
+        mg_macros.mgPoolIndex.invalidate()
+        mg = simpool.DeviceProxy("mg_harness")
+        # creates the SCAs
+        measure(pool, mg, changeMg(scas))
+        results["change_mg_sca"] = measure(pool, mg, emptyCache(scas))
+        results["change_mg_sca_hit"] = measure(pool, mg, changeMg(scas))
+    finally:
+        shutil.rmtree(cacheDir, ignore_errors=True)
+    return results
+
+
+def compare(fileName):
+    """
+    prints the mean time per workload and channel count for each release
+    and latency (read,command,connect)
+    """
+    table = {}
+    with open(fileName) as f:
+        for line in f:
+            record = json.loads(line)
+            for workload, dct in record["results"].items():
+                latency = ",".join("%g" % record["latency"][kind] for kind
+                                   in ["read", "command", "connect"])
+                key = (record["release"], latency, record["channels"],
+                       workload)
+                table.setdefault(key, []).append(dct["time"])
+    print("%-10s %-16s %8s %-17s %10s %5s" %
+          ("release", "latency", "channels", "workload", "time/s", "runs"))
+    for key in sorted(table):
+        times = table[key]
+        print("%-10s %-16s %8d %-17s %10.4f %5d" %
+              (key + (sum(times) / len(times), len(times))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--channels", default="100,1000,5000",
+                        help="comma separated channel counts")
+    parser.add_argument("-l", "--latency", default="0,0,0",
+                        help="read,command,connect latency/s per call")
+    parser.add_argument("-o", "--output", default=RESULTS,
+                        help="results file, JSON lines")
+    parser.add_argument("--no-store", action="store_true",
+                        help="do not append the results")
+    parser.add_argument("--compare", action="store_true",
+                        help="summarize the stored results")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.output)
+        return
+
+    for kind, value in zip(["read", "command", "connect"],
+                           args.latency.split(",")):
+        simpool.latency[kind] = float(value)
+    release = getRelease()
+    print("%8s %-17s %10s %6s %8s %6s" %
+          ("channels", "workload", "time/s", "reads", "commands", "writes"))
+    for nChannels in [int(n) for n in args.channels.split(",")]:
+        results = runSize(nChannels)
+        for workload in ["mgconf", "change_mg", "change_mg_hit",
+                         "change_mg_miss", "change_mg_alt", "delete_mg",
+                         "change_mg_sca", "change_mg_sca_hit"]:
+            dct = results[workload]
+            print("%8d %-17s %10.4f %6d %8d %6d" %
+                  (nChannels, workload, dct["time"], dct["reads"],
+                   dct["commands"], dct["writes"]))
+        if args.no_store:
+            continue
+        if not os.path.isdir(os.path.dirname(args.output)):
+            os.makedirs(os.path.dirname(args.output))
+        with open(args.output, "a") as f:
+            f.write(json.dumps({
+                "release": release,
+                "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "latency": dict(simpool.latency),
+                "channels": nChannels,
+                "results": results}, sort_keys=True) + "\n")
+
+
+if __name__ == "__main__":
+    main()
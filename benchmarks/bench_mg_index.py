@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Benchmark: finding the pool of a MG, linear scan of the
+MeasurementGroupList of all pools against the shared MgPoolIndex
+
+  python bench_mg_index.py [nPools] [nMgsPerPool]
+
+Every lookup of the linear scan reads and decodes the
+MeasurementGroupList of all pools, the index reads the list of the
+pool of the MG only, to check that the MG is still there.
+"""
+
+from __future__ import print_function
+import sys
+import json
+import time
+import simpool
+
+
+class Macro(object):
+    def __init__(self, pools):
+        self.pools = pools
+
+    def getPools(self):
+        return self.pools
+
+
+def linearScan(macro, mgName):
+    pool = None
+    for tmp_pool in macro.getPools():
+        for mg in tmp_pool.MeasurementGroupList:
+            hsh = json.loads(mg)
+            if mgName == hsh["name"]:
+                pool = tmp_pool
+    return pool
+
+
+def main():
+    nPools = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    nMgs = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    pools = []
+    for i in range(nPools):
+        pool = simpool.SimPool(nChannels=10, name="pool/sim/%02d" % i)
+        for j in range(nMgs):
+            pool.CreateMeasurementGroup(["mg_%02d_%03d" % (i, j), "exp_t01"])
+        pools.append(pool)
+    mg_macros = simpool.loadMgMacros()
+    macro = Macro(pools)
+    names = ["mg_%02d_%03d" % (i % nPools, (7 * i) % nMgs)
+             for i in range(200)]
+
+    print("%d pools, %d MGs each, %d lookups" % (nPools, nMgs, len(names)))
+    print("%-12s %10s %12s" % ("method", "time/ms", "list reads"))
+    for label, func in [("linear scan", linearScan),
+                        ("index", mg_macros.mgPoolIndex.getPool)]:
+        reads = sum([pool.reads for pool in pools])
+        startTime = time.time()
+        for name in names:
+            assert func(macro, name).name == "pool/sim/" + name[3:5]
+        elapsed = time.time() - startTime
+        print("%-12s %10.2f %12d" %
+              (label, elapsed * 1000.,
+               sum([pool.reads for pool in pools]) - reads))
+
+
+if __name__ == "__main__":
+    main()
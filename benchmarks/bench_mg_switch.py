@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Benchmark: repeated change_mg calls with and without the
+diff-aware Configuration write
+
+  python bench_mg_switch.py [writeLatency/s]
+
+Two workloads, 20 calls each: the same setup before every sub-scan
+and alternating between two setups. writeLatency (default 0.05 s)
+simulates the reconfiguration of the MG by the pool.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import simpool
+
+SETUPS = {
+    "A": ["exp_c%02d" % i for i in range(1, 17)],
+    "B": ["exp_c%02d" % i for i in range(9, 33)],
+}
+
+
+def changeMg(mg_macros, pool, counters, force):
+    conf = mg_macros.MgConf(pool.name, "mg_switch", True)
+    conf.addTimer("exp_t01")
+    for elem in counters:
+        conf.addCounter(elem, 1, 1)
+    conf.updateConfiguration(force=force)
+
+
+def run(mg_macros, pool, sequence, force):
+    mg = simpool.DeviceProxy("mg_switch")
+    writes = mg.writes
+    startTime = time.time()
+    for key in sequence:
+        changeMg(mg_macros, pool, SETUPS[key], force)
+    return time.time() - startTime, mg.writes - writes
+
+
+def main():
+    simpool.SimMg.writeLatency = \
+        float(sys.argv[1]) if len(sys.argv) > 1 else 0.05
+    pool = simpool.SimPool(nChannels=900)
+    mg_macros = simpool.loadMgMacros(pool)
+    pool.CreateMeasurementGroup(["mg_switch", "exp_t01"])
+    workloads = [("same setup", "A" * 20), ("alternating", "AB" * 10)]
+    print("%-12s %-12s %10s %8s" % ("workload", "write", "time/s", "writes"))
+    stdout = sys.stdout
+    for name, sequence in workloads:
+        for label, force in [("always", True), ("diff-aware", False)]:
+            sys.stdout = open("/dev/null", "w")
+            try:
+                elapsed, writes = run(mg_macros, pool, sequence, force)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            print("%-12s %-12s %10.3f %8d" % (name, label, elapsed, writes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Benchmark: time to build a change_mg configuration with MgConf
+against the number of channels in the pool
+
+  python bench_mgconf.py [nCounters]
+
+The configuration is built like 'change_mg -t exp_t01 -c ...' does it,
+with nCounters counters (default 60). Pool attribute reads are counted.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import simpool
+
+
+def buildConfiguration(mg_macros, pool, nCounters):
+    conf = mg_macros.MgConf(pool.name, "mg_bench", True)
+    conf.addTimer("exp_t01")
+    for i in range(nCounters):
+        conf.addCounter("exp_c%02d" % (i + 1), 1, 1)
+    conf.updateConfiguration()
+    return conf
+
+
+def main():
+    nCounters = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    print("%10s %10s %12s %12s" %
+          ("channels", "counters", "time/ms", "pool reads"))
+    for nChannels in [100, 300, 900, 3000]:
+        pool = simpool.SimPool(nChannels=max(nChannels, nCounters))
+        mg_macros = simpool.loadMgMacros(pool)
+        #
+        # suppress the 'adding index' messages
+        #
+        stdout = sys.stdout
+        sys.stdout = open("/dev/null", "w")
+        try:
+            startTime = time.time()
+            buildConfiguration(mg_macros, pool, nCounters)
+            elapsed = time.time() - startTime
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        print("%10d %10d %12.2f %12d" % (nChannels, nCounters,
+                                         elapsed * 1000., pool.reads))
+
+
+if __name__ == "__main__":
+    main()
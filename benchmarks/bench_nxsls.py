@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Benchmark: name filtering of nxsls with fnmatch per device-group pattern
+and fresh name lists against compiled group patterns and the cached
+name index
+
+  python bench_nxsls.py [latency/s]
+
+10 nxsls calls (device types and name patterns) with 10k and 100k
+datasources; latency (default 0.005 s) is the round-trip time of
+each selector call.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import fnmatch
+import fakeselector
+
+QUERIES = ["counter", "timers", "mca", "exp_c1", "ds0001",
+           "counter", "timer", "motor", "ds09", ""]
+
+
+def legacyFilterSet(nxs, mcr, comps, dev_type):
+    """ the previous nxsls._filterSet() """
+    available = set()
+    groups = nxs.device_groups(mcr)
+    if dev_type:
+        if dev_type not in groups.keys() and \
+                dev_type[-1] == 's' and dev_type[:-1] in groups.keys():
+            dev_type = dev_type[:-1]
+        if dev_type in groups.keys():
+            for gr in groups[dev_type]:
+                available.update(fnmatch.filter(comps, gr))
+        else:
+            available.update(fnmatch.filter(comps, "*%s*" % dev_type))
+    else:
+        available.update(comps)
+    return available
+
+
+def legacy(nxs, mcr, dev_type):
+    adss = set(mcr.selector.availableDataSources())
+    pchs = set(mcr.selector.poolElementNames('ExpChannelList'))
+    acps = set(mcr.selector.availableComponents())
+    return [legacyFilterSet(nxs, mcr, names, dev_type)
+            for names in [adss, pchs, acps]]
+
+
+def indexed(nxs, mcr, dev_type):
+    patterns = nxs.group_patterns(mcr)
+    return [nxs.filter_names(names, dev_type, patterns)
+            for names in nxs.name_index(mcr)]
+
+
+def main():
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.005
+    print("%8s %-8s %10s %8s" % ("names", "path", "time/s", "calls"))
+    for nNames in [10000, 100000]:
+        selector = fakeselector.FakeSelector(
+            nComponents=nNames // 10, nDataSources=nNames, nChannels=500)
+        nxs = fakeselector.loadNxsMacros(selector)
+        mcr = fakeselector.MacroContext()
+        nxs.set_selector(mcr)
+        nxs.NameIndex.clear()
+        nxs.GroupPatterns.clear()
+        selector.latency = latency
+        results = {}
+        for label, func in [("legacy", legacy), ("indexed", indexed)]:
+            calls = selector.roundTrips()
+            startTime = time.time()
+            results[label] = [func(nxs, mcr, query) for query in QUERIES]
+            print("%8d %-8s %10.3f %8d" % (
+                nNames, label, time.time() - startTime,
+                selector.roundTrips() - calls))
+        if results["legacy"] != results["indexed"]:
+            print("the filtered names differ")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
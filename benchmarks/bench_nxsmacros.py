@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+Benchmark: round trips and time of every nxs macro against the fake
+selector, compared with the stored round trips of each macro
+
+  python bench_nxsmacros.py [-n 500,5000,100] [-l 0.0]
+                            [-c updatemntgrp=0.5,importmntgrp=0.2]
+                            [--update]
+
+The macros run one after the other on one selector, in the order of
+WORKLOADS, so that the caches of nxsmacros are warmed up as in a
+session. A macro needing more selector calls than stored in
+results/nxs_roundtrips.json is reported as a regression and the exit
+status is 1; --update stores the current round trips instead.
+
+nxselector and nxsmacrogui start GUI processes and are not run.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import fakeselector
+
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       "results", "nxs_roundtrips.json")
+
+#: (label, macro, arguments)
+WORKLOADS = [
+    ("nxsprof", "nxsprof", []),
+    ("nxsprof_again", "nxsprof", []),
+    ("lsprof", "lsprof", []),
+    ("nxslscp", "nxslscp", []),
+    ("nxslsds", "nxslsds", []),
+    ("nxslsprof", "nxslsprof", []),
+    ("nxslstimers", "nxslstimers", []),
+    ("nxslsdevtype", "nxslsdevtype", []),
+    ("nxsls", "nxsls", ["", False]),
+    ("nxsls_counter", "nxsls", ["counter", False]),
+    ("nxsls_refresh", "nxsls", ["ds0001", True]),
+    ("nxshow", "nxshow", [["cp00000", "ds00001", "exp_c01"]]),
+    ("nxsimportmg", "nxsimportmg", []),
+    ("nxsetprof", "nxsetprof", [""]),
+    ("nxsetprof_name", "nxsetprof", ["mg_fake2"]),
+    ("nxsettimers", "nxsettimers", [["exp_t01", "exp_t02"]]),
+    ("nxsadd", "nxsadd", [["cp00001", "cp00003"]]),
+    ("nxsetorder", "nxsetorder", [["exp_c02", "exp_c01"]]),
+    ("nxset", "nxset", [["exp_t01", "cp00002", "exp_c03"]]),
+    ("nxsdel", "nxsdel", [["cp00002"]]),
+    ("nxsrm", "nxsrm", [["cp00004"]]),
+    ("nxsadddesc", "nxsadddesc", [["cp00005", "cp00007"]]),
+    ("nxsdeldesc", "nxsdeldesc", [["cp00005"]]),
+    ("nxsrmdesc", "nxsrmdesc", [["cp00007"]]),
+    ("nxsetappentry", "nxsetappentry", [True]),
+    ("nxsetudata", "nxsetudata", ["sample", "bench"]),
+    ("nxsusetudata", "nxsusetudata", [["sample"]]),
+    ("nxsetudatas", "nxsetudatas", [[["title", "bench"],
+                                     ["sample_name", "s1"],
+                                     ["chemical_formula", "Fe2O3"]]]),
+    ("nxsudatafile", "nxsudatafile", ["{tmp}/samples.csv", ""]),
+    ("nxsudatafile_next", "nxsudatafile", ["", ""]),
+    ("nxsbatch", "nxsbatch", [["nxsadd cp00009", "nxsetudata title batch",
+                               "nxsadddesc cp00011"]]),
+    ("nxsclr", "nxsclr", []),
+    ("nxsupdatedesc", "nxsupdatedesc", []),
+    ("nxsresetdesc", "nxsresetdesc", []),
+    ("nxsprobe", "nxsprobe", ["", 100., 1.]),
+    ("nxsave", "nxsave", ["{tmp}/profile.json"]),
+    ("nxsload", "nxsload", ["{tmp}/profile.json"]),
+    ("nxslscachedprof", "nxslscachedprof", []),
+    ("nxsdiffprof", "nxsdiffprof", ["mg_fake2", ""]),
+    ("nxsfastprof", "nxsfastprof", ["mg_fake"]),
+    ("nxsfastprof_back", "nxsfastprof", ["mg_fake2"]),
+    ("nxsrmprof", "nxsrmprof", ["mg_fake2"]),
+    ("nxsrmallprof", "nxsrmallprof", [False]),
+    ("nxstiming", "nxstiming", ["", False]),
+]
+
+
+def run(args, tmpdir):
+    """
+    returns {label: {time, calls, polls}} of WORKLOADS
+    """
+    nComponents, nDataSources, nChannels = [
+        int(n) for n in args.sizes.split(",")]
+    selector = fakeselector.FakeSelector(
+        nComponents=nComponents, nDataSources=nDataSources,
+        nChannels=nChannels)
+    for item in filter(None, args.commands.split(",")):
+        command, latency = item.split("=")
+        selector.commandLatency[command.lower()] = float(latency)
+    for name in selector._datasources:
+        selector.devices["fakehost:10000/p00/fake/%s" % name] = \
+            args.device_latency
+    for name in selector._channels:
+        selector.devices["tango://fakehost:10000/expchan/fake/%s" % name] = \
+            args.device_latency
+    nxs = fakeselector.loadNxsMacros(selector)
+    selector.latency = args.latency
+    env = {"ActiveMntGrp": "mg_fake", "NeXusProfileCacheDir": tmpdir}
+    results = {}
+    for label, name, params in WORKLOADS:
+        params = [p.format(tmp=tmpdir) if isinstance(p, str) else p
+                  for p in params]
+        calls, polls = selector.roundTrips(), selector.polls
+        startTime = time.time()
+        fakeselector.runMacro(nxs, name, env, *params)
+        results[label] = {
+            "time": round(time.time() - startTime, 6),
+            "calls": selector.roundTrips() - calls,
+            "polls": selector.polls - polls}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--sizes", default="500,5000,100",
+                        help="components,datasources,channels")
+    parser.add_argument("-l", "--latency", type=float, default=0.,
+                        help="latency/s of each selector call")
+    parser.add_argument("-c", "--commands", default="",
+                        help="comma separated command=latency/s, "
+                        "execution time of single commands")
+    parser.add_argument("-d", "--device-latency", type=float,
+                        default=0., help="read latency/s of the datasources")
+    parser.add_argument("-o", "--output", default=RESULTS,
+                        help="stored round trips, JSON")
+    parser.add_argument("--update", action="store_true",
+                        help="store the current round trips")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="nxsmacros_")
+    with open(os.path.join(tmpdir, "samples.csv"), "w") as f:
+        f.write("sample_name,title,chemical_formula\n"
+                "s1,first,Fe2O3\ns2,second,NaCl\n")
+    try:
+        results = run(args, tmpdir)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    stored = {}
+    if os.path.isfile(args.output):
+        with open(args.output) as f:
+            stored = json.load(f)
+    regressions = []
+    print("%-18s %10s %6s %6s %8s" %
+          ("macro", "time/s", "calls", "polls", "stored"))
+    for label, _, _ in WORKLOADS:
+        dct = results[label]
+        print("%-18s %10.4f %6d %6d %8s" %
+              (label, dct["time"], dct["calls"], dct["polls"],
+               stored.get(label, "-")))
+        if label in stored and dct["calls"] > stored[label]:
+            regressions.append(label)
+
+    if args.update:
+        if not os.path.isdir(os.path.dirname(args.output)):
+            os.makedirs(os.path.dirname(args.output))
+        with open(args.output, "w") as f:
+            json.dump(dict((label, dct["calls"])
+                           for label, dct in results.items()),
+                      f, indent=1, sort_keys=True)
+            f.write("\n")
+    elif regressions:
+        print("\nmore round trips than stored: %s" % ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
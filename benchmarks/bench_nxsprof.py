@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Benchmark: the profile table of nxsprof, built attribute by attribute
+as before and from one read_attributes call with concurrent commands
+
+  python bench_nxsprof.py [latency/s]
+
+latency (default 0.01 s) is the round-trip time of each selector call.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import fakeselector
+
+
+def legacyProfile(nxs, mcr, server):
+    """ the previous printProfile(), one call per row """
+    out = nxs.List(["Profile (MntGrp): %s"
+                    % str(nxs.getString(mcr, "MntGrp")), ""],
+                   text_alignment=(nxs.Right, nxs.Right),
+                   max_col_width=(-1, 60),)
+    nxs.printConfList(mcr, "Timer", True, "Timer(s)", out=out)
+    nxs.printList(mcr, "SelectedComponents", False, "Detector Components",
+                  True, out=out)
+    nxs.printList(mcr, "SelectedDataSources", False, "", True, out=out)
+    nxs.mergeLastTwoRows(out)
+    nxs.printList(mcr, "PreselectedComponents", False,
+                  "Descriptive Components", True, out=out)
+    if mcr.selector_version <= 2:
+        nxs.printConfList(mcr, "InitDataSources", True, "", out=out)
+    else:
+        nxs.printList(mcr, "PreselectedDataSources", False, "", True,
+                      out=out)
+    nxs.mergeLastTwoRows(out)
+    nxs.printList(mcr, "MandatoryComponents", False,
+                  "Mandatory Components", True, out=out)
+    nxs.printDict(mcr, "UserData", True, "User Data", out=out)
+    nxs.printString(mcr, "AppendEntry", out=out)
+    out.append(["SelectorServer", str(server)])
+    nxs.printString(mcr, "ConfigDevice", "ConfigServer", out=out)
+    nxs.printString(mcr, "WriterDevice", "WriterServer", out=out)
+    return out
+
+
+def measure(selector, func):
+    calls = selector.roundTrips()
+    startTime = time.time()
+    out = func()
+    return time.time() - startTime, selector.roundTrips() - calls, out
+
+
+def main():
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.01
+    selector = fakeselector.FakeSelector(nComponents=500, nDataSources=5000)
+    nxs = fakeselector.loadNxsMacros(selector)
+    mcr = fakeselector.MacroContext()
+    server = nxs.set_selector(mcr)
+    selector.latency = latency
+
+    print("%-10s %10s %8s" % ("path", "time/s", "calls"))
+    results = {}
+    for label, func in [
+            ("legacy", lambda: legacyProfile(nxs, mcr, server)),
+            ("bulk", lambda: nxs.printProfile(mcr, server))]:
+        elapsed, calls, out = measure(selector, func)
+        results[label] = out.genOutput()
+        print("%-10s %10.3f %8d" % (label, elapsed, calls))
+    if results["legacy"] != results["bulk"]:
+        print("the profile tables differ")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
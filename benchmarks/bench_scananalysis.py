@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""
+Check of scananalysis.scanAnalysis() on reference scans: a peak, a dip,
+a slit and a step, without and with noise, with a NaN point and with
+decreasing x
+
+  python bench_scananalysis.py [--fast]
+
+Every mode of the family of a scan is compared with the true position
+and, if HasyUtils is installed, with HasyUtils.fastscananalysis().
+The allowed differences are given in units of the step width of the
+scan, ALLOWED below:
+
+  peak, dip, slit, step      1  the maximum is taken at a scan point,
+                                the slit between the steepest edges
+  cen, dipc, slitc, stepc    1  the FWHM is interpolated linearly
+  cms, dipm, slitm, stepm    3  the centre of mass of the points above
+                                1/3 depends on the background and on
+                                how the threshold is applied
+  *ssa                          as the modes above, the background is
+                                a line through the first and last points
+
+The exit code is 1, if a difference to the true position exceeds its
+limit. The differences to fastscananalysis() are listed and counted.
+
+Comparison with HasyUtils 2.22.0 (scipy 1.17.1), 96 modes of 16 scans,
+0 differences to the true positions above the limits:
+
+  within the limits       57
+  NaN from Hasy             3  cmsssa, dipmssa, stepmssa of the -nan scans
+  above the limits         12  slit, slitc, slitm of slit and slit-rev,
+                               fastscananalysis finds the falling edge
+                               (7.8-8.6 instead of 5.0); slit, slitc of
+                               slit-noise (2.8-2.9); cms of peak,
+                               peak-rev, peak-noise, all points enter
+                               the centre of mass (3.8-4.1 instead of
+                               3.2); stepm of step-noise (4.74 for 4.40)
+  no result from Hasy      24  slit*ssa of slit, slit-noise, slit-rev,
+                               all modes of the -nan scans except the
+                               *ssa modes of peak-nan, dip-nan, step-nan
+
+Therefore mvsa and createSaDct keep fastscananalysis(), scanAnalysis()
+is not a drop-in replacement. The reason codes of its 'ssa' dictionary
+are those of HasyUtils.ssa(), scananalysis.SSA_REASONS.
+--fast also times both functions for all modes of a scan, 9.9 ms
+and 22.5 ms with the versions above.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import numpy as np
+try:
+    import HasyUtils
+    hasFastScanAnalysis = hasattr(HasyUtils, "fastscananalysis")
+except ImportError:
+    hasFastScanAnalysis = False
+import scananalysis
+
+ALLOWED = {"peak": 1., "cen": 1., "cms": 3.,
+           "dip": 1., "dipc": 1., "dipm": 3.,
+           "slit": 1., "slitc": 1., "slitm": 3.,
+           "step": 1., "stepc": 1., "stepm": 3.}
+for _mode in list(ALLOWED):
+    ALLOWED[_mode + "ssa"] = ALLOWED[_mode]
+
+
+def referenceScans():
+    """
+    returns [(name, family, true position, x, y)]
+    """
+    rng = np.random.RandomState(4711)
+    x = np.linspace(0., 10., 101)
+    rising = 1. + np.exp(-(x - 2.5) * 8.)
+    falling = 1. + np.exp((x - 7.5) * 8.)
+    scans = [
+        ("peak", "peak", 3.2,
+         100. * np.exp(-(x - 3.2) ** 2 / 0.5) + 10. + 0.5 * x),
+        ("dip", "dip", 6.1,
+         200. - 80. * np.exp(-(x - 6.1) ** 2 / 0.3)),
+        ("slit", "slit", 5.,
+         80. / rising / falling + 1.),
+        ("step", "step", 4.4,
+         50. / (1. + np.exp(-(x - 4.4) * 5.)) + 5.),
+    ]
+    argout = []
+    for name, family, pos, y in scans:
+        argout.append((name, family, pos, x, y))
+        noisy = y + rng.normal(0., 0.01 * (y.max() - y.min()), len(y))
+        argout.append((name + "-noise", family, pos, x, noisy))
+        withNaN = y.copy()
+        withNaN[len(y) // 4] = np.nan
+        argout.append((name + "-nan", family, pos, x, withNaN))
+        #
+        # the same scan with decreasing x
+        #
+        argout.append((name + "-rev", family, pos, x[::-1], y[::-1]))
+    return argout
+
+
+def modesOf(family):
+    for fam, modes in scananalysis.FAMILIES:
+        if fam == family:
+            return modes
+    return []
+
+
+def main():
+    failures = 0
+    deviations = 0
+    print("%-12s %-9s %9s %9s %9s %6s %6s" %
+          ("scan", "mode", "true", "numpy", "Hasy", "steps", "Hasy"))
+    for name, family, pos, x, y in referenceScans():
+        step = abs(x[1] - x[0])
+        saResult = scananalysis.scanAnalysis(x, y)
+        for mode in modesOf(family) + modesOf(family + "ssa"):
+            message, xpos = scananalysis.modeResult(saResult, mode)[:2]
+            fast = None
+            if hasFastScanAnalysis:
+                res = HasyUtils.fastscananalysis(list(x), list(y), mode)
+                if res[0] == 'success':
+                    fast = res[1]
+            diffFast = float("nan")
+            if message != 'success':
+                diff = float("inf")
+                text = message
+            else:
+                diff = abs(xpos - pos) / step
+                text = "%9.3f" % xpos
+                if fast is not None:
+                    diffFast = abs(xpos - fast) / step
+            limit = ALLOWED[mode]
+            flag = "" if diff <= limit else "  > %g" % limit
+            failures += 0 if diff <= limit else 1
+            deviations += 1 if diffFast > limit else 0
+            print("%-12s %-9s %9.3f %9s %9s %6.2f %6.2f%s" % (
+                name, mode, pos, text,
+                "%9.3f" % fast if fast is not None else "-",
+                diff, diffFast, flag))
+    if hasFastScanAnalysis:
+        print("\n%d differences to fastscananalysis above the limits" %
+              deviations)
+    else:
+        print("\nHasyUtils.fastscananalysis is not available, "
+              "compared with the true positions only")
+    if "--fast" in sys.argv:
+        x, y = referenceScans()[0][3:]
+        modes = [mode for family, lst in scananalysis.FAMILIES for mode in lst]
+        startTime = time.time()
+        for mode in modes:
+            scananalysis.modeResult(scananalysis.scanAnalysis(x, y), mode)
+        print("\nscanAnalysis, %d modes: %.2f ms" %
+              (len(modes), (time.time() - startTime) * 1000.))
+        if hasFastScanAnalysis:
+            startTime = time.time()
+            for mode in modes:
+                HasyUtils.fastscananalysis(list(x), list(y), mode)
+            print("fastscananalysis, %d modes: %.2f ms" %
+                  (len(modes), (time.time() - startTime) * 1000.))
+    print("%d differences to the true positions above the limits" %
+          failures)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,611 @@
+#!/usr/bin/env python
+"""
+In-process NXSRecSelector stand-in for offline benchmarks of
+DESY_general/nxsmacros.py
+
+If PyTango, sardana or taurus cannot be imported, minimal stand-ins are
+registered in sys.modules. FakeSelector is a PyTango.DeviceProxy, so the
+macros take their Tango code paths; every call sleeps for 'latency'
+seconds and is counted in 'calls'.
+
+  selector = FakeSelector(nComponents=200, nDataSources=2000)
+  nxsmacros = loadNxsMacros(selector)
+  mcr = MacroContext()
+  nxsmacros.set_selector(mcr)
+
+or a whole macro, returning its output lines
+
+  lines = runMacro(nxsmacros, "nxsprof", {})
+"""
+
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import types
+import importlib
+
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MACRO_DIR = os.path.join(TOP, "DESY_general")
+SELECTOR_NAME = "p00/nxsrecselector/fake"
+
+
+class FakeDevFailed(Exception):
+    pass
+
+
+class DevError(object):
+    def __init__(self, reason, desc=""):
+        self.reason = reason
+        self.desc = desc
+
+
+def _installStandIns():
+    """
+    registers minimal PyTango, sardana and taurus modules,
+    only for those which are not installed
+    """
+    try:
+        import PyTango  # noqa: F401
+    except ImportError:
+        mod = types.ModuleType("PyTango")
+
+        class DeviceProxy(object):
+            pass
+
+        class DevState(object):
+            ON, RUNNING, FAULT = "ON", "RUNNING", "FAULT"
+
+        class DevSource(object):
+            DEV, CACHE, CACHE_DEV = 0, 1, 2
+
+        class Database(object):
+            def get_device_exported_for_class(self, name):
+                return types.SimpleNamespace(value_string=[SELECTOR_NAME])
+        mod.DeviceProxy = DeviceProxy
+        mod.DevFailed = FakeDevFailed
+        mod.CommunicationFailed = FakeDevFailed
+        mod.DevError = FakeDevFailed
+        mod.Except = FakeDevFailed
+        mod.DevState = DevState
+        mod.DevSource = DevSource
+        mod.Database = Database
+        sys.modules["PyTango"] = mod
+    try:
+        import sardana.macroserver.macro  # noqa: F401
+    except ImportError:
+        macro = types.ModuleType("sardana.macroserver.macro")
+
+        class Macro(object):
+            pass
+
+        class Type(object):
+            String = "String"
+            Integer = "Integer"
+            Float = "Float"
+            Boolean = "Boolean"
+
+        def macroDecorator(*args, **kwargs):
+            return lambda func: func
+        macro.Macro = Macro
+        macro.Type = Type
+        macro.macro = macroDecorator
+        exc = types.ModuleType("sardana.macroserver.msexception")
+
+        class UnknownEnv(Exception):
+            pass
+        exc.UnknownEnv = UnknownEnv
+        for name in ["sardana", "sardana.macroserver"]:
+            sys.modules[name] = types.ModuleType(name)
+        sys.modules["sardana.macroserver.macro"] = macro
+        sys.modules["sardana.macroserver.msexception"] = exc
+    try:
+        import taurus.console  # noqa: F401
+    except ImportError:
+        console = types.ModuleType("taurus.console")
+
+        class Alignment(object):
+            Left, Right, HCenter = 0, 1, 2
+        console.Alignment = Alignment
+        lst = types.ModuleType("taurus.console.list")
+
+        class List(list):
+            def __init__(self, header, **kwargs):
+                list.__init__(self)
+                self.append(header)
+
+            def appendRow(self, row):
+                self.append(row)
+
+            def genOutput(self):
+                return [" ".join([str(v) for v in row]) for row in self]
+        lst.List = List
+        sys.modules["taurus"] = types.ModuleType("taurus")
+        sys.modules["taurus.console"] = console
+        sys.modules["taurus.console.list"] = lst
+
+
+_installStandIns()
+import PyTango  # noqa: E402
+
+
+class DeviceAttribute(object):
+    def __init__(self, name, value, error=None):
+        self.name = name
+        self.value = value
+        self.has_failed = error is not None
+        self.error = error
+
+    def get_err_stack(self):
+        return (self.error,) if self.error is not None else ()
+
+
+class FakeSelector(PyTango.DeviceProxy):
+    """
+    a selector with nComponents detector components, nDataSources
+    datasources and nChannels pool channels
+    """
+
+    attributes = ["MntGrp", "ProfileConfiguration", "UserData",
+                  "AppendEntry", "ConfigDevice", "WriterDevice", "Door",
+                  "DeviceGroups", "Version", "ProfileFile"]
+
+    def __init__(self, nComponents=100, nDataSources=1000, nChannels=100,
+                 latency=0.):
+        self.latency = latency
+        # execution time in s of single commands, e.g. UpdateMntGrp
+        self.commandLatency = {}
+        # Tango devices of the datasources, {device: read latency in s
+        # or the exception raised by read_attribute}
+        self.devices = {}
+        # time in s to open a proxy of a datasource device
+        self.connectLatency = 0.
+        self.connections = 0
+        # attributes that fail to read, {attribute: reason}
+        self.failedAttributes = {}
+        # revision of the configuration server, increased by a store
+        self.configRevision = 1
+        self.calls = {}
+        self.polls = 0
+        self.timeout = 3000
+        self._components = ["cp%05d" % i for i in range(nComponents)]
+        self._datasources = ["ds%05d" % i for i in range(nDataSources)]
+        self._channels = ["exp_t%02d" % (i + 1) for i in range(4)]
+        self._channels.extend(
+            ["exp_c%02d" % (i + 1) for i in range(nChannels)])
+        self._values = {
+            "MntGrp": "mg_fake",
+            "UserData": json.dumps({"title": "fake"}),
+            "AppendEntry": False,
+            "ConfigDevice": "p00/xmlconfigserver/fake",
+            "WriterDevice": "p00/nxsdatawriter/fake",
+            "Door": "p00/door/fake",
+            "DeviceGroups": json.dumps({
+                "counter": ["*exp_c*"], "timer": ["*exp_t*"],
+                "mca": ["*exp_mca*"], "dac": ["*exp_dac*"],
+                "adc": ["*exp_adc*"], "motor": ["*exp_mot*"]}),
+            "Version": "3.10.0",
+            "ProfileFile": "/tmp/mg_fake.json",
+        }
+        self._cnf = {
+            "ComponentSelection": json.dumps(
+                dict((cp, i % 2 == 0)
+                     for i, cp in enumerate(self._components))),
+            "DataSourceSelection": json.dumps(
+                dict((ch, True) for ch in self._channels[4:])),
+            "Timer": json.dumps(["exp_t01"]),
+            "OrderedChannels": json.dumps(self._channels[4:]),
+            "ComponentPreselection": json.dumps({}),
+            "DataSourcePreselection": json.dumps({}),
+            "InitDataSources": json.dumps([]),
+            "UserData": self._values["UserData"],
+            "MntGrp": "mg_fake",
+        }
+        # stored profiles, {name: ProfileConfiguration}
+        self._profiles = {"mg_fake": json.dumps(self._cnf)}
+        # saved profile files, {file name: ProfileConfiguration}
+        self._files = {}
+
+    def _call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def roundTrips(self):
+        return sum(self.calls.values())
+
+    def name(self):
+        return SELECTOR_NAME
+
+    def ping(self):
+        self._call("ping")
+        return int(self.latency * 1e6)
+
+    def set_timeout_millis(self, timeout):
+        self.timeout = timeout
+
+    def get_timeout_millis(self):
+        return self.timeout
+
+    def set_source(self, source):
+        pass
+
+    def state(self):
+        self._call("state")
+        return PyTango.DevState.ON
+
+    def __getattr__(self, name):
+        """ attribute reads by name, case insensitive as in Tango """
+        for attr in self.attributes:
+            if attr.lower() == name.lower():
+                self._call(attr)
+                return self._read(attr)
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        for attr in self.attributes:
+            if attr.lower() == name.lower():
+                self._call("write " + attr)
+                self._write(attr, value)
+                return
+        object.__setattr__(self, name, value)
+
+    def _read(self, attr):
+        if attr == "ProfileConfiguration":
+            return json.dumps(self._cnf)
+        return self._values[attr]
+
+    def _write(self, attr, value):
+        if attr == "ProfileConfiguration":
+            self._cnf = json.loads(value)
+            self._values["UserData"] = self._cnf["UserData"]
+        else:
+            self._values[attr] = value
+
+    def read_attributes(self, names):
+        self._call("read_attributes")
+        argout = []
+        for name in names:
+            attr = [a for a in self.attributes
+                    if a.lower() == name.lower()][0]
+            if attr in self.failedAttributes:
+                argout.append(DeviceAttribute(
+                    name, None, DevError(self.failedAttributes[attr])))
+            else:
+                argout.append(DeviceAttribute(name, self._read(attr)))
+        return argout
+
+    def command_inout(self, name, *args):
+        self._call(name)
+        if self.commandLatency.get(name.lower()):
+            time.sleep(self.commandLatency[name.lower()])
+        return self._execute(name, *args)
+
+    def command_inout_asynch(self, name, *args):
+        """ the command runs in the 'server' while the client goes on """
+        self.calls[name] = self.calls.get(name, 0) + 1
+        latency = self.latency + self.commandLatency.get(name.lower(), 0.)
+        return (time.time() + latency, self._execute(name, *args))
+
+    def command_inout_reply(self, aid, timeout=None):
+        """
+        without timeout the reply is polled, with timeout/ms the
+        client waits for it, 0 waits forever; the reply is
+        delivered locally, it is counted in polls, not in calls
+        """
+        self.polls += 1
+        deadline, result = aid
+        wait = deadline - time.time()
+        if wait > 0:
+            if timeout is None or (timeout and wait > timeout / 1000.):
+                raise FakeDevFailed(DevError("API_AsynReplyNotArrived"))
+            time.sleep(wait)
+        return result
+
+    def _selected(self, key):
+        return [name for name, flag in json.loads(self._cnf[key]).items()
+                if flag]
+
+    def _execute(self, name, *args):
+        name = name.lower()
+        if name == "selectedcomponents":
+            return self._selected("ComponentSelection")
+        if name == "selecteddatasources":
+            return self._selected("DataSourceSelection")
+        if name == "preselectedcomponents":
+            return self._selected("ComponentPreselection")
+        if name == "preselecteddatasources":
+            return self._selected("DataSourcePreselection")
+        if name == "mandatorycomponents":
+            return []
+        if name == "availablecomponents":
+            return list(self._components)
+        if name == "availabledatasources":
+            return list(self._datasources)
+        if name == "availabletimers":
+            return self._channels[:4]
+        if name == "poolelementnames":
+            return list(self._channels)
+        if name == "ismntgrpupdated":
+            return True
+        if name == "componentdescription":
+            return json.dumps(self._componentDescription())
+        if name == "fulldevicenames":
+            return json.dumps(dict(
+                (ch, "tango://fakehost:10000/expchan/fake/%s" % ch)
+                for ch in self._channels))
+        if name == "availableprofiles":
+            return sorted(self._profiles)
+        if name == "storeprofile":
+            self._profiles[self._values["MntGrp"]] = json.dumps(self._cnf)
+        elif name == "fetchprofile":
+            if self._values["MntGrp"] in self._profiles:
+                self._write("ProfileConfiguration",
+                            self._profiles[self._values["MntGrp"]])
+        elif name == "deleteprofile":
+            self._profiles.pop(args[0], None)
+        elif name == "deleteallprofiles":
+            self._profiles.clear()
+        elif name == "saveprofile":
+            self._files[self._values["ProfileFile"]] = json.dumps(self._cnf)
+        elif name == "loadprofile":
+            self._write("ProfileConfiguration",
+                        self._files[self._values["ProfileFile"]])
+        if name == "datasourcedescription":
+            return [json.dumps({
+                "dsname": ds, "dstype": "TANGO",
+                "record": "fakehost:10000/p00/fake/%s/Value" % ds})
+                for ds in args[0] if ds in self._datasources]
+        return None
+
+    def _componentDescription(self):
+        """ three datasources per component, in two groups """
+        groups = [{}, {}]
+        for i, cp in enumerate(self._components):
+            groups[i % 2][cp] = dict(
+                (self._datasources[(3 * i + j) % len(self._datasources)],
+                 [["STEP", "TANGO", "fakehost:10000/p00/fake/%s/Value"
+                   % self._datasources[(3 * i + j) % len(self._datasources)],
+                   "NX_FLOAT64", []]])
+                for j in range(3))
+        return groups
+
+    #
+    # Tango commands are exposed as methods of the proxy
+    #
+    def selectedComponents(self):
+        return self.command_inout("SelectedComponents")
+
+    def selectedDataSources(self):
+        return self.command_inout("SelectedDataSources")
+
+    def preselectedComponents(self):
+        return self.command_inout("PreselectedComponents")
+
+    def preselectedDataSources(self):
+        return self.command_inout("PreselectedDataSources")
+
+    def mandatoryComponents(self):
+        return self.command_inout("MandatoryComponents")
+
+    def availableComponents(self):
+        return self.command_inout("AvailableComponents")
+
+    def availableDataSources(self):
+        return self.command_inout("AvailableDataSources")
+
+    def availableTimers(self):
+        return self.command_inout("AvailableTimers")
+
+    def poolElementNames(self, name):
+        return self.command_inout("PoolElementNames", name)
+
+    def isMntGrpUpdated(self):
+        return self.command_inout("IsMntGrpUpdated")
+
+    def updateMntGrp(self):
+        return self.command_inout("UpdateMntGrp")
+
+    def importMntGrp(self):
+        return self.command_inout("ImportMntGrp")
+
+    def fetchProfile(self):
+        return self.command_inout("FetchProfile")
+
+    def storeProfile(self):
+        return self.command_inout("StoreProfile")
+
+    def preselectComponents(self):
+        return self.command_inout("PreselectComponents")
+
+    def resetPreselectedComponents(self):
+        return self.command_inout("ResetPreselectedComponents")
+
+    def exportEnvProfile(self):
+        return self.command_inout("ExportEnvProfile")
+
+    def availableProfiles(self):
+        return self.command_inout("AvailableProfiles")
+
+    def deleteProfile(self, name):
+        return self.command_inout("DeleteProfile", name)
+
+    def deleteAllProfiles(self):
+        return self.command_inout("DeleteAllProfiles")
+
+    def saveProfile(self):
+        return self.command_inout("SaveProfile")
+
+    def loadProfile(self):
+        return self.command_inout("LoadProfile")
+
+    def DataSourceDescription(self, names):
+        return self.command_inout("DataSourceDescription", names)
+
+
+class SelectorView(object):
+    """ another proxy of the selector with its own timeout """
+
+    def __init__(self, selector):
+        self.__dict__["selector"] = selector
+        self.__dict__["timeout"] = selector.timeout
+
+    def set_timeout_millis(self, timeout):
+        self.__dict__["timeout"] = timeout
+
+    def get_timeout_millis(self):
+        return self.timeout
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.selector, name, value)
+
+
+class FakeConfigServer(object):
+    """ the configuration server of the selector """
+
+    def __init__(self, selector):
+        self.selector = selector
+
+    @property
+    def Version(self):
+        self.selector._call("ConfigServer.Version")
+        return "2.25.0.%d" % self.selector.configRevision
+
+    def Selections(self, names):
+        """ the profiles stored by storeProfile """
+        self.selector._call("ConfigServer.Selections")
+        return [self.selector._profiles.get(name, "") for name in names]
+
+
+class FakeDevice(object):
+    """ a Tango device of a datasource, see FakeSelector.devices """
+
+    def __init__(self, name, behaviour):
+        self.name = name
+        self.behaviour = behaviour
+        self.timeout = 3000
+
+    def set_timeout_millis(self, timeout):
+        self.timeout = timeout
+
+    def read_attribute(self, name):
+        if isinstance(self.behaviour, Exception):
+            raise self.behaviour
+        if self.behaviour * 1000 > self.timeout:
+            time.sleep(self.timeout / 1000.)
+            raise FakeDevFailed("API_DeviceTimedOut")
+        time.sleep(self.behaviour)
+        return DeviceAttribute(name, 0.)
+
+
+class MacroContext(object):
+    """ the part of the Macro API used by the nxs macros """
+
+    def __init__(self, env=None):
+        self.env = env if env is not None else {}
+        self.env.setdefault("NeXusSelectorDevice", SELECTOR_NAME)
+        self.lines = []
+        self.module = None
+
+    def __getattr__(self, name):
+        """ macros of the loaded module, e.g. self.nxsimportmg() """
+        module = self.__dict__.get("module")
+        if module is None or not callable(getattr(module, name, None)):
+            raise AttributeError(name)
+        return lambda *args: self.lines.extend(
+            runMacro(module, name, self.env, *args))
+
+    def getEnv(self, key):
+        if key not in self.env:
+            raise sys.modules["sardana.macroserver.msexception"].UnknownEnv(
+                key)
+        return self.env[key]
+
+    def setEnv(self, key, value):
+        self.env[key] = value
+
+    def unsetEnv(self, key):
+        self.env.pop(key, None)
+
+    def getDoorName(self):
+        return "p00/door/fake"
+
+    def output(self, msg, *args):
+        self.lines.append(msg % args if args else str(msg))
+
+    info = warning = error = output
+
+    def debug(self, msg, *args):
+        pass
+
+
+def runMacro(module, name, env, *args):
+    """
+    executes the macro 'name' of the nxsmacros module with the
+    environment dictionary env, returns the output lines
+    """
+    macroObj = getattr(module, name)
+    if isinstance(macroObj, type):
+        cls = type(name, (MacroContext, macroObj), {})
+    else:
+        cls = type(name, (MacroContext,), {"run": macroObj})
+    macro = cls(env)
+    macro.module = module
+    macro.run(*args)
+    return macro.lines
+
+
+def loadNxsMacros(selector):
+    """
+    returns the nxsmacros module with PyTango.DeviceProxy(name)
+    resolved to the given selector
+    """
+    if MACRO_DIR not in sys.path:
+        sys.path.insert(0, MACRO_DIR)
+    module = importlib.import_module("nxsmacros")
+    module.PyTango = types.SimpleNamespace(**dict(
+        (name, getattr(PyTango, name)) for name in dir(PyTango)
+        if not name.startswith("__")))
+    module.PyTango.DeviceProxy = _proxyFactory(PyTango.DeviceProxy, selector)
+    # the caches of the module refer to the previous selector
+    for name in ["SelectorProxies", "ExportedSelectors", "SyncedProfiles",
+                 "NameIndex", "GroupPatterns", "ComponentIndex",
+                 "PhaseTimings", "UserDataFiles", "StagedUserData",
+                 "LongCommandProxies", "ConfigProxies"]:
+        cache = getattr(module, name, None)
+        if isinstance(cache, list):
+            del cache[:]
+        elif cache is not None:
+            cache.clear()
+    return module
+
+
+def _proxyFactory(proxyClass, selector):
+    """
+    a DeviceProxy replacement that returns the selector
+    and still works with isinstance()
+    """
+    opened = []
+
+    class Meta(type):
+        def __instancecheck__(cls, obj):
+            return isinstance(obj, proxyClass) or \
+                isinstance(obj, SelectorView)
+
+        def __call__(cls, name):
+            if name in selector.devices:
+                selector.connections += 1
+                time.sleep(selector.connectLatency)
+                return FakeDevice(name, selector.devices[name])
+            if name == selector._values["ConfigDevice"]:
+                return FakeConfigServer(selector)
+            # further proxies of the selector have their own timeout
+            if opened:
+                return SelectorView(selector)
+            opened.append(name)
+            return selector
+    return Meta("DeviceProxy", (object,), {})
@@ -0,0 +1,174 @@
+"""
+NumPy scan analysis of all mvsa modes in one pass, used by
+bench_scananalysis.py only
+
+mvsa and createSaDct keep HasyUtils.fastscananalysis(): the positions
+found here are close to the true positions of the reference scans, but
+differ from fastscananalysis() for cms (all points above the offset
+there, the points above 1/3 here) and for the slit family, see
+bench_scananalysis.py.
+"""
+
+import numpy as np
+
+#
+# family -> modes, the modes return the peak position, the centre of
+# mass and the centre of the FWHM of the signal of the family.
+# the '*ssa' modes analyse the background subtracted signal
+#
+FAMILIES = [ ( 'peak', [ 'peak', 'cms', 'cen']),
+             ( 'dip', [ 'dip', 'dipm', 'dipc']),
+             ( 'slit', [ 'slit', 'slitm', 'slitc']),
+             ( 'step', [ 'step', 'stepm', 'stepc'])]
+FAMILIES = FAMILIES + [ ( family + 'ssa', [ mode + 'ssa' for mode in modes])
+                        for family, modes in FAMILIES]
+
+#
+# the reason codes of the 'ssa' dictionary, a subset of those of
+# HasyUtils.ssa(), 2, 4, 5 and 7 are not returned
+#
+SSA_REASONS = { 0: 'success',
+                1: 'np < 6',
+                3: 'no y > 0 after BG-substraction',
+                6: 'max at the border of the x-interval'}
+
+def scanAnalysis( x, y):
+    """
+    analyses the data for all modes in one pass, the signals of the
+    families are the rows of one array:
+      peak   y
+      dip    yMax - y
+      slit   y, the peak position is the middle between the edges
+      step   dy/dx, the sign is chosen such that the step is positive,
+             for increasing and decreasing x
+      *ssa   the signals above minus a linear background through the
+             mean of the first and the last points
+    points with a non-finite x or y (NaN, inf) are ignored.
+
+    Returns a dictionary
+      'message'  : { family: 'success' or the reason of the failure}
+      'npSig'    : { family: no. of pts with y >= 1/3*( yMax - yMin) + yMin}
+      'xpos'     : { mode: position}, only for successful families
+      'ssa'      : the keys of HasyUtils.ssa() for the peakssa family,
+                   status, reason, reasonString, peak_x, cms, midpoint,
+                   l_back, r_back; reason is one of SSA_REASONS
+    """
+    x = np.asarray( x, dtype=float)
+    y = np.asarray( y, dtype=float)
+    result = { 'message': {}, 'npSig': {}, 'xpos': {},
+               'ssa': { 'status': 0, 'reason': 1, 'reasonString': SSA_REASONS[1],
+                        'peak_x': 0., 'cms': 0., 'midpoint': 0.,
+                        'l_back': 0., 'r_back': 0.}}
+    if len( x) == len( y):
+        #
+        # argmax() and the sums would return NaN positions
+        #
+        finite = np.isfinite( x) & np.isfinite( y)
+        x = x[ finite]
+        y = y[ finite]
+    npt = len( x)
+    if npt != len( y) or npt < 6:
+        for family, modes in FAMILIES:
+            result[ 'message'][ family] = "too few points (%d, %d)" % ( npt, len( y))
+            result[ 'npSig'][ family] = 0
+        return result
+
+    dx = np.gradient( x)
+    dx = np.where( dx != 0., dx, np.inf)
+    deriv = np.gradient( y) / dx
+    #
+    # dy/dx is negative for a falling step, whatever the direction of x
+    #
+    if ( y[-1] - y[0]) * ( x[-1] - x[0]) < 0.:
+        deriv = -deriv
+    sig = np.vstack( [ y, y.max() - y, y, deriv])
+    nBack = max( 1, min( 3, npt // 10))
+    lBack = sig[ :, :nBack].mean( axis=1)
+    rBack = sig[ :, -nBack:].mean( axis=1)
+    frac = ( x - x[0]) / ( x[-1] - x[0]) if x[-1] != x[0] else np.zeros( npt)
+    back = lBack[ :, None] + ( rBack - lBack)[ :, None] * frac[ None, :]
+    sig = np.vstack( [ sig, sig - back])
+    rows = np.arange( len( sig))
+    #
+    # peak, centre of mass of the points above 1/3 of the signal
+    #
+    yMin = sig.min( axis=1)
+    yMax = sig.max( axis=1)
+    span = yMax - yMin
+    above = sig >= ( yMin + span / 3.)[ :, None]
+    npSig = above.sum( axis=1)
+    iPeak = sig.argmax( axis=1)
+    xPeak = x[ iPeak]
+    weight = np.where( above, sig - yMin[ :, None], 0.)
+    wSum = weight.sum( axis=1)
+    xCms = ( weight * x).sum( axis=1) / np.where( wSum > 0., wSum, 1.)
+    #
+    # centre of the FWHM, linear interpolation at the half maximum
+    #
+    half = yMin + span / 2.
+    below = sig < half[ :, None]
+    idx = np.arange( npt)
+    left = np.where( below & ( idx < iPeak[ :, None]), idx, -1).max( axis=1)
+    right = np.where( below & ( idx > iPeak[ :, None]), idx, npt).min( axis=1)
+    lc = np.clip( left, 0, npt - 2)
+    rc = np.clip( right, 1, npt - 1)
+    dl = sig[ rows, lc + 1] - sig[ rows, lc]
+    dr = sig[ rows, rc] - sig[ rows, rc - 1]
+    slopeLeft = ( x[ lc + 1] - x[ lc]) / np.where( dl != 0., dl, 1.)
+    slopeRight = ( x[ rc] - x[ rc - 1]) / np.where( dr != 0., dr, 1.)
+    xLeft = np.where( left >= 0, x[ lc] + ( half - sig[ rows, lc]) * slopeLeft, x[0])
+    xRight = np.where( right < npt, x[ rc - 1] + ( half - sig[ rows, rc - 1]) * slopeRight, x[-1])
+    xCen = ( xLeft + xRight) / 2.
+    #
+    # slit: the middle between the rising and the falling edge
+    #
+    edges = np.gradient( sig[ [ 2, 6]], axis=1) / dx
+    xPeak[ [ 2, 6]] = ( x[ edges.argmax( axis=1)] + x[ edges.argmin( axis=1)]) / 2.
+
+    reasons = {}
+    for row, ( family, modes) in enumerate( FAMILIES):
+        result[ 'npSig'][ family] = int( npSig[ row])
+        if span[ row] <= 0.:
+            message = "no signal, the data are constant"
+            reasons[ family] = 3
+        elif yMax[ row] <= 0. and row >= 4:
+            message = "no signal above the background"
+            reasons[ family] = 3
+        elif iPeak[ row] in ( 0, npt - 1):
+            message = "the maximum is at the border of the scan"
+            reasons[ family] = 6
+        else:
+            message = 'success'
+            reasons[ family] = 0
+        result[ 'message'][ family] = message
+        if message == 'success':
+            for mode, value in zip( modes, [ xPeak[ row], xCms[ row], xCen[ row]]):
+                result[ 'xpos'][ mode] = float( value)
+
+    reason = reasons[ 'peakssa']
+    result[ 'ssa'] = { 'status': 1 if reason == 0 else 0, 'reason': reason,
+                       'reasonString': SSA_REASONS[ reason],
+                       'peak_x': float( xPeak[4]), 'cms': float( xCms[4]),
+                       'midpoint': float( xCen[4]),
+                       'l_back': float( lBack[0]), 'r_back': float( rBack[0])}
+    return result
+
+def modeResult( saResult, mode):
+    """
+    returns ( message, xpos, xpeak, xcms, xcen, npSig) of a mode
+    from the results of scanAnalysis(), as HasyUtils.fastscananalysis()
+    """
+    mode = mode.lower()
+    if mode == 'show':
+        mode = 'peak'
+    for family, modes in FAMILIES:
+        if mode in modes:
+            break
+    else:
+        return "mode %s not supported" % mode, None, None, None, None, 0
+    message = saResult[ 'message'][ family]
+    npSig = saResult[ 'npSig'][ family]
+    if message != 'success':
+        return message, None, None, None, None, npSig
+    xpeak, xcms, xcen = [ saResult[ 'xpos'][ name] for name in modes]
+    return message, saResult[ 'xpos'][ mode], xpeak, xcms, xcen, npSig
@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+"""
+Simulated Pool for offline benchmarks of DESY_general/mg_macros.py
+
+If PyTango, HasyUtils, sardana or taurus cannot be imported, minimal
+stand-ins are registered in sys.modules, so the macro module can be
+loaded on a workstation without Tango. DeviceProxy is resolved against
+a registry of simulated devices.
+
+  pool = SimPool(nChannels=900)
+  mg_macros = loadMgMacros(pool)
+  conf = mg_macros.MgConf(pool.name, 'mg_bench', True)
+
+The latency of the Tango calls is set per kind of call:
+
+  latency['read'] = 0.002
+
+Macros are executed in a simulated MacroServer context:
+
+  out = runMacro(mg_macros.change_mg, [pool], {'ActiveMntGrp': 'mg1'},
+                 [['-g', 'mg1'], ['-t', 'exp_t01']])
+"""
+
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import types
+import importlib
+
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MACRO_DIR = os.path.join(TOP, "DESY_general")
+TANGO_HOST = "simhost:10000"
+
+#
+# name -> simulated device, used by DeviceProxy
+#
+registry = {}
+
+#
+# the schema flag returned by HasyUtils.versionSardanaNewMg()
+#
+newMg = [True]
+
+#
+# simulated latency/s per call:
+#   read     pool attributes, e.g. ExpChannelList
+#   command  pool commands, e.g. CreateElement
+#   connect  DeviceProxy()
+#
+latency = {'read': 0., 'command': 0., 'connect': 0.}
+
+
+def _delay(kind):
+    if latency[kind] > 0:
+        time.sleep(latency[kind])
+
+
+class SimDevFailed(Exception):
+    pass
+
+
+class DevState(object):
+    ON, OFF, MOVING, RUNNING, FAULT, ALARM, UNKNOWN = \
+        "ON", "OFF", "MOVING", "RUNNING", "FAULT", "ALARM", "UNKNOWN"
+
+
+class SimDevice(object):
+    """ state, status and timeout of a simulated device """
+
+    stateValue = DevState.ON
+    timeout = 3000
+
+    def set_timeout_millis(self, timeout):
+        self.timeout = timeout
+
+    def get_timeout_millis(self):
+        return self.timeout
+
+    def state(self):
+        return self.stateValue
+
+    def status(self):
+        return "The device is in %s state" % self.stateValue
+
+
+class SimChannel(SimDevice):
+    """ an experimental channel, MCAs have a DataLength """
+
+    def __init__(self, name, dataLength=2048):
+        self.name = name
+        self.TangoDevice = "sim/tango/%s" % name
+        self.DataLength = dataLength
+        self.Value = 0.
+        self.Shape = [1024, 512]
+
+    def read_attribute(self, name):
+        return types.SimpleNamespace(value=getattr(self, name.capitalize()))
+
+
+class SimMg(SimDevice):
+    """
+    a measurement group with a Configuration attribute,
+    writeLatency simulates the reconfiguration by the pool
+    """
+
+    writeLatency = 0.
+
+    def __init__(self, name, elements):
+        self.name = name
+        self.ElementList = list(elements)
+        self.writes = 0
+        self._configuration = json.dumps({
+            u'controllers': {}, u'label': name,
+            u'description': "Measurement Group"})
+
+    @property
+    def Configuration(self):
+        return self._configuration
+
+    @Configuration.setter
+    def Configuration(self, value):
+        self.writes += 1
+        time.sleep(self.writeLatency)
+        self._configuration = value
+
+
+class SimPool(object):
+    """
+    a pool with nChannels counters, spread over controllers with
+    32 channels each, plus timers exp_t01.. and MCAs exp_mca01..
+    """
+
+    def __init__(self, nChannels=100, nTimers=4, nMcas=4,
+                 name="pool/sim/01"):
+        self.name = name
+        self.reads = 0
+        self.commands = 0
+        self.mgs = {}
+        self._exp = []
+        self._acq = []
+        self._ctrls = []
+        for i in range(nTimers):
+            self._addChannel("exp_t%02d" % (i + 1), "dgg2ctrl", i + 1,
+                             "CTExpChannel")
+        for i in range(nChannels):
+            self._addChannel("exp_c%02d" % (i + 1),
+                             "sis3820_%02d" % (i // 32), i % 32 + 1,
+                             "CTExpChannel")
+        for i in range(nMcas):
+            self._addChannel("exp_mca%02d" % (i + 1), "mcactrl", i + 1,
+                             "OneDExpChannel")
+        registry[name] = self
+
+    def _addController(self, ctrlName):
+        fullName = "%s/controller/simctrl/%s" % (TANGO_HOST, ctrlName)
+        if ctrlName not in [json.loads(c)['name'] for c in self._ctrls]:
+            self._ctrls.append(json.dumps(
+                {'name': ctrlName, 'full_name': fullName}))
+        return fullName
+
+    def _addChannel(self, name, ctrlName, axis, typ):
+        ctrlFullName = self._addController(ctrlName)
+        fullName = "%s/expchan/%s/%d" % (TANGO_HOST, ctrlName, axis)
+        self._exp.append(json.dumps(
+            {'name': name, 'controller': ctrlFullName,
+             'full_name': fullName, 'axis': axis, 'type': typ,
+             'source': fullName + "/value"}))
+        self._acq.append(json.dumps(
+            {'name': name, 'full_name': fullName + "/value", 'type': typ}))
+        chan = SimChannel(name)
+        registry[name] = registry[fullName] = chan
+        registry[chan.TangoDevice] = chan
+
+    def _read(self):
+        self.reads += 1
+        _delay('read')
+
+    def _command(self):
+        self.commands += 1
+        _delay('command')
+
+    @property
+    def ExpChannelList(self):
+        self._read()
+        return list(self._exp)
+
+    @property
+    def AcqChannelList(self):
+        self._read()
+        return list(self._acq)
+
+    @property
+    def ControllerList(self):
+        self._read()
+        return list(self._ctrls)
+
+    def command_inout(self, cmd, argin=None):
+        return getattr(self, cmd)(argin)
+
+    def CreateController(self, lst):
+        """ [type, library, class, alias, properties...] """
+        self._command()
+        self._addController(lst[3])
+
+    def CreateElement(self, lst):
+        """ [type, controller alias, axis, name] """
+        self._command()
+        self._addChannel(lst[3], lst[1], int(lst[2]), lst[0])
+
+    @property
+    def MeasurementGroupList(self):
+        self._read()
+        return [json.dumps({'name': name, 'pool': self.name})
+                for name in self.mgs]
+
+    def CreateMeasurementGroup(self, lst):
+        self._command()
+        mg = SimMg(lst[0], lst[1:])
+        self.mgs[lst[0]] = mg
+        registry[lst[0]] = mg
+
+    def DeleteElement(self, name):
+        self._command()
+        self.mgs.pop(name)
+        registry.pop(name, None)
+
+
+class Database(object):
+    def get_alias(self, name):
+        return name
+
+
+def DeviceProxy(name):
+    name = str(name)
+    _delay('connect')
+    if name in registry:
+        return registry[name]
+    raise SimDevFailed("no device %s" % name)
+
+
+def _installStandIns():
+    """
+    registers minimal PyTango, HasyUtils, sardana and taurus modules,
+    only for those which are not installed
+    """
+    try:
+        import PyTango  # noqa: F401
+    except ImportError:
+        mod = types.ModuleType("PyTango")
+        mod.DeviceProxy = DeviceProxy
+        mod.DevFailed = SimDevFailed
+        mod.CommunicationFailed = SimDevFailed
+        mod.DevState = DevState
+        mod.Database = Database
+
+        class Except(object):
+            @staticmethod
+            def print_exception(e):
+                print(e)
+
+            @staticmethod
+            def re_throw_exception(e, *args):
+                raise e
+        mod.Except = Except
+        sys.modules["PyTango"] = mod
+    try:
+        import HasyUtils  # noqa: F401
+    except ImportError:
+        mod = types.ModuleType("HasyUtils")
+        mod.versionSardanaNewMg = lambda: newMg[0]
+        mod.getActiveMntGrpStatus = lambda: []
+        mod.getLocalMgNames = lambda: []
+        sys.modules["HasyUtils"] = mod
+    try:
+        import sardana.macroserver.macro  # noqa: F401
+    except ImportError:
+        macro = types.ModuleType("sardana.macroserver.macro")
+
+        class Macro(object):
+            pass
+
+        class Type(object):
+            String = "String"
+            Integer = "Integer"
+            Float = "Float"
+            Boolean = "Boolean"
+            MeasurementGroup = "MeasurementGroup"
+        macro.Macro = Macro
+        macro.Type = Type
+        for name in ["sardana", "sardana.macroserver"]:
+            sys.modules[name] = types.ModuleType(name)
+        sys.modules["sardana.macroserver.macro"] = macro
+    try:
+        import taurus.console  # noqa: F401
+    except ImportError:
+        console = types.ModuleType("taurus.console")
+
+        class Alignment(object):
+            Left, Right, HCenter = 0, 1, 2
+        console.Alignment = Alignment
+        lst = types.ModuleType("taurus.console.list")
+
+        class List(list):
+            def __init__(self, header, **kwargs):
+                list.__init__(self)
+                self.append(header)
+
+            def appendRow(self, row):
+                self.append(row)
+
+            def genOutput(self):
+                return [" ".join([str(v) for v in row]) for row in self]
+        lst.List = List
+        sys.modules["taurus"] = types.ModuleType("taurus")
+        sys.modules["taurus"].Device = DeviceProxy
+        sys.modules["taurus.console"] = console
+        sys.modules["taurus.console.list"] = lst
+
+
+def loadMgMacros(pool=None):
+    """
+    returns the mg_macros module with DeviceProxy resolved
+    against the simulated devices
+    """
+    _installStandIns()
+    os.environ.setdefault("TANGO_HOST", TANGO_HOST)
+    if MACRO_DIR not in sys.path:
+        sys.path.insert(0, MACRO_DIR)
+    module = importlib.import_module("mg_macros")
+    module.DeviceProxy = DeviceProxy
+    module.Database = Database
+    return module
+
+
+class MacroContext(object):
+    """
+    the part of the MacroServer API used by the MG macros,
+    mixed into a macro class by runMacro()
+    """
+
+    def __init__(self, pools, env):
+        self.pools = pools
+        self.env = env
+        self.lines = []
+
+    def getPools(self):
+        return list(self.pools)
+
+    def findObjs(self, name, type_class=None):
+        return [name for pool in self.pools if name in pool.mgs]
+
+    def getEnv(self, key):
+        if key not in self.env:
+            raise KeyError("no environment variable %s" % key)
+        return self.env[key]
+
+    def setEnv(self, key, value):
+        self.env[key] = value
+
+    def unsetEnv(self, key):
+        self.env.pop(key, None)
+
+    def output(self, msg, *args):
+        self.lines.append(msg % args if args else str(msg))
+
+    info = warning = output
+
+    def debug(self, msg, *args):
+        pass
+
+
+def runMacro(macroClass, pools, env, *args):
+    """
+    executes macroClass.run(*args) with the pools and the
+    environment dictionary env, returns the output lines
+    """
+    cls = type(macroClass.__name__, (MacroContext, macroClass), {})
+    macro = cls(pools, env)
+    macro.run(*args)
+    return macro.lines